@@ -0,0 +1,102 @@
+import io
+import threading
+
+# Header image shown by both apps
+HEADER_IMAGE_PATH = "ai.webp"
+
+# Storage options offered by the apps (new_app.py offers the first eight)
+MEMORY_OPTIONS = ['128GB SSD', '128GB Flash Storage', '256GB SSD', '512GB SSD', '500GB HDD', '256GB Flash Storage',
+                  '1TB HDD', '128GB SSD + 1TB HDD', '64GB Flash Storage', '32GB Flash Storage',
+                  '256GB SSD + 256GB SSD', '256GB SSD + 1TB HDD', '256GB SSD + 2TB HDD', '1TB SSD', '2TB HDD',
+                  '512GB SSD + 1TB HDD']
+
+# Laptop care and usage tips per brand, shown under a prediction
+CARE_TIPS = {
+    "Apple": [
+        "📱 Always use a soft microfiber cloth to clean your MacBook screen and keyboard.",
+        "🔒 Regularly back up your data with Time Machine or iCloud.",
+        "🌡️ Avoid exposing your MacBook to extreme temperatures to preserve battery life."
+    ],
+    "HP": [
+        "🌀 Keep the laptop vents clear to prevent overheating.",
+        "🔄 Regularly update your HP software to ensure better performance.",
+        "❄️ Use an HP recommended laptop cooler for extended use to maintain optimal performance."
+    ],
+    "Acer": [
+        "💡 Use Acer’s built-in care tools for battery health management.",
+        "🧹 Clean the keyboard and screen with a soft cloth regularly.",
+        "⚖️ Avoid putting heavy pressure on your Acer laptop to prevent screen damage."
+    ],
+    "Asus": [
+        "🔧 Ensure your Asus laptop runs its regular diagnostics for better performance.",
+        "🧹 Regularly clean the fans to avoid dust buildup and overheating.",
+        "🔋 Adjust screen brightness to save battery when not plugged in."
+    ],
+    "Dell": [
+        "🔋 Use Dell's Power Manager to improve battery life.",
+        "🌬️ Keep your Dell laptop in a well-ventilated area to prevent heating.",
+        "🔄 Make use of Dell SupportAssist for updates and maintenance."
+    ],
+    "Lenovo": [
+        "🔧 Use Lenovo Vantage for driver and software updates.",
+        "🔋 Periodically check your Lenovo laptop's battery health.",
+        "🧹 Keep your laptop's cooling vents clean to avoid overheating."
+    ],
+    "Chuwi": [
+        "🧹 Clean the device gently with a soft cloth.",
+        "🛠️ Update Chuwi drivers for optimal performance.",
+        "🌬️ Ensure proper ventilation to prevent overheating during long usage."
+    ],
+    "MSI": [
+        "⚙️ Use MSI Dragon Center to adjust performance settings for gaming.",
+        "🧹 Regularly clean your laptop’s fans to prevent overheating.",
+        "❄️ Use a cooling pad for better thermal performance when gaming."
+    ],
+    "Microsoft": [
+        "🔄 Use Windows Update to keep your Surface running smoothly.",
+        "🔋 Always charge your Microsoft laptop when the battery goes below 20%.",
+        "🧼 Clean the Surface screen using a microfiber cloth to prevent scratches."
+    ],
+    "Toshiba": [
+        "🖥️ Ensure you have updated your Toshiba laptop drivers.",
+        "💧 Do not expose the laptop to moisture or extreme temperatures.",
+        "🔋 Use Toshiba's eco-mode to extend battery life."
+    ]
+}
+
+# new_app.py's tips differ for Toshiba
+NEW_APP_CARE_TIPS = {
+    **CARE_TIPS,
+    "Toshiba": [
+        "🖥️ Use Toshiba PC Health Monitor to keep your laptop in good health.",
+        "🔒 Regularly back up data using Toshiba's backup software.",
+        "❄️ Keep the laptop cool using a cooling pad or by elevating the rear."
+    ]
+}
+
+_images = {}
+_lock = threading.Lock()
+
+
+# An image shrunk to the width it is displayed at and encoded as JPEG, once per
+# process. st.image passes JPEG bytes that already fit through untouched;
+# given the 1024px WebP it decodes, resizes and re-encodes it on every rerun.
+def load_image(path=HEADER_IMAGE_PATH, width=None):
+    key = (path, width)
+    image = _images.get(key)
+    if image is not None:
+        return image
+    with _lock:
+        if key not in _images:
+            from PIL import Image
+
+            with Image.open(path) as picture:
+                picture = picture.convert('RGB')
+                if width and picture.width > width:
+                    picture = picture.resize((width, round(picture.height * width / picture.width)),
+                                             Image.LANCZOS)
+                output = io.BytesIO()
+                # Same quality Streamlit uses when it converts images itself
+                picture.save(output, format='JPEG', quality=90)
+            _images[key] = output.getvalue()
+        return _images[key]
@@ -0,0 +1,254 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from encoder import DATA_PATH, ENCODER_PATH, FeatureEncoder
+from feature_store import load_features
+from model_store import BACKEND, MODEL_PATH, backend_path, read_model, write_json
+from prediction_log import LOG_ENV as PREDICTION_LOG_ENV, load_log
+from pricing import predict_frame
+
+RESULTS_PATH = "benchmark_results.json"
+BASELINE_PATH = "benchmark_baseline.json"
+
+# A result regresses when it is this much worse (relative) than the baseline
+DEFAULT_THRESHOLD = 0.25
+DEFAULT_REPEATS = 200
+BATCH_SIZES = [1, 10, 100, 1_000, 10_000]
+APPS = ['laptop_app.py', 'new_app.py']
+
+# Runs an app script top to bottom in a fresh interpreter (Streamlit's bare
+# mode, no browser) and prints how long that took
+_IMPORT_SCRIPT = """
+import logging, runpy, sys, time, warnings
+warnings.simplefilter('ignore')
+logging.disable(logging.WARNING)
+start = time.perf_counter()
+runpy.run_path(sys.argv[1])
+print(time.perf_counter() - start)
+"""
+
+
+# Fastest of several timed calls. The minimum is the least disturbed by other
+# work on the machine, so it is the most stable figure to compare runs with.
+def _best_ms(fn, repeats):
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def _result(value, unit, better='lower'):
+    return {'value': value, 'unit': unit, 'better': better}
+
+
+# App inputs built from the cleaned rows of laptop.csv (decoded from the
+# feature store), keyed like input_data
+def benchmark_records(data_path=DATA_PATH):
+    X, _, encoder = load_features(data_path)
+    return encoder.decode(X).to_dict('records')
+
+
+# Cold load of the served model file, including the warm-up prediction
+def bench_model_load(model_path, repeats):
+    path = backend_path(model_path)
+    return {'model_load_ms': _result(_best_ms(lambda: read_model(path), repeats), 'ms')}
+
+
+def bench_app_imports(apps, repeats):
+    results = {}
+    for app in apps:
+        timings = [
+            float(subprocess.run([sys.executable, '-c', _IMPORT_SCRIPT, app], capture_output=True, text=True,
+                                 check=True).stdout.split()[-1])
+            for _ in range(repeats)
+        ]
+        results[f"import_{os.path.splitext(app)[0]}_ms"] = _result(min(timings) * 1000, 'ms')
+    return results
+
+
+# Server CPU time of one full rerun of each app (pressing Predict), through
+# Streamlit's AppTest without a browser. A running server compiles the script
+# once, but AppTest recompiles it on every run, so compiled scripts are reused
+# here to leave only the app's own work. The apps' prediction logs go to a
+# scratch directory instead of logs/.
+def bench_app_reruns(apps, repeats):
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    from streamlit.testing.v1 import AppTest
+
+    compiled = {}
+    get_bytecode = ScriptCache.get_bytecode
+
+    def cached_bytecode(self, script_path):
+        if script_path not in compiled:
+            compiled[script_path] = get_bytecode(self, script_path)
+        return compiled[script_path]
+
+    results = {}
+    log_dir = tempfile.TemporaryDirectory()
+    log_env = os.environ.get(PREDICTION_LOG_ENV)
+    os.environ[PREDICTION_LOG_ENV] = log_dir.name
+    ScriptCache.get_bytecode = cached_bytecode
+    try:
+        for app in apps:
+            test = AppTest.from_file(os.path.abspath(app), default_timeout=60).run()
+            best = float('inf')
+            for _ in range(repeats):
+                button = next(button for button in test.button if 'Predict' in button.label)
+                start = time.process_time()
+                button.click().run()
+                best = min(best, time.process_time() - start)
+            results[f"rerun_{os.path.splitext(app)[0]}_cpu_ms"] = _result(best * 1000, 'ms')
+    finally:
+        ScriptCache.get_bytecode = get_bytecode
+        for app in apps:
+            load_log(os.path.splitext(app)[0]).close()
+        if log_env is None:
+            os.environ.pop(PREDICTION_LOG_ENV)
+        else:
+            os.environ[PREDICTION_LOG_ENV] = log_env
+        log_dir.cleanup()
+    return results
+
+
+# predict_price split into its two stages: encoding the input_data dict and
+# scoring the row. A fresh encoder is used so the encode figure includes
+# first-time lookups as well as memoized ones.
+def bench_predict_price(model, encoder_path, records, repeats):
+    encoder = FeatureEncoder.load(encoder_path)
+    records = [records[i % len(records)] for i in range(repeats)]
+    rows = iter(records)
+    encode_ms = _best_ms(lambda: encoder.encode_record(next(rows)), repeats)
+    features = [encoder.encode_record(record)[0] for record in records]
+    rows = iter(features)
+    predict_ms = _best_ms(lambda: model.predict(next(rows)), repeats)
+    results = {
+        'predict_price_encode_ms': _result(encode_ms, 'ms'),
+        'predict_price_predict_ms': _result(predict_ms, 'ms'),
+        'predict_price_total_ms': _result(encode_ms + predict_ms, 'ms'),
+    }
+    # Uncached price breakdown (the explain=True path) in place of the predict call
+    if hasattr(model, 'contributions'):
+        rows = iter(features)
+        results['predict_price_explain_ms'] = _result(_best_ms(lambda: model.contributions(next(rows)), repeats), 'ms')
+    return results
+
+
+# Rows per second through predict_frame (encode + predict) at each batch size
+def bench_batches(model, records, sizes, repeats):
+    results = {}
+    for size in sizes:
+        frame = pd.DataFrame([records[i % len(records)] for i in range(size)])
+        # Keep the total work per size roughly constant
+        runs = max(3, min(repeats, 20_000 // size))
+        ms = _best_ms(lambda: predict_frame(model, frame), runs)
+        results[f"batch_{size}_rows_per_second"] = _result(size / ms * 1000, 'rows/s', 'higher')
+    return results
+
+
+# Peak Python-tracked allocations while pricing the largest batch, and the
+# process's peak resident set size at the end of the run
+def bench_memory(model, records, size):
+    frame = pd.DataFrame([records[i % len(records)] for i in range(size)])
+    tracemalloc.start()
+    predict_frame(model, frame)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        f"batch_{size}_peak_alloc_mb": _result(peak / 1024 ** 2, 'MB'),
+        'peak_rss_mb': _result(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 'MB'),
+    }
+
+
+def run(data_path=DATA_PATH, model_path=MODEL_PATH, encoder_path=ENCODER_PATH, repeats=DEFAULT_REPEATS,
+        batch_sizes=BATCH_SIZES, apps=APPS, import_repeats=3):
+    records = benchmark_records(data_path)
+    model = read_model(backend_path(model_path))
+    results = {}
+    results.update(bench_model_load(model_path, max(5, repeats // 5)))
+    results.update(bench_predict_price(model, encoder_path, records, repeats))
+    results.update(bench_batches(model, records, batch_sizes, repeats))
+    results.update(bench_memory(model, records, max(batch_sizes)))
+    if apps:
+        results.update(bench_app_imports(apps, import_repeats))
+        results.update(bench_app_reruns(apps, max(5, repeats // 10)))
+    meta = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(),
+        'machine': platform.machine(), 'backend': BACKEND, 'model': backend_path(model_path),
+        'numpy': np.__version__, 'pandas': pd.__version__,
+    }
+    return {'meta': meta, 'results': results}
+
+
+# Results that are worse than the baseline by more than threshold (relative).
+# Returns (name, baseline value, current value, relative change) tuples.
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    regressions = []
+    for name, current in results['results'].items():
+        previous = baseline['results'].get(name)
+        if previous is None or not previous['value']:
+            continue
+        change = (current['value'] - previous['value']) / previous['value']
+        worse = change > threshold if current['better'] == 'lower' else change < -threshold
+        if worse:
+            regressions.append((name, previous['value'], current['value'], change))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark model loading, app startup and the prediction path.")
+    parser.add_argument('--data', default=DATA_PATH, help="laptop CSV the benchmark inputs are built from")
+    parser.add_argument('--model', default=MODEL_PATH)
+    parser.add_argument('--encoder', default=ENCODER_PATH)
+    parser.add_argument('--repeats', type=int, default=DEFAULT_REPEATS)
+    parser.add_argument('--batch-size', type=int, action='append', help="batch sizes to measure (repeatable)")
+    parser.add_argument('--skip-apps', action='store_true', help="don't time the Streamlit apps")
+    parser.add_argument('--output', default=RESULTS_PATH)
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="relative slowdown that counts as a regression (0.25 = 25%%)")
+    parser.add_argument('--save-baseline', action='store_true', help="store these results as the new baseline")
+    args = parser.parse_args(argv)
+
+    results = run(args.data, args.model, args.encoder, args.repeats, args.batch_size or BATCH_SIZES,
+                  [] if args.skip_apps else APPS)
+    write_json(args.output, results, indent=1)
+
+    baseline = None
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    for name, result in results['results'].items():
+        line = f"{name:<34} {result['value']:>14,.3f} {result['unit']}"
+        previous = baseline and baseline['results'].get(name)
+        if previous:
+            line += f"  (baseline {previous['value']:,.3f})"
+        print(line)
+
+    if args.save_baseline:
+        write_json(args.baseline, results, indent=1)
+        print(f"Saved baseline to {args.baseline}")
+        return 0
+    if baseline is None:
+        print(f"No baseline at {args.baseline}; run with --save-baseline to create one")
+        return 0
+    regressions = compare(results, baseline, args.threshold)
+    for name, previous, current, change in regressions:
+        print(f"REGRESSION {name}: {previous:,.3f} -> {current:,.3f} ({change:+.0%})")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,240 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+from sklearn.model_selection import train_test_split
+
+from encoder import DATA_PATH, ENCODER_PATH
+from feature_store import load_features
+from features import FEATURE_COLUMNS
+from model_store import BACKEND, LEGACY_MODEL_PATH, Model, trees_path
+from train import MODEL_PARAMS, RANDOM_STATE, TEST_SIZE, evaluate, replace_atomically
+from tree_predictor import TreeEnsemble
+
+COMPACT_MODEL_PATH = "laptop_compact.ubj"
+REPORT_PATH = "compaction_report.csv"
+
+# Variants tried: the first n boosted rounds, the trees pruned back to a
+# depth, both, and shallower ensembles distilled from the full model
+ROUNDS = [10, 20, 30, 50, 75]
+DEPTHS = [3, 4, 5]
+DISTILL_GRID = [{'max_depth': depth, 'n_estimators': rounds, 'learning_rate': 0.1}
+                for depth in (3, 4) for rounds in (100, 200)]
+# Training rows with features swapped in from other rows, labeled by the full
+# model, added per real row when distilling
+DISTILL_COPIES = 4
+DISTILL_SWAP = 0.3
+
+# A variant is picked for deployment when its holdout RMSE is at most this
+# much (relative) worse than the full model's
+DEFAULT_TOLERANCE = 0.01
+LATENCY_REPEATS = 300
+# Prediction cost is compared by node count, which the measured batch cost
+# per row follows. The timings themselves move from run to run, and close
+# variants would swap places, so the front and the pick would depend on noise.
+OBJECTIVES = ['rmse', 'nodes', 'size_bytes']
+
+# Per-node arrays of a tree in XGBoost's JSON model
+_NODE_FIELDS = ['base_weights', 'default_left', 'left_children', 'loss_changes', 'parents', 'right_children',
+                'split_conditions', 'split_indices', 'split_type', 'sum_hessian']
+_NO_PARENT = 2147483647
+# Learning rate and regularization the pruner recomputes the trees with: what
+# train.py's MODEL_PARAMS trains with, falling back to XGBoost's defaults
+PRUNE_PARAMS = {'eta': MODEL_PARAMS.get('learning_rate', 0.3), 'lambda': MODEL_PARAMS.get('reg_lambda', 1.0),
+                'gamma': MODEL_PARAMS.get('gamma', 0.0)}
+
+
+# The booster of a pickled XGBRegressor or a native model file
+def load_booster(path=LEGACY_MODEL_PATH):
+    if path.endswith('.pkl'):
+        return joblib.load(path).get_booster()
+    return xgb.Booster(model_file=path)
+
+
+# train.py's split of laptop.csv, so the test rows are ones the deployed model
+# was not trained on
+def holdout_split(data_path=DATA_PATH):
+    X, y, _ = load_features(data_path)
+    return train_test_split(np.asarray(X), np.asarray(y), test_size=TEST_SIZE, random_state=RANDOM_STATE)
+
+
+# Drop the nodes pruning left behind: XGBoost only marks them deleted, so the
+# file (and the flat export) would stay as large as before
+def drop_deleted_nodes(booster):
+    model = json.loads(booster.save_raw(raw_format='json'))
+    for tree in model['learner']['gradient_booster']['model']['trees']:
+        left, right = tree['left_children'], tree['right_children']
+        live, stack = [], [0]
+        while stack:
+            node = stack.pop()
+            live.append(node)
+            if left[node] != -1:
+                stack.extend((left[node], right[node]))
+        live.sort()
+        position = {node: i for i, node in enumerate(live)}
+        for field in _NODE_FIELDS:
+            tree[field] = [tree[field][node] for node in live]
+        tree['left_children'] = [position.get(child, -1) for child in tree['left_children']]
+        tree['right_children'] = [position.get(child, -1) for child in tree['right_children']]
+        tree['parents'] = [position.get(parent, _NO_PARENT) for parent in tree['parents']]
+        tree['tree_param'].update(num_nodes=str(len(live)), num_deleted='0')
+    return xgb.Booster(model_file=bytearray(json.dumps(model).encode()))
+
+
+def truncate(booster, rounds):
+    return booster[:rounds]
+
+
+# Prune every tree back to max_depth with XGBoost's own pruner (a cut node
+# becomes a leaf holding its learned weight); the data only supplies the
+# statistics the updater needs, no new trees are grown
+def prune(booster, X, y, max_depth):
+    pruned = xgb.train({**PRUNE_PARAMS, 'process_type': 'update', 'updater': 'prune', 'max_depth': max_depth},
+                       xgb.DMatrix(X, y, feature_names=FEATURE_COLUMNS), num_boost_round=booster.num_boosted_rounds(),
+                       xgb_model=booster.copy())
+    return drop_deleted_nodes(pruned)
+
+
+# Train a smaller ensemble on the full model's prices instead of the real
+# ones. The training rows are padded with copies that have some features
+# taken from other rows, so the student sees the teacher on more inputs than
+# the ~1,000 real ones.
+def distill(teacher, X, params, copies=DISTILL_COPIES, swap=DISTILL_SWAP):
+    rng = np.random.default_rng(RANDOM_STATE)
+    synthetic = np.repeat(X, copies, axis=0)
+    donors = rng.integers(len(X), size=synthetic.shape)
+    mask = rng.random(synthetic.shape) < swap
+    synthetic[mask] = X[donors[mask], np.nonzero(mask)[1]]
+    X_student = np.concatenate([X, synthetic])
+    student = xgb.XGBRegressor(**{**MODEL_PARAMS, **params})
+    student.fit(pd.DataFrame(X_student, columns=FEATURE_COLUMNS), teacher.inplace_predict(X_student))
+    return student.get_booster()
+
+
+# Smaller versions of booster to compare, keyed by a short description
+def variants(booster, X_train, y_train):
+    rounds = booster.num_boosted_rounds()
+    candidates = {'full': booster}
+    for n in ROUNDS:
+        if n < rounds:
+            candidates[f"rounds={n}"] = truncate(booster, n)
+    for depth in DEPTHS:
+        pruned = prune(booster, X_train, y_train, depth)
+        candidates[f"depth={depth}"] = pruned
+        for n in ROUNDS:
+            if n < rounds:
+                candidates[f"depth={depth}, rounds={n}"] = truncate(pruned, n)
+    for params in DISTILL_GRID:
+        candidates[f"distilled depth={params['max_depth']}, rounds={params['n_estimators']}"] = distill(
+            booster, X_train, params)
+    return candidates
+
+
+# The model as it would be served under the selected backend
+def _served(booster):
+    if BACKEND == 'numpy':
+        return TreeEnsemble.from_booster(booster)
+    return Model(booster, None)
+
+
+def _best_us(fn, repeats):
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1e6
+
+
+# Holdout error, serving latency (one row, and per row in a 1,000-row batch)
+# and serialized size of one variant
+def measure(booster, X_test, y_test, repeats=LATENCY_REPEATS):
+    model = _served(booster)
+    model.warm_up()
+    row = X_test[:1]
+    batch = np.resize(X_test, (1_000, X_test.shape[1]))
+    trees = json.loads(booster.save_raw(raw_format='json'))['learner']['gradient_booster']['model']['trees']
+    return {
+        **evaluate(model, X_test, y_test),
+        'single_row_us': _best_us(lambda: model.predict(row), repeats),
+        'batch_us_per_row': _best_us(lambda: model.predict(batch), max(5, repeats // 10)) / len(batch),
+        'size_bytes': len(booster.save_raw(raw_format='ubj')),
+        'trees': booster.num_boosted_rounds(), 'nodes': sum(len(tree['left_children']) for tree in trees),
+    }
+
+
+# Rows no other row beats on every objective (lower is better for all)
+def pareto_front(report, objectives=OBJECTIVES):
+    values = report[objectives].to_numpy()
+    dominated = [
+        bool(np.any(np.all(values <= point, axis=1) & np.any(values < point, axis=1)))
+        for point in values
+    ]
+    return ~np.array(dominated)
+
+
+# The Pareto-optimal variant with the fewest nodes (then the smallest file and
+# the lowest RMSE) within tolerance of the full model's RMSE
+def pick_variant(report, tolerance=DEFAULT_TOLERANCE):
+    full_rmse = report.loc[report['variant'] == 'full', 'rmse'].iloc[0]
+    eligible = report[report['pareto'] & (report['rmse'] <= full_rmse * (1 + tolerance))]
+    return eligible.sort_values(['nodes', 'size_bytes', 'rmse', 'variant']).iloc[0]['variant']
+
+
+# Build and measure every variant. Returns the report (sorted by RMSE, with a
+# pareto column), the boosters by name and the name picked for deployment.
+def run(model_path=LEGACY_MODEL_PATH, data_path=DATA_PATH, tolerance=DEFAULT_TOLERANCE, repeats=LATENCY_REPEATS):
+    X_train, X_test, y_train, y_test = holdout_split(data_path)
+    boosters = variants(load_booster(model_path), X_train, y_train)
+    report = pd.DataFrame([{'variant': name, **measure(booster, X_test, y_test, repeats)}
+                           for name, booster in boosters.items()])
+    report['pareto'] = pareto_front(report)
+    return report.sort_values('rmse').reset_index(drop=True), boosters, pick_variant(report, tolerance)
+
+
+def save_model(booster, path=COMPACT_MODEL_PATH):
+    replace_atomically(path, booster.save_model)
+    replace_atomically(trees_path(path), TreeEnsemble.from_booster(booster).save)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build smaller variants of the model and pick one to deploy.")
+    parser.add_argument('--model', default=LEGACY_MODEL_PATH, help="pickled XGBRegressor or native model file")
+    parser.add_argument('--data', default=DATA_PATH)
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help="RMSE increase over the full model allowed for the pick (0.01 = 1%%)")
+    parser.add_argument('--repeats', type=int, default=LATENCY_REPEATS)
+    parser.add_argument('--output', default=COMPACT_MODEL_PATH, help="where to write the picked model")
+    parser.add_argument('--report', default=REPORT_PATH)
+    parser.add_argument('--publish', action='store_true',
+                        help="also publish the picked model to the model registry as the shadow candidate")
+    args = parser.parse_args(argv)
+
+    report, boosters, pick = run(args.model, args.data, args.tolerance, args.repeats)
+    report.to_csv(args.report, index=False)
+    with pd.option_context('display.width', 200):
+        print(report.drop(columns=['mse']).to_string(index=False, float_format=lambda v: f"{v:,.2f}"))
+
+    save_model(boosters[pick], args.output)
+    chosen, full = report.set_index('variant').loc[pick], report.set_index('variant').loc['full']
+    print(f"Picked {pick}: RMSE {chosen['rmse']:,.0f} (full {full['rmse']:,.0f}), "
+          f"{chosen['batch_us_per_row']:.2f} us per row (full {full['batch_us_per_row']:.2f}), "
+          f"{chosen['size_bytes']:,} bytes (full {full['size_bytes']:,}) -> {args.output}")
+    if args.publish:
+        from model_registry import REGISTRY_DIR, REGISTRY_ENV, SHADOW, publish, set_pointer
+
+        registry_dir = os.environ.get(REGISTRY_ENV) or REGISTRY_DIR
+        version = publish(args.output, ENCODER_PATH, registry_dir, note=f"compacted: {pick}")
+        set_pointer(registry_dir, SHADOW, version)
+        print(f"Published as {version} and shadowing it")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,147 @@
+import argparse
+import sys
+import threading
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+import latency
+from encoder import DATA_PATH
+from feature_store import load_features
+from features import CATEGORICAL_COLUMNS, FEATURE_COLUMNS, NUMERIC_COLUMNS, TARGET
+
+COMPARABLES_PATH = "laptop_comparables.joblib"
+DEFAULT_K = 5
+# Most listings one query may ask for (the service rejects larger k)
+MAX_K = 50
+
+# Listing details shown next to a prediction
+LISTING_COLUMNS = ['Company', 'TypeName', 'Inches', 'ScreenResolution', 'Cpu', 'Ram', 'Memory', 'Gpu', 'OpSys',
+                   'Weight', TARGET]
+
+# Relative weight of each feature in the distance (1 when not listed). CPU
+# type and RAM carry most of the model's gain, so matching them counts double.
+FEATURE_WEIGHTS = {'CPU_Type': 2.0, 'Ram': 2.0}
+
+_CATEGORICAL = np.array([FEATURE_COLUMNS.index(column) for column in CATEGORICAL_COLUMNS])
+_NUMERIC = np.array([FEATURE_COLUMNS.index(column) for column in NUMERIC_COLUMNS])
+
+_indexes = {}
+_lock = threading.Lock()
+
+
+# Nearest real listings to an encoded configuration. Each categorical feature
+# is one-hot encoded and each numeric one standardized, scaled so the squared
+# distance between two laptops is the weighted number of categories they
+# differ in plus the weighted squared z-score differences of the numbers. A
+# KD-tree over that space answers top-k queries without scanning the listings.
+class ComparablesIndex:
+    def __init__(self, tree, offsets, scales, means, listings):
+        self.tree = tree
+        # Per feature (in FEATURE_COLUMNS order): first dimension, scale and
+        # mean (numeric features only; 0 for categorical ones)
+        self.offsets = np.asarray(offsets)
+        self.scales = np.asarray(scales)
+        self.means = np.asarray(means)
+        # One dict per indexed listing, in tree order
+        self.listings = listings
+        self.width = tree.m
+
+    # Fit on encoded rows (the model's encoding) and their listing details
+    @classmethod
+    def build(cls, features, listings, categories, weights=None):
+        weights = {**FEATURE_WEIGHTS, **(weights or {})}
+        sizes = [len(categories[column]) if column in CATEGORICAL_COLUMNS else 1 for column in FEATURE_COLUMNS]
+        offsets = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+        weight = np.array([weights.get(column, 1.0) for column in FEATURE_COLUMNS])
+        means = np.where(np.isin(np.arange(len(FEATURE_COLUMNS)), _NUMERIC), features.mean(axis=0), 0.0)
+        std = features.std(axis=0)
+        # Two one-hot entries differ per category mismatch, so each gets half the weight
+        scales = np.where(np.isin(np.arange(len(FEATURE_COLUMNS)), _NUMERIC),
+                          np.sqrt(weight) / np.where(std > 0, std, 1.0), np.sqrt(weight / 2))
+        listings = listings.astype(object).where(listings.notna(), None).to_dict('records')
+        points = cls._embed(features, offsets, scales, means, int(sum(sizes)))
+        return cls(cKDTree(points), offsets, scales, means, listings)
+
+    @staticmethod
+    def _embed(features, offsets, scales, means, width):
+        features = np.asarray(features, dtype=np.float64).reshape(-1, len(FEATURE_COLUMNS))
+        points = np.zeros((len(features), width))
+        rows = np.arange(len(features))[:, None]
+        points[rows, offsets[_NUMERIC]] = (features[:, _NUMERIC] - means[_NUMERIC]) * scales[_NUMERIC]
+        points[rows, offsets[_CATEGORICAL] + features[:, _CATEGORICAL].astype(np.intp)] = scales[_CATEGORICAL]
+        return points
+
+    # Rows of encoded features -> points in the index space
+    def embed(self, features):
+        return self._embed(features, self.offsets, self.scales, self.means, self.width)
+
+    # The k listings closest to one encoded row, nearest first, each with its
+    # 'Distance' from the query
+    def query(self, features, k=DEFAULT_K):
+        with latency.timer('comparables'):
+            k = min(k, len(self.listings))
+            if k < 1:
+                return []
+            # A list of ranks keeps the results as arrays even for k=1
+            distances, rows = self.tree.query(self.embed(features)[0], k=list(range(1, k + 1)))
+            return [{**self.listings[row], 'Distance': float(distance)} for distance, row in zip(distances, rows)]
+
+    @classmethod
+    def load(cls, path=COMPARABLES_PATH):
+        return cls(**joblib.load(path))
+
+    def save(self, path=COMPARABLES_PATH):
+        joblib.dump({'tree': self.tree, 'offsets': self.offsets, 'scales': self.scales, 'means': self.means,
+                     'listings': self.listings}, path, compress=3)
+
+
+# Build the index over the listings of laptop.csv that have a price, encoded
+# with the feature store's encoder (the model's encoding)
+def build_index(data_path=DATA_PATH, weights=None):
+    X, _, encoder = load_features(data_path)
+    raw = pd.read_csv(data_path)
+    priced = raw[TARGET].notna().to_numpy()
+    return ComparablesIndex.build(X[priced], raw.loc[priced, LISTING_COLUMNS], encoder.categories, weights)
+
+
+# Load the index artifact once per process and share it between callers
+def load_comparables(path=COMPARABLES_PATH):
+    index = _indexes.get(path)
+    if index is not None:
+        return index
+    with _lock:
+        if path not in _indexes:
+            _indexes[path] = ComparablesIndex.load(path)
+        return _indexes[path]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the nearest-comparable-listings index.")
+    parser.add_argument('--data', default=DATA_PATH)
+    parser.add_argument('--output', default=COMPARABLES_PATH)
+    parser.add_argument('--k', type=int, default=DEFAULT_K, help="neighbours per query when timing")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    index = build_index(args.data)
+    index.save(args.output)
+    print(f"Wrote {args.output}: {len(index.listings):,} listings, {index.width} dimensions "
+          f"in {time.perf_counter() - start:.2f}s")
+
+    index = ComparablesIndex.load(args.output)
+    X, _, _ = load_features(args.data)
+    timings = []
+    for row in X[:500]:
+        start = time.perf_counter()
+        index.query(row, args.k)
+        timings.append(time.perf_counter() - start)
+    print(f"Top-{args.k} query: median {np.median(timings) * 1e6:.0f} us, p99 {np.percentile(timings, 99) * 1e6:.0f} us")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
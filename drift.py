@@ -0,0 +1,362 @@
+import argparse
+import bisect
+import json
+import math
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from encoder import DATA_PATH
+from features import CATEGORICAL_COLUMNS, FEATURE_COLUMNS, NUMERIC_COLUMNS, extract_cpu
+from model_store import file_sha256
+
+REFERENCE_PATH = "laptop_drift_reference.json"
+
+# Reference deciles split each numeric feature (and the price) into bins, plus
+# one bin below and one above the range seen in laptop.csv
+NUMERIC_BINS = 10
+# Live counts halve over this many seconds, so the scores follow recent traffic
+DEFAULT_HALF_LIFE = 3600
+DECAY_INTERVAL = 60
+# Scores are only reported once this much (decayed) traffic has been seen
+MIN_COUNT = 50
+# Population stability index above which a feature counts as drifted
+# (the usual rule of thumb: < 0.1 stable, 0.1-0.25 shifting, > 0.25 drifted)
+PSI_THRESHOLD = 0.25
+# Count-min sketch of unknown categorical labels, and how many of the most
+# frequent ones are reported by name
+SKETCH_DEPTH = 4
+SKETCH_WIDTH = 256
+TOP_UNKNOWN = 10
+# Smoothing so empty bins don't make the PSI infinite
+_EPSILON = 1e-4
+
+_PRICE = 'Price'
+_CATEGORICAL = [FEATURE_COLUMNS.index(column) for column in CATEGORICAL_COLUMNS]
+
+_monitors = {}
+_lock = threading.Lock()
+
+
+# Resolution of each numeric input: the encoder rounds Inches to whole inches,
+# and weights and clock speeds come with two decimals
+_STEPS = {'Inches': 1.0, 'Weight': 0.01, 'Clock_Speed': 0.01, _PRICE: 0.0}
+
+
+# Raw numeric inputs as the apps send them. The encoder replaces outliers with
+# the median, which would hide exactly the values this monitor is looking for.
+def raw_numeric(value):
+    if isinstance(value, str):
+        value = value.replace('kg', '')
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+# Bin edges from the reference deciles, with the reference minimum and maximum
+# as the outer edges (values outside them get their own bins). Edges sit half
+# a step below the value they start at, so live values that differ from a
+# reference value by float noise or rounding (15.6 vs 16 inches) share its bin
+# without being rounded on every request.
+def _numeric_edges(values, step):
+    quantiles = np.unique(np.quantile(values, np.linspace(0, 1, NUMERIC_BINS + 1)))
+    top = quantiles[-1] + step / 2 if step else np.nextafter(quantiles[-1], np.inf)
+    return (quantiles[:-1] - step / 2).tolist() + [float(top)]
+
+
+def _numeric_probabilities(values, edges):
+    counts = np.bincount(np.searchsorted(edges, values, side='right'), minlength=len(edges) + 1)
+    return (counts / max(counts.sum(), 1)).tolist()
+
+
+# Reference distributions from laptop.csv: category frequencies per encoded
+# code, decile bins of the raw numeric inputs that training kept (outliers it
+# replaced are left out, so live values like them land outside the range), and
+# the model's prices on those rows (the distribution served prices should follow)
+def build_reference(data_path=DATA_PATH, model=None):
+    from feature_store import load_features
+    from model_store import load_model
+
+    X, _, encoder = load_features(data_path)
+    raw = pd.read_csv(data_path)
+    numeric = {
+        # Rounded first, as the encoder does before its outlier check
+        'Inches': np.round(pd.to_numeric(raw['Inches'], errors='coerce').to_numpy(dtype=float)),
+        'Weight': pd.to_numeric(raw['Weight'].astype(str).str.replace('kg', '', regex=False),
+                                errors='coerce').to_numpy(dtype=float),
+        'Clock_Speed': extract_cpu(raw['Cpu'].astype(str))['Clock_Speed'].to_numpy(dtype=float),
+    }
+    for column, values in numeric.items():
+        values = values[~np.isnan(values)]
+        bounds = encoder.stats['outliers'].get(column)
+        if bounds is not None:
+            values = values[(values >= bounds['lower']) & (values <= bounds['upper'])]
+        numeric[column] = values
+    model = model or load_model()
+    numeric[_PRICE] = np.asarray(model.predict(X), dtype=float)
+
+    reference = {
+        'data': data_path, 'data_sha256': file_sha256(data_path), 'model': model.signature, 'rows': len(X),
+        'categorical': {}, 'numeric': {},
+    }
+    for j, column in zip(_CATEGORICAL, CATEGORICAL_COLUMNS):
+        labels = list(encoder.categories[column])
+        counts = np.bincount(X[:, j].astype(np.intp), minlength=len(labels))
+        reference['categorical'][column] = {'labels': labels, 'probabilities': (counts / counts.sum()).tolist()}
+    for column, values in numeric.items():
+        edges = _numeric_edges(values, _STEPS[column])
+        reference['numeric'][column] = {'edges': edges, 'probabilities': _numeric_probabilities(values, edges)}
+    return reference
+
+
+def save_reference(reference, path=REFERENCE_PATH):
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, 'w') as f:
+        json.dump(reference, f)
+    os.replace(tmp_path, path)
+
+
+# The stored reference, built from laptop.csv (and saved) the first time
+def load_reference(path=REFERENCE_PATH):
+    if not os.path.exists(path):
+        save_reference(build_reference(), path)
+    with open(path) as f:
+        return json.load(f)
+
+
+# Population stability index between a reference and a live distribution
+def psi(reference, live):
+    reference = np.maximum(np.asarray(reference, dtype=float), _EPSILON)
+    live = np.maximum(np.asarray(live, dtype=float), _EPSILON)
+    return float(np.sum((live - reference) * np.log(live / reference)))
+
+
+# Count-min sketch of labels outside the encoder's vocabulary, with the most
+# frequent ones kept by name. Fixed size however many distinct labels arrive.
+class UnknownLabels:
+    def __init__(self, depth=SKETCH_DEPTH, width=SKETCH_WIDTH, top=TOP_UNKNOWN):
+        self.width = width
+        self.top = top
+        self.rows = [[0.0] * width for _ in range(depth)]
+        self.heavy = {}
+
+    def add(self, label):
+        estimate = math.inf
+        for i, row in enumerate(self.rows):
+            cell = hash((i, label)) % self.width
+            row[cell] += 1.0
+            estimate = min(estimate, row[cell])
+        if label in self.heavy or len(self.heavy) < self.top:
+            self.heavy[label] = estimate
+        else:
+            smallest = min(self.heavy, key=self.heavy.get)
+            if estimate > self.heavy[smallest]:
+                del self.heavy[smallest]
+                self.heavy[label] = estimate
+
+    def decay(self, factor):
+        self.rows = [[value * factor for value in row] for row in self.rows]
+        self.heavy = {label: count * factor for label, count in self.heavy.items()}
+
+    def most_common(self):
+        return sorted(self.heavy.items(), key=lambda item: -item[1])
+
+
+# Streaming comparison of served inputs and prices with the reference. Each
+# feature is a fixed array of (exponentially decayed) counts: one per known
+# category, or one per reference decile bin for numbers and the price, so
+# memory doesn't grow with traffic. observe() is a few list increments and
+# binary searches under a lock; the PSI is only computed when scores() is called.
+class DriftMonitor:
+    def __init__(self, reference, half_life=DEFAULT_HALF_LIFE):
+        self.reference = reference
+        self.decay_factor = 0.5 ** (DECAY_INTERVAL / half_life)
+        self.observed = 0
+        self.count = 0.0
+        self.priced = 0.0
+        self._labels = {column: reference['categorical'][column]['labels'] for column in CATEGORICAL_COLUMNS}
+        self._edges = {column: reference['numeric'][column]['edges'] for column in reference['numeric']}
+        # Known categories, then one slot for unknown or missing labels
+        self._categorical = [[0.0] * (len(self._labels[column]) + 1) for column in CATEGORICAL_COLUMNS]
+        self._numeric = {column: [0.0] * (len(edges) + 1) for column, edges in self._edges.items()}
+        self._unknown = {column: UnknownLabels() for column in CATEGORICAL_COLUMNS}
+        # Per encoder: its codes mapped to reference codes (the identity unless
+        # a registry version was trained with different vocabularies)
+        self._code_maps = {}
+        self._decayed = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _code_map(self, encoder):
+        entry = self._code_maps.get(id(encoder))
+        if entry is None or entry[0] is not encoder:
+            maps = []
+            for column in CATEGORICAL_COLUMNS:
+                labels = list(encoder.categories[column])
+                if labels == self._labels[column]:
+                    maps.append(None)
+                else:
+                    position = {label: i for i, label in enumerate(self._labels[column])}
+                    maps.append([position.get(label, len(self._labels[column])) for label in labels])
+            entry = self._code_maps[id(encoder)] = (encoder, maps)
+        return entry[1]
+
+    # One served request: the input record, its encoded row (codes below 0 or
+    # NaN are unknown labels) and the predicted price (None if it was rejected)
+    def observe(self, record, features, price, encoder):
+        codes = np.asarray(features, dtype=np.float32).reshape(-1).tolist()
+        maps = self._code_map(encoder)
+        with self._lock:
+            if time.monotonic() - self._decayed >= DECAY_INTERVAL:
+                self._decay()
+            self.observed += 1
+            self.count += 1.0
+            for slot, j, column, code_map in zip(self._categorical, _CATEGORICAL, CATEGORICAL_COLUMNS, maps):
+                code = codes[j]
+                if code >= 0:
+                    code = int(code)
+                    slot[code_map[code] if code_map else code] += 1.0
+                else:
+                    slot[-1] += 1.0
+                    self._unknown[column].add(str(record.get(column)))
+            for column in NUMERIC_COLUMNS:
+                value = raw_numeric(record.get(column))
+                if value == value:
+                    self._numeric[column][bisect.bisect_right(self._edges[column], value)] += 1.0
+            if price is not None:
+                self.priced += 1.0
+                self._numeric[_PRICE][bisect.bisect_right(self._edges[_PRICE], float(price))] += 1.0
+
+    # A batch of requests, counted with one bincount per feature
+    def observe_many(self, records, features, prices, encoder):
+        features = np.asarray(features, dtype=np.float32).reshape(len(records), -1)
+        prices = np.asarray(prices, dtype=float)
+        maps = self._code_map(encoder)
+        categorical = []
+        for slot, j, column, code_map in zip(self._categorical, _CATEGORICAL, CATEGORICAL_COLUMNS, maps):
+            codes = features[:, j]
+            known = codes >= 0
+            codes = codes[known].astype(np.intp)
+            if code_map:
+                codes = np.asarray(code_map, dtype=np.intp)[codes]
+            counts = np.bincount(codes, minlength=len(slot)).astype(float)
+            counts[-1] += len(records) - len(codes)
+            categorical.append((counts.tolist(), [str(records[i].get(column)) for i in np.flatnonzero(~known)]))
+        numeric = {}
+        for column in NUMERIC_COLUMNS:
+            values = np.array([raw_numeric(record.get(column)) for record in records])
+            numeric[column] = np.searchsorted(self._edges[column], values[~np.isnan(values)], side='right')
+        numeric[_PRICE] = np.searchsorted(self._edges[_PRICE], prices[~np.isnan(prices)], side='right')
+
+        with self._lock:
+            if time.monotonic() - self._decayed >= DECAY_INTERVAL:
+                self._decay()
+            self.observed += len(records)
+            self.count += len(records)
+            self.priced += len(numeric[_PRICE])
+            for slot, column, (counts, unknown) in zip(self._categorical, CATEGORICAL_COLUMNS, categorical):
+                for i, count in enumerate(counts):
+                    slot[i] += count
+                for label in unknown:
+                    self._unknown[column].add(label)
+            for column, bins in numeric.items():
+                slot = self._numeric[column]
+                for i, count in enumerate(np.bincount(bins, minlength=len(slot)).tolist()):
+                    slot[i] += count
+
+    # Age every count by the time since the last decay (called with the lock held)
+    def _decay(self):
+        now = time.monotonic()
+        factor = self.decay_factor ** ((now - self._decayed) / DECAY_INTERVAL)
+        self._decayed = now
+        self.count *= factor
+        self.priced *= factor
+        self._categorical = [[value * factor for value in slot] for slot in self._categorical]
+        self._numeric = {column: [value * factor for value in slot] for column, slot in self._numeric.items()}
+        for unknown in self._unknown.values():
+            unknown.decay(factor)
+
+    # PSI of every feature and the price against the reference, the share of
+    # unknown labels and of numbers outside the reference range, and the most
+    # frequent unknown labels. Features are None until MIN_COUNT requests.
+    def scores(self):
+        with self._lock:
+            categorical = [list(slot) for slot in self._categorical]
+            numeric = {column: list(slot) for column, slot in self._numeric.items()}
+            unknown = {column: sketch.most_common() for column, sketch in self._unknown.items()}
+            count, priced = self.count, self.priced
+        features = {}
+        for column, slot in zip(CATEGORICAL_COLUMNS, categorical):
+            total = sum(slot)
+            if total < MIN_COUNT:
+                features[column] = None
+                continue
+            live = np.array(slot) / total
+            features[column] = {
+                'psi': psi(self.reference['categorical'][column]['probabilities'] + [0.0], live),
+                'unknown_share': float(live[-1]),
+                'top_unknown': [{'label': label, 'count': round(estimate, 1)} for label, estimate in unknown[column]],
+            }
+        for column, slot in numeric.items():
+            total = sum(slot)
+            if total < MIN_COUNT:
+                features[column] = None
+                continue
+            live = np.array(slot) / total
+            features[column] = {
+                'psi': psi(self.reference['numeric'][column]['probabilities'], live),
+                'below_range_share': float(live[0]), 'above_range_share': float(live[-1]),
+            }
+        scored = {column: result for column, result in features.items() if result is not None}
+        return {
+            'observed': self.observed, 'recent_count': round(count, 1), 'recent_priced': round(priced, 1),
+            'reference_rows': self.reference['rows'], 'threshold': PSI_THRESHOLD,
+            'max_psi': max((result['psi'] for result in scored.values()), default=None),
+            'drifted': sorted(column for column, result in scored.items() if result['psi'] > PSI_THRESHOLD),
+            'features': features,
+        }
+
+
+# Process-wide monitor shared by every caller, built on the stored reference
+def load_monitor(path=REFERENCE_PATH):
+    monitor = _monitors.get(path)
+    if monitor is not None:
+        return monitor
+    with _lock:
+        if path not in _monitors:
+            _monitors[path] = DriftMonitor(load_reference(path))
+        return _monitors[path]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the drift reference, or score logged predictions against it.")
+    parser.add_argument('--data', default=DATA_PATH)
+    parser.add_argument('--reference', default=REFERENCE_PATH, help="reference file to write, or to score against")
+    parser.add_argument('--log', help="prediction log directory to score against the reference")
+    args = parser.parse_args(argv)
+
+    if not args.log:
+        start = time.perf_counter()
+        save_reference(build_reference(args.data), args.reference)
+        print(f"Wrote {args.reference} in {time.perf_counter() - start:.2f}s")
+        return 0
+
+    from encoder import load_encoder
+    from prediction_log import read_log
+
+    encoder = load_encoder()
+    # Logged traffic is scored as a whole, without decay
+    monitor = DriftMonitor(load_reference(args.reference), half_life=math.inf)
+    for record in read_log(args.log):
+        if record['features'] is not None:
+            monitor.observe(record['input'], record['features'], record['price'], encoder)
+    print(json.dumps(monitor.scores(), indent=1))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
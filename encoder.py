@@ -0,0 +1,182 @@
+import argparse
+import json
+import re
+import sys
+import threading
+
+import numpy as np
+import pandas as pd
+
+import latency
+from features import CATEGORICAL_COLUMNS, FEATURE_COLUMNS, NUMERIC_COLUMNS, clean_laptops, normalize_inputs
+
+# Encoder artifact stored next to the model
+ENCODER_PATH = "laptop_encoder.json"
+DATA_PATH = "laptop.csv"
+
+# Raw values remembered per column by the single-record fast path
+_MEMO_LIMIT = 4096
+
+_encoders = {}
+_lock = threading.Lock()
+
+
+def _natural_key(label):
+    return [(0, float(part), '') if part[:1].isdigit() else (1, 0.0, part.lower())
+            for part in re.findall(r'\d+\.?\d*|\D+', label)]
+
+
+# Encodes laptop specs into the model's feature matrix using the category
+# vocabularies fitted on the training data. A label's code is its position in
+# the sorted vocabulary, exactly as LabelEncoder assigned it in EDA.ipynb.
+class FeatureEncoder:
+    def __init__(self, categories, stats):
+        self.categories = categories
+        self.stats = stats
+        self.missing_label = str(stats['fill_value'])
+        # Each vocabulary compiles to a hash index, so a whole column encodes with one get_indexer call
+        self._lookups = {column: pd.Index(labels) for column, labels in categories.items()}
+        self._memo = {column: {} for column in CATEGORICAL_COLUMNS}
+        self._options = {}
+
+    @classmethod
+    def fit(cls, cleaned, stats):
+        categories = {column: sorted(cleaned[column].astype(str).unique()) for column in CATEGORICAL_COLUMNS}
+        return cls(categories, stats)
+
+    @classmethod
+    def load(cls, path=ENCODER_PATH):
+        with open(path) as f:
+            artifact = json.load(f)
+        return cls(artifact['categories'], artifact['stats'])
+
+    def save(self, path=ENCODER_PATH):
+        with open(path, 'w') as f:
+            json.dump({'columns': FEATURE_COLUMNS, 'categories': self.categories, 'stats': self.stats}, f, indent=1)
+
+    # Choices to offer in the UI: the vocabulary in natural order, without the
+    # missing-value label or duplicates that only differ by trailing spaces
+    def options(self, column):
+        options = self._options.get(column)
+        if options is None:
+            labels = {label.strip() for label in self.categories[column] if label != self.missing_label}
+            options = self._options[column] = sorted(labels, key=_natural_key)
+        return list(options)
+
+    # Encode already-cleaned training rows (every value is in the vocabulary)
+    def transform(self, cleaned):
+        features = np.empty((len(cleaned), len(FEATURE_COLUMNS)), dtype=np.float32)
+        for j, column in enumerate(FEATURE_COLUMNS):
+            if column in self._lookups:
+                features[:, j] = self._lookups[column].get_indexer(cleaned[column].astype(str))
+            else:
+                features[:, j] = cleaned[column].to_numpy(dtype=np.float32)
+        return features
+
+    # Inverse of transform: the cleaned values behind an encoded matrix
+    def decode(self, features):
+        columns = {}
+        for j, column in enumerate(FEATURE_COLUMNS):
+            if column in self._lookups:
+                columns[column] = self._lookups[column].take(np.asarray(features[:, j], dtype=np.intp))
+            else:
+                columns[column] = np.asarray(features[:, j], dtype=float)
+        return pd.DataFrame(columns)
+
+    # Encode one column of app/batch inputs. Returns the float32 values and a
+    # mask of the invalid ones.
+    def encode_column(self, column, values):
+        values = normalize_inputs(column, values, self.stats)
+        if column in self._lookups:
+            codes = self._lookups[column].get_indexer(values)
+            return codes.astype(np.float32), codes < 0
+        return values.astype(np.float32), np.isnan(values)
+
+    # Encode a DataFrame of app/batch inputs. Returns the float32 matrix and a
+    # per-row error message ('' for valid rows).
+    def encode_frame(self, df):
+        with latency.timer('encode_frame'):
+            return self._encode_frame(df)
+
+    def _encode_frame(self, df):
+        missing = [column for column in FEATURE_COLUMNS if column not in df.columns]
+        if missing:
+            raise ValueError(f"Missing columns: {', '.join(missing)}")
+
+        features = np.empty((len(df), len(FEATURE_COLUMNS)), dtype=np.float32)
+        invalid = np.zeros(features.shape, dtype=bool)
+        for j, column in enumerate(FEATURE_COLUMNS):
+            features[:, j], invalid[:, j] = self.encode_column(column, df[column])
+
+        errors = np.full(len(df), '', dtype=object)
+        columns = np.array(FEATURE_COLUMNS)
+        for row in np.flatnonzero(invalid.any(axis=1)):
+            errors[row] = 'Invalid ' + ', '.join(columns[invalid[row]])
+        return features, errors
+
+    # Encode one input_data dict into a 1 x n feature row. Categorical values
+    # already seen are plain dict lookups; new ones are normalized and looked up once.
+    def encode_record(self, record):
+        with latency.timer('encode'):
+            return self._encode_record(record)
+
+    def _encode_record(self, record):
+        features = np.empty((1, len(FEATURE_COLUMNS)), dtype=np.float32)
+        invalid = []
+        for j, column in enumerate(FEATURE_COLUMNS):
+            features[0, j] = self._encode_value(column, record.get(column))
+            if np.isnan(features[0, j]) or features[0, j] < 0:
+                invalid.append(column)
+        return features, ('Invalid ' + ', '.join(invalid) if invalid else '')
+
+    # Code (or normalized number) of one value; NaN or -1 when it is invalid
+    def _encode_value(self, column, value):
+        if column in NUMERIC_COLUMNS:
+            return normalize_inputs(column, np.array([value]), self.stats)[0]
+        memo = self._memo[column]
+        code = memo.get(value)
+        if code is None:
+            code = int(self._lookups[column].get_indexer(normalize_inputs(column, pd.Series([value]), self.stats))[0])
+            if len(memo) < _MEMO_LIMIT:
+                memo[value] = code
+        return code
+
+    # Encode a short list of values for one column through the single-record
+    # fast path. Returns the float32 values and a mask of the invalid ones.
+    def encode_values(self, column, values):
+        encoded = np.array([self._encode_value(column, value) for value in values], dtype=np.float32)
+        return encoded, np.isnan(encoded) | (encoded < 0)
+
+
+# Fit the encoder on laptop.csv with the same cleaning used for training
+def build_encoder(data_path=DATA_PATH):
+    cleaned, stats = clean_laptops(pd.read_csv(data_path))
+    return FeatureEncoder.fit(cleaned, stats)
+
+
+# Load the encoder artifact once per process and share it between callers
+def load_encoder(path=ENCODER_PATH):
+    encoder = _encoders.get(path)
+    if encoder is not None:
+        return encoder
+    with _lock:
+        if path not in _encoders:
+            _encoders[path] = FeatureEncoder.load(path)
+        return _encoders[path]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rebuild the feature encoder artifact from the training data.")
+    parser.add_argument('--data', default=DATA_PATH)
+    parser.add_argument('--output', default=ENCODER_PATH)
+    args = parser.parse_args(argv)
+
+    encoder = build_encoder(args.data)
+    encoder.save(args.output)
+    sizes = ', '.join(f"{column}={len(labels)}" for column, labels in encoder.categories.items())
+    print(f"Wrote {args.output} ({sizes})")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
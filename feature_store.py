@@ -0,0 +1,171 @@
+import argparse
+import hashlib
+import io
+import json
+import logging
+import os
+import shutil
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from encoder import DATA_PATH, FeatureEncoder
+from features import TARGET, clean_laptops
+from model_store import file_sha256
+
+logger = logging.getLogger(__name__)
+
+STORE_DIR = "feature_store"
+
+# Bump whenever clean_laptops or the encoding changes, so stored matrices built
+# by the old pipeline are never reused
+PIPELINE_VERSION = 2
+
+# Appending more than this share of the stored rows triggers a full rebuild,
+# so the cleaning statistics and vocabularies are refitted on all the data
+REBUILD_FRACTION = 0.25
+
+
+# Entries of one source file share this key: its name for readability and a
+# hash of its absolute path, so laptop.csv and laptop-2024.csv, or two
+# laptop.csv files in different directories, never share entries
+def _source_key(data_path):
+    stem = os.path.splitext(os.path.basename(data_path))[0]
+    return f"{stem}-{hashlib.sha256(os.path.abspath(data_path).encode()).hexdigest()[:16]}"
+
+
+def _entry_name(data_path, sha256):
+    return f"{_source_key(data_path)}-{sha256[:16]}-v{PIPELINE_VERSION}"
+
+
+def read_manifest(entry):
+    with open(os.path.join(entry, 'manifest.json')) as f:
+        return json.load(f)
+
+
+# Listed prices of raw rows as they are in the CSV (NaN where blank), kept
+# next to the cleaned target, which has outliers replaced with the median
+def _raw_prices(raw):
+    return pd.to_numeric(raw[TARGET], errors='coerce').to_numpy(dtype=np.float64)
+
+
+# Write an entry into a temporary directory and rename it into place, so
+# concurrent readers only ever see complete entries
+def _write_entry(entry, X, y, prices, encoder, manifest):
+    tmp = f"{entry}.tmp{os.getpid()}"
+    os.makedirs(tmp, exist_ok=True)
+    np.save(os.path.join(tmp, 'X.npy'), np.ascontiguousarray(X, dtype=np.float32))
+    np.save(os.path.join(tmp, 'y.npy'), np.ascontiguousarray(y, dtype=np.float32))
+    np.save(os.path.join(tmp, 'prices.npy'), np.ascontiguousarray(prices, dtype=np.float64))
+    encoder.save(os.path.join(tmp, 'encoder.json'))
+    with open(os.path.join(tmp, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=1)
+    try:
+        os.rename(tmp, entry)
+    except OSError:  # another process built the same entry first
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def _build(data_path, sha256, size):
+    raw = pd.read_csv(data_path)
+    cleaned, stats = clean_laptops(raw)
+    encoder = FeatureEncoder.fit(cleaned, stats)
+    return encoder.transform(cleaned), cleaned[TARGET].to_numpy(dtype=np.float32), _raw_prices(raw), encoder, {
+        'source': data_path, 'sha256': sha256, 'bytes': size, 'rows': len(cleaned),
+        'pipeline_version': PIPELINE_VERSION, 'fitted_rows': len(cleaned),
+    }
+
+
+# Clean and encode only the rows appended since a previous entry was built,
+# with that entry's statistics and vocabularies. Returns None when the earlier
+# bytes changed, a new label turned up or too much was appended; the caller
+# then rebuilds from scratch.
+def _extend(data_path, sha256, size, previous):
+    manifest = read_manifest(previous)
+    old_size = manifest['bytes']
+    if size <= old_size or file_sha256(data_path, old_size) != manifest['sha256']:
+        return None
+    with open(data_path, 'rb') as f:
+        header = f.readline()
+        f.seek(old_size - 1)
+        tail = f.read()
+    if not tail.startswith(b'\n'):
+        return None
+    new_raw = pd.read_csv(io.BytesIO(header + tail[1:]))
+    if len(new_raw) > REBUILD_FRACTION * manifest['fitted_rows']:
+        return None
+
+    encoder = FeatureEncoder.load(os.path.join(previous, 'encoder.json'))
+    cleaned, _ = clean_laptops(new_raw, encoder.stats)
+    X_new = encoder.transform(cleaned)
+    if (X_new < 0).any():
+        return None
+    X = np.concatenate([np.load(os.path.join(previous, 'X.npy'), mmap_mode='r'), X_new])
+    y = np.concatenate([np.load(os.path.join(previous, 'y.npy'), mmap_mode='r'),
+                        cleaned[TARGET].to_numpy(dtype=np.float32)])
+    prices = np.concatenate([np.load(os.path.join(previous, 'prices.npy'), mmap_mode='r'), _raw_prices(new_raw)])
+    return X, y, prices, encoder, {**manifest, 'sha256': sha256, 'bytes': size, 'rows': len(X)}
+
+
+# Make sure an entry for the current contents of data_path exists and return
+# its directory and how it was produced ('cached', 'appended' or 'built').
+def refresh(data_path=DATA_PATH, store_dir=STORE_DIR, rebuild=False):
+    sha256, size = file_sha256(data_path), os.path.getsize(data_path)
+    name = _entry_name(data_path, sha256)
+    entry = os.path.join(store_dir, name)
+    if os.path.exists(entry) and not rebuild:
+        return entry, 'cached'
+
+    os.makedirs(store_dir, exist_ok=True)
+    # Earlier contents of this same file: same source key and pipeline version
+    key, suffix = _source_key(data_path), f"-v{PIPELINE_VERSION}"
+    previous = [
+        os.path.join(store_dir, other) for other in os.listdir(store_dir)
+        if other != name and other.endswith(suffix) and other.rsplit('-', 2)[0] == key
+    ]
+    start = time.perf_counter()
+    result, mode = None, 'built'
+    if previous and not rebuild:
+        result = _extend(data_path, sha256, size, max(previous, key=os.path.getmtime))
+        mode = 'appended'
+    if result is None:
+        result, mode = _build(data_path, sha256, size), 'built'
+    if rebuild:
+        shutil.rmtree(entry, ignore_errors=True)
+    _write_entry(entry, *result)
+    for other in previous:
+        shutil.rmtree(other, ignore_errors=True)
+    logger.info("Feature store %s %s (%d rows) in %.2fs", mode, entry, result[-1]['rows'],
+                time.perf_counter() - start)
+    return entry, mode
+
+
+# Cleaned and encoded training data for data_path: the feature matrix and
+# target memory-mapped from the store (no copy, no CSV parsing when cached)
+# and the encoder they were encoded with. Same shapes and values as
+# train.prepare_training_data.
+def load_features(data_path=DATA_PATH, store_dir=STORE_DIR, rebuild=False):
+    entry, _ = refresh(data_path, store_dir, rebuild)
+    X = np.load(os.path.join(entry, 'X.npy'), mmap_mode='r')
+    y = np.load(os.path.join(entry, 'y.npy'), mmap_mode='r')
+    return X, y, FeatureEncoder.load(os.path.join(entry, 'encoder.json'))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or refresh the cached feature matrix for a laptop CSV.")
+    parser.add_argument('--data', default=DATA_PATH)
+    parser.add_argument('--store', default=STORE_DIR)
+    parser.add_argument('--rebuild', action='store_true', help="re-clean everything and refit the encoder")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    entry, mode = refresh(args.data, args.store, args.rebuild)
+    manifest = read_manifest(entry)
+    print(f"{mode.capitalize()} {entry}: {manifest['rows']:,} rows in {time.perf_counter() - start:.3f}s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
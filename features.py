@@ -0,0 +1,137 @@
+import numpy as np
+import pandas as pd
+
+# Column order the model was trained on (same keys as the apps' input_data)
+FEATURE_COLUMNS = [
+    'Company', 'TypeName', 'Inches', 'Ram', 'Memory', 'Gpu', 'OpSys', 'Weight',
+    'ResolutionCategory', 'Clock_Speed', 'CPU_Brand', 'CPU_Type'
+]
+NUMERIC_COLUMNS = ['Inches', 'Weight', 'Clock_Speed']
+CATEGORICAL_COLUMNS = [column for column in FEATURE_COLUMNS if column not in NUMERIC_COLUMNS]
+TARGET = 'Price'
+
+# Text columns of laptop.csv whose missing values are filled with the most frequent value
+RAW_TEXT_COLUMNS = ['Company', 'TypeName', 'Inches', 'ScreenResolution', 'Cpu', 'Ram', 'Memory', 'Gpu', 'OpSys', 'Weight']
+
+# Numeric columns whose outliers (outside 1.5 IQR) are replaced with the median
+OUTLIER_COLUMNS = ['Inches', 'Weight', TARGET]
+
+RESOLUTION_CATEGORIES = ['4K', 'Full HD', 'Retina', 'Quad HD', 'Other']
+
+
+# Categorize screen resolution (first matching rule wins, as in EDA.ipynb)
+def categorize_resolution(screen):
+    screen = screen.astype(str)
+
+    def contains(*tokens):
+        return np.logical_or.reduce([screen.str.contains(token, regex=False).to_numpy() for token in tokens])
+
+    conditions = [
+        contains('4K'),
+        contains('Full HD', '1920x1080'),
+        contains('Retina', '2560x1440', '2304x1440'),
+        contains('Quad HD', '2560x1600'),
+    ]
+    return pd.Series(np.select(conditions, RESOLUTION_CATEGORIES[:-1], 'Other'), index=screen.index)
+
+
+# Keep only the capacity of the first drive ('256GB SSD + 1TB HDD' -> '256GB');
+# '?' becomes missing
+def clean_memory(memory):
+    return memory.where(memory != '?').str.split(' +', regex=True).str[0]
+
+
+# Extract clock speed, brand and CPU family from the raw Cpu string
+def extract_cpu(cpu):
+    return pd.DataFrame({
+        'Clock_Speed': cpu.str.extract(r'(\d+\.\d+)', expand=False).astype(float),
+        'CPU_Brand': cpu.str.extract(r'([A-Za-z]+)', expand=False),
+        'CPU_Type': cpu.str.extract(r'([iA]\d{1,2}|Ryzen|Xeon)', expand=False).str.upper(),
+    }, index=cpu.index)
+
+
+# Fill missing values with the median and replace outliers with it
+def replace_outliers(values, column_stats):
+    median = column_stats['median']
+    values = np.where(np.isnan(values), median, values)
+    return np.where((values < column_stats['lower']) | (values > column_stats['upper']), median, values)
+
+
+def _outlier_stats(values):
+    median = float(np.nanmedian(values))
+    q1, q3 = np.percentile(np.where(np.isnan(values), median, values), [25, 75])
+    iqr = q3 - q1
+    return {'median': median, 'lower': float(q1 - 1.5 * iqr), 'upper': float(q3 + 1.5 * iqr)}
+
+
+# Clean raw laptop.csv rows into the model's features (plus Price when present).
+# Reproduces the cleaning in EDA.ipynb with column-wise string operations. When
+# stats is None they are fitted on this data; pass the returned stats back in
+# to clean new rows exactly the same way.
+def clean_laptops(raw, stats=None):
+    fitting = stats is None
+    if fitting:
+        stats = {}
+    df = raw.drop(columns=['Unnamed: 0.1', 'Unnamed: 0'], errors='ignore')
+
+    if fitting:
+        stats['modes'] = {column: df[column].mode()[0] for column in RAW_TEXT_COLUMNS}
+    df = df.fillna(stats['modes'])
+
+    if TARGET in df:
+        if fitting:
+            stats['price_median'] = float(df[TARGET].median())
+        df[TARGET] = df[TARGET].fillna(stats['price_median']).round()
+
+    df['Inches'] = pd.to_numeric(df['Inches'], errors='coerce').round(0)
+    weight = pd.to_numeric(df['Weight'].str.replace('kg', '', regex=False), errors='coerce')
+    if fitting:
+        stats['weight_median'] = float(weight.median())
+    df['Weight'] = weight.fillna(stats['weight_median'])
+    df['ResolutionCategory'] = categorize_resolution(df['ScreenResolution'])
+
+    if fitting:
+        stats['outliers'] = {}
+    for column in OUTLIER_COLUMNS:
+        if column in df:
+            values = df[column].to_numpy(dtype=float)
+            if fitting:
+                stats['outliers'][column] = _outlier_stats(values)
+            df[column] = replace_outliers(values, stats['outliers'][column])
+
+    df['Memory'] = clean_memory(df['Memory'])
+    df = df.join(extract_cpu(df['Cpu']))
+
+    # Missing CPU details and storage share one fill value (the mean clock speed)
+    if fitting:
+        stats['fill_value'] = float(df['Clock_Speed'].mean())
+    df['Clock_Speed'] = df['Clock_Speed'].fillna(stats['fill_value'])
+    for column in ['Memory', 'CPU_Brand', 'CPU_Type']:
+        df[column] = df[column].fillna(str(stats['fill_value']))
+
+    columns = FEATURE_COLUMNS + ([TARGET] if TARGET in df else [])
+    return df[columns], stats
+
+
+# Normalize one column of app/batch inputs (already split into the model's
+# columns) the same way clean_laptops treats the raw data. Numeric columns
+# also accept a plain NumPy array.
+def normalize_inputs(column, values, stats):
+    if column in NUMERIC_COLUMNS:
+        if column == 'Weight' and not pd.api.types.is_numeric_dtype(values):
+            values = pd.Series(values).astype(str).str.replace('kg', '', regex=False)
+        values = np.asarray(pd.to_numeric(values, errors='coerce'), dtype=float)
+        if column == 'Inches':
+            values = np.round(values, 0)
+        if column in stats['outliers']:
+            values = np.where(np.isnan(values), np.nan, replace_outliers(values, stats['outliers'][column]))
+        return values
+
+    values = values.fillna('').astype(str)
+    if column == 'Memory':
+        return clean_memory(values)
+    if column == 'ResolutionCategory':
+        return values.where(values.isin(RESOLUTION_CATEGORIES), categorize_resolution(values))
+    if column == 'CPU_Type':
+        return values.str.upper()
+    return values
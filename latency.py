@@ -0,0 +1,148 @@
+import math
+import os
+import threading
+import time
+
+# Set to 1 to record stage timings (off by default; the timers are no-ops then)
+LATENCY_ENV = "PRICE_LATENCY"
+
+# Histogram buckets are log-spaced from 1 µs to ~100 s with 8 buckets per
+# doubling, so quantiles are within ~5% and each histogram is a fixed 216 counts
+_MIN_SECONDS = 1e-6
+_BUCKETS_PER_OCTAVE = 8
+_NUM_BUCKETS = 27 * _BUCKETS_PER_OCTAVE
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+_enabled = os.environ.get(LATENCY_ENV, '') not in ('', '0')
+
+
+# Bounded latency histogram: a fixed number of log-spaced buckets, so memory
+# doesn't grow with the number of observations
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * _NUM_BUCKETS
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        if seconds <= _MIN_SECONDS:
+            bucket = 0
+        else:
+            bucket = min(int(math.log2(seconds / _MIN_SECONDS) * _BUCKETS_PER_OCTAVE), _NUM_BUCKETS - 1)
+        with self._lock:
+            self.counts[bucket] += 1
+            self.count += 1
+            self.sum += seconds
+
+    # Estimated quantile in seconds (geometric midpoint of the bucket it falls in)
+    def quantile(self, q):
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return _MIN_SECONDS * 2 ** ((bucket + 0.5) / _BUCKETS_PER_OCTAVE)
+        return _MIN_SECONDS * 2 ** (_NUM_BUCKETS / _BUCKETS_PER_OCTAVE)
+
+
+class _Timer:
+    __slots__ = ('histogram', 'start')
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+_histograms = {}
+_lock = threading.Lock()
+
+
+def enabled():
+    return _enabled
+
+
+def enable(on=True):
+    global _enabled
+    _enabled = on
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+
+
+def histogram(stage):
+    hist = _histograms.get(stage)
+    if hist is None:
+        with _lock:
+            hist = _histograms.setdefault(stage, Histogram())
+    return hist
+
+
+# Context manager timing one stage:
+#     with latency.timer('predict'):
+#         ...
+# Returns a shared no-op timer while recording is disabled.
+def timer(stage):
+    if not _enabled:
+        return _NULL_TIMER
+    return _Timer(histogram(stage))
+
+
+# Record a duration measured elsewhere (e.g. a model's load_seconds)
+def observe(stage, seconds):
+    if _enabled:
+        histogram(stage).observe(seconds)
+
+
+# One row per stage: count, mean and p50/p95/p99 in milliseconds
+def summary():
+    rows = []
+    for stage, hist in sorted(_histograms.items()):
+        row = {'stage': stage, 'count': hist.count, 'mean_ms': hist.sum / hist.count * 1000 if hist.count else 0.0}
+        for q in QUANTILES:
+            row[f"p{round(q * 100)}_ms"] = hist.quantile(q) * 1000
+        rows.append(row)
+    return rows
+
+
+# Prometheus text exposition of every stage as one summary metric, plus extra
+# counters (name -> value, only ever increasing, such as cache hits) and gauges
+# (values that can go down, such as the cache size)
+def prometheus_text(gauges=None, counters=None):
+    lines = [
+        "# HELP price_stage_seconds Time spent in each stage of a price prediction",
+        "# TYPE price_stage_seconds summary",
+    ]
+    for stage, hist in sorted(_histograms.items()):
+        for q in QUANTILES:
+            lines.append(f'price_stage_seconds{{stage="{stage}",quantile="{q}"}} {hist.quantile(q):.9g}')
+        lines.append(f'price_stage_seconds_sum{{stage="{stage}"}} {hist.sum:.9g}')
+        lines.append(f'price_stage_seconds_count{{stage="{stage}"}} {hist.count}')
+    for kind, values in (('counter', counters), ('gauge', gauges)):
+        for name, value in (values or {}).items():
+            lines.append(f"# TYPE {name} {kind}")
+            lines.append(f"{name} {value}")
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,80 @@
+import argparse
+import asyncio
+import random
+import sys
+import time
+
+import aiohttp
+import numpy as np
+import pandas as pd
+
+from features import FEATURE_COLUMNS, clean_laptops
+
+
+# Request bodies built from the cleaned rows of laptop.csv
+def sample_records(data_path="laptop.csv"):
+    cleaned, _ = clean_laptops(pd.read_csv(data_path))
+    return cleaned[FEATURE_COLUMNS].to_dict('records')
+
+
+async def _worker(session, url, records, batch_size, deadline, latencies, errors):
+    while time.perf_counter() < deadline:
+        if batch_size > 1:
+            body = random.choices(records, k=batch_size)
+        else:
+            body = random.choice(records)
+        start = time.perf_counter()
+        try:
+            async with session.post(url, json=body) as response:
+                await response.read()
+                if response.status != 200:
+                    errors.append(response.status)
+                    continue
+        except aiohttp.ClientError as e:
+            errors.append(str(e))
+            continue
+        latencies.append(time.perf_counter() - start)
+
+
+# Keep `concurrency` requests in flight for `duration` seconds and report
+# throughput and latency percentiles
+async def run(base_url, concurrency, duration, batch_size, records):
+    url = base_url.rstrip('/') + ('/predict/batch' if batch_size > 1 else '/predict')
+    latencies, errors = [], []
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        deadline = time.perf_counter() + duration
+        started = time.perf_counter()
+        await asyncio.gather(*[
+            _worker(session, url, records, batch_size, deadline, latencies, errors) for _ in range(concurrency)
+        ])
+        elapsed = time.perf_counter() - started
+
+    latencies = np.array(latencies) * 1000
+    report = {
+        'requests': len(latencies), 'errors': len(errors), 'seconds': elapsed,
+        'requests_per_second': len(latencies) / elapsed, 'rows_per_second': len(latencies) * batch_size / elapsed,
+    }
+    if len(latencies):
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        report.update({'p50_ms': p50, 'p95_ms': p95, 'p99_ms': p99, 'max_ms': latencies.max()})
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate load against the prediction service.")
+    parser.add_argument('--url', default='http://127.0.0.1:8080')
+    parser.add_argument('--concurrency', type=int, default=64, help="requests kept in flight")
+    parser.add_argument('--duration', type=float, default=10.0, help="seconds to run")
+    parser.add_argument('--batch-size', type=int, default=1, help="items per request (>1 uses /predict/batch)")
+    parser.add_argument('--data', default="laptop.csv")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run(args.url, args.concurrency, args.duration, args.batch_size, sample_records(args.data)))
+    for name, value in report.items():
+        print(f"{name:>20}: {value:,.2f}" if isinstance(value, float) else f"{name:>20}: {value:,}")
+    return 0 if report['requests'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,293 @@
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from encoder import DATA_PATH, FeatureEncoder
+from feature_store import STORE_DIR, read_manifest, refresh
+from features import FEATURE_COLUMNS
+from model_registry import load_deployment
+from model_store import file_sha256
+
+logger = logging.getLogger(__name__)
+
+CUBE_PATH = "market_cube.npz"
+
+# Dimensions of the cube; every combination seen in the data is one cell
+DIMENSIONS = ['Company', 'TypeName', 'Ram', 'Gpu', 'OpSys']
+
+# Prices are counted into log-spaced bins (about 3.5% wide), so quantiles of
+# any slice come from summed histograms instead of the rows
+PRICE_BINS = 200
+PRICE_EDGES = np.geomspace(1_000, 1_000_000, PRICE_BINS + 1)
+QUANTILES = {'P10': 0.1, 'P25': 0.25, 'Median': 0.5, 'P75': 0.75, 'P90': 0.9}
+
+# Feature store rows aggregated (and priced by the model) at a time
+CHUNK_ROWS = 100_000
+
+_SUMS = ['count', 'price_sum', 'predicted_count', 'predicted_sum', 'abs_error_sum']
+
+_cubes = {}
+_lock = threading.Lock()
+
+
+# Market statistics per combination of DIMENSIONS: listing count, price sum,
+# a price histogram and the deployed model's predicted prices, for the rows of
+# one feature store entry. Everything is a sum, so slices and roll-ups add up
+# cells and rows appended to the data add into the cells they fall in.
+class MarketCube:
+    def __init__(self, categories, keys, sums, histogram, manifest):
+        self.categories = categories
+        self.keys = keys
+        self.sums = sums
+        self.histogram = histogram
+        self.manifest = manifest
+        self._sizes = [len(categories[dimension]) for dimension in DIMENSIONS]
+        self._codes = dict(zip(DIMENSIONS, np.unravel_index(keys, self._sizes)))
+
+    @classmethod
+    def empty(cls, categories, manifest):
+        sums = {name: np.zeros(0, dtype=np.int64 if name.endswith('count') else float) for name in _SUMS}
+        return cls({dimension: categories[dimension] for dimension in DIMENSIONS}, np.zeros(0, dtype=np.int64),
+                   sums, np.zeros((0, PRICE_BINS), dtype=np.uint32), manifest)
+
+    @classmethod
+    def load(cls, path=CUBE_PATH):
+        with np.load(path) as data:
+            manifest = json.loads(str(data['manifest']))
+            sums = {name: data[name] for name in _SUMS}
+            return cls(manifest.pop('categories'), data['keys'], sums, data['histogram'], manifest)
+
+    # Written next to path and renamed into place, so readers never see half a cube
+    def save(self, path=CUBE_PATH):
+        tmp_path = f"{os.path.splitext(path)[0]}.tmp.npz"
+        manifest = json.dumps({**self.manifest, 'categories': self.categories})
+        np.savez(tmp_path, keys=self.keys, histogram=self.histogram, manifest=np.array(manifest), **self.sums)
+        os.replace(tmp_path, path)
+
+    @property
+    def cells(self):
+        return len(self.keys)
+
+    @property
+    def rows(self):
+        return self.manifest['rows']
+
+    # Add encoded rows (feature matrix columns as in FEATURE_COLUMNS), their
+    # listed prices and the model's predictions (NaN where it could not price
+    # them). Rows without a listed price are passed over but still counted in
+    # rows, which tracks how far into the feature store entry the cube goes.
+    def add(self, X, prices, predicted, columns):
+        self.manifest['rows'] += len(X)
+        listed = ~np.isnan(prices)
+        X, prices, predicted = X[listed], prices[listed], predicted[listed]
+        keys = np.ravel_multi_index([X[:, columns.index(dimension)].astype(np.intp) for dimension in DIMENSIONS],
+                                    self._sizes).astype(np.int64)
+        cells, inverse = np.unique(keys, return_inverse=True)
+        n = len(cells)
+        priced = ~np.isnan(predicted)
+        bins = np.clip(np.searchsorted(PRICE_EDGES, prices, side='right') - 1, 0, PRICE_BINS - 1)
+        sums = {
+            'count': np.bincount(inverse, minlength=n),
+            'price_sum': np.bincount(inverse, prices, n),
+            'predicted_count': np.bincount(inverse, priced, n).astype(np.int64),
+            'predicted_sum': np.bincount(inverse, np.where(priced, predicted, 0), n),
+            'abs_error_sum': np.bincount(inverse, np.where(priced, np.abs(predicted - prices), 0), n),
+        }
+        histogram = np.bincount(inverse * PRICE_BINS + bins, minlength=n * PRICE_BINS).reshape(n, PRICE_BINS)
+
+        merged = np.union1d(self.keys, cells)
+        old, new = np.searchsorted(merged, self.keys), np.searchsorted(merged, cells)
+        for name in _SUMS:
+            total = np.zeros(len(merged), dtype=self.sums[name].dtype)
+            total[old] = self.sums[name]
+            total[new] += sums[name]
+            self.sums[name] = total
+        total = np.zeros((len(merged), PRICE_BINS), dtype=np.uint32)
+        total[old] = self.histogram
+        total[new] += histogram.astype(np.uint32)
+        self.keys, self.histogram = merged, total
+        self._codes = dict(zip(DIMENSIONS, np.unravel_index(merged, self._sizes)))
+
+    # Labels of a dimension that occur in the data, most listings first
+    def labels(self, dimension):
+        counts = np.bincount(self._codes[dimension], self.sums['count'], len(self.categories[dimension]))
+        order = np.argsort(-counts, kind='stable')
+        return [self.categories[dimension][code] for code in order if counts[code]]
+
+    # Cells inside filters ({dimension: [labels]}; an empty list means all)
+    def _mask(self, filters):
+        mask = np.ones(self.cells, dtype=bool)
+        for dimension, labels in (filters or {}).items():
+            if labels:
+                wanted = np.isin(self.categories[dimension], labels)
+                mask &= wanted[self._codes[dimension]]
+        return mask
+
+    # Statistics of the filtered listings grouped by zero, one or more
+    # dimensions: Listings, mean and quantile prices, mean predicted price and
+    # the model's mean absolute error, one row per group with listings
+    def group(self, by=(), filters=None):
+        by = list(by)
+        mask = self._mask(filters)
+        sizes = [self._sizes[DIMENSIONS.index(dimension)] for dimension in by]
+        keys = np.ravel_multi_index([self._codes[dimension][mask] for dimension in by], sizes) if by \
+            else np.zeros(mask.sum(), dtype=np.intp)
+        keys, groups = np.unique(keys, return_inverse=True)
+        sums = {name: np.bincount(groups, self.sums[name][mask], len(keys)) for name in _SUMS}
+        # Cells sorted by group, so each group's histogram is one reduceat segment
+        order = np.argsort(groups, kind='stable')
+        starts = np.searchsorted(groups[order], np.arange(len(keys)))
+        histogram = np.add.reduceat(self.histogram[mask][order], starts, axis=0) if len(keys) \
+            else np.zeros((0, PRICE_BINS))
+
+        columns = {dimension: np.asarray(self.categories[dimension], dtype=object)[codes]
+                   for dimension, codes in zip(by, np.unravel_index(keys, sizes) if by else [])}
+        columns['Listings'] = sums['count'].astype(np.int64)
+        columns.update(zip(QUANTILES, _quantiles(histogram, QUANTILES.values())))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            columns['Mean_Price'] = sums['price_sum'] / sums['count']
+            columns['Mean_Predicted'] = sums['predicted_sum'] / sums['predicted_count']
+            columns['MAE'] = sums['abs_error_sum'] / sums['predicted_count']
+        table = pd.DataFrame(columns)
+        return table.sort_values('Listings', ascending=False, kind='stable').reset_index(drop=True)
+
+    def summary(self, filters=None):
+        table = self.group((), filters)
+        return table.iloc[0].to_dict() if len(table) else None
+
+    # Listings per price bin of the filtered slice (empty bins at either end dropped)
+    def price_distribution(self, filters=None):
+        counts = self.histogram[self._mask(filters)].sum(axis=0)
+        used = np.flatnonzero(counts)
+        if not len(used):
+            return pd.DataFrame({'Price': [], 'Listings': []})
+        bins = slice(used[0], used[-1] + 1)
+        return pd.DataFrame({'Price': np.round(np.sqrt(PRICE_EDGES[:-1] * PRICE_EDGES[1:])[bins], -2),
+                             'Listings': counts[bins]})
+
+
+# Quantiles of each histogram row, interpolated geometrically inside the bin
+def _quantiles(histogram, quantiles):
+    cumulative = np.cumsum(histogram, axis=1)
+    total = cumulative[:, -1:]
+    rows = np.arange(len(histogram))
+    result = []
+    for q in quantiles:
+        target = q * total
+        bins = np.minimum((cumulative < target).sum(axis=1), PRICE_BINS - 1)
+        before = np.where(bins > 0, cumulative[rows, np.maximum(bins - 1, 0)], 0)
+        fraction = np.clip((target[:, 0] - before) / np.maximum(histogram[rows, bins], 1), 0, 1)
+        result.append(PRICE_EDGES[bins] * (PRICE_EDGES[bins + 1] / PRICE_EDGES[bins]) ** fraction)
+    return result
+
+
+def _model_id(deployment):
+    return f"{deployment.version}@{getattr(deployment.model, 'signature', None)}"
+
+
+# The model's prices for encoded feature store rows. When the deployment was
+# trained with another encoder the rows are decoded and encoded again with it.
+def _predict(deployment, X, encoder):
+    if deployment.encoder.categories == encoder.categories and deployment.encoder.stats == encoder.stats:
+        return np.asarray(deployment.model.predict(X), dtype=float)
+    features, errors = deployment.encoder.encode_frame(encoder.decode(X))
+    predicted = np.full(len(X), np.nan)
+    valid = errors == ''
+    if valid.any():
+        predicted[valid] = deployment.model.predict(features[valid])
+    return predicted
+
+
+# Whether cube still describes the first rows of the entry: the CSV bytes it
+# was built from are unchanged, encoded the same way and priced by the same model
+def _extends(cube, data_path, manifest, encoder_sha256, model_id):
+    previous = cube.manifest
+    return (previous.get('pipeline_version') == manifest['pipeline_version']
+            and previous.get('encoder_sha256') == encoder_sha256 and previous.get('model') == model_id
+            and previous['source'] == data_path and previous['rows'] <= manifest['rows']
+            and previous['bytes'] <= manifest['bytes']
+            and file_sha256(data_path, previous['bytes']) == previous['sha256'])
+
+
+# Bring the cube at cube_path up to date with the feature store entry for
+# data_path. When rows were only appended (and the encoder and model are the
+# same) just those rows are priced and added; anything else rebuilds the
+# cube. Returns the cube and 'cached', 'appended' or 'built'.
+def refresh_cube(data_path=DATA_PATH, cube_path=CUBE_PATH, store_dir=STORE_DIR, deployment=None, rebuild=False):
+    start = time.perf_counter()
+    entry, _ = refresh(data_path, store_dir)
+    manifest = read_manifest(entry)
+    encoder = FeatureEncoder.load(os.path.join(entry, 'encoder.json'))
+    encoder_sha256 = file_sha256(os.path.join(entry, 'encoder.json'))
+    deployment = deployment or load_deployment()
+    model_id = _model_id(deployment)
+
+    cube = None
+    if not rebuild and os.path.exists(cube_path):
+        try:
+            cube = MarketCube.load(cube_path)
+        except (OSError, ValueError, KeyError):
+            logger.exception("Could not read %s, rebuilding it", cube_path)
+    if cube is not None and _extends(cube, data_path, manifest, encoder_sha256, model_id):
+        if cube.rows == manifest['rows']:
+            return cube, 'cached'
+        mode = 'appended'
+    else:
+        cube = MarketCube.empty(encoder.categories, {'source': data_path, 'rows': 0})
+        mode = 'built'
+
+    X = np.load(os.path.join(entry, 'X.npy'), mmap_mode='r')
+    # The listed prices, not the training target y, whose outliers clean_laptops replaced with the median
+    listed = np.load(os.path.join(entry, 'prices.npy'), mmap_mode='r')
+    for begin in range(cube.rows, len(X), CHUNK_ROWS):
+        X_chunk = np.asarray(X[begin:begin + CHUNK_ROWS])
+        prices = np.asarray(listed[begin:begin + CHUNK_ROWS], dtype=float)
+        cube.add(X_chunk, prices, _predict(deployment, X_chunk, encoder), FEATURE_COLUMNS)
+    cube.manifest.update(sha256=manifest['sha256'], bytes=manifest['bytes'], encoder_sha256=encoder_sha256,
+                         model=model_id, pipeline_version=manifest['pipeline_version'], updated=time.time())
+    cube.save(cube_path)
+    logger.info("Market cube %s (%d rows, %d cells) in %.2fs", mode, cube.rows, cube.cells,
+                time.perf_counter() - start)
+    return cube, mode
+
+
+# Load the cube once per process and share it between Streamlit sessions;
+# refresh=True re-checks the feature store and replaces the shared cube
+def load_cube(data_path=DATA_PATH, cube_path=CUBE_PATH, refresh=False):
+    key = (data_path, cube_path)
+    cube = _cubes.get(key)
+    if cube is not None and not refresh:
+        return cube
+    with _lock:
+        if refresh or key not in _cubes:
+            _cubes[key], _ = refresh_cube(data_path, cube_path)
+        return _cubes[key]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or refresh the pre-aggregated market cube.")
+    parser.add_argument('--data', default=DATA_PATH)
+    parser.add_argument('--output', default=CUBE_PATH)
+    parser.add_argument('--rebuild', action='store_true', help="re-aggregate every row")
+    parser.add_argument('--by', action='append', choices=DIMENSIONS, help="print the statistics by this dimension")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    cube, mode = refresh_cube(args.data, args.output, rebuild=args.rebuild)
+    print(f"{mode.capitalize()} {args.output}: {cube.rows:,} rows in {cube.cells:,} cells "
+          f"in {time.perf_counter() - start:.2f}s")
+    if args.by:
+        with pd.option_context('display.width', 200, 'display.max_rows', 50):
+            print(cube.group(args.by).to_string(index=False, float_format=lambda v: f"{v:,.0f}"))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,365 @@
+import argparse
+import json
+import logging
+import os
+import shutil
+import sys
+import threading
+import time
+
+import numpy as np
+
+import latency
+from encoder import ENCODER_PATH, FeatureEncoder, load_encoder
+from model_store import (
+    MODEL_PATH, RELOAD_CHECK_INTERVAL, backend_path, file_sha256, file_signature, load_model, read_model, trees_path,
+)
+
+logger = logging.getLogger(__name__)
+
+REGISTRY_DIR = "registry"
+# Set to a registry directory to serve its active version instead of laptop.ubj
+REGISTRY_ENV = "MODEL_REGISTRY"
+
+# Pointer files in the registry directory, each holding one version name
+ACTIVE = "active"
+SHADOW = "shadow"
+
+# Files inside a version directory
+VERSION_MODEL = "model.ubj"
+VERSION_ENCODER = "encoder.json"
+VERSION_METADATA = "metadata.json"
+
+_registries = {}
+_lock = threading.Lock()
+
+
+def versions(registry_dir=REGISTRY_DIR):
+    if not os.path.isdir(registry_dir):
+        return []
+    # By number, not name: the names are zero-padded to four digits, and v10000 sorts before v9999 as a string
+    return sorted((name for name in os.listdir(registry_dir)
+                   if name.startswith('v') and name[1:].isdigit() and os.path.isdir(os.path.join(registry_dir, name))),
+                  key=lambda name: int(name[1:]))
+
+
+def read_metadata(registry_dir, version):
+    with open(os.path.join(registry_dir, version, VERSION_METADATA)) as f:
+        return json.load(f)
+
+
+# Version a pointer refers to, or None when it isn't set
+def read_pointer(registry_dir, pointer):
+    try:
+        with open(os.path.join(registry_dir, pointer)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+# Point ACTIVE or SHADOW at a version (None clears it). The pointer is replaced
+# with a rename, so a polling process reads either the old or the new version.
+def set_pointer(registry_dir, pointer, version):
+    path = os.path.join(registry_dir, pointer)
+    if version is None:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    if version not in versions(registry_dir):
+        raise ValueError(f"No version {version} in {registry_dir}")
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, 'w') as f:
+        f.write(version + '\n')
+    os.replace(tmp_path, path)
+
+
+# Copy a model (with its flat tree export, if there is one) and its encoder into
+# a new numbered version directory. Returns the version name. Versions are
+# never modified afterwards, so serving processes only ever watch the pointers.
+def publish(model_path=MODEL_PATH, encoder_path=ENCODER_PATH, registry_dir=REGISTRY_DIR, metrics_path=None,
+            note=None):
+    os.makedirs(registry_dir, exist_ok=True)
+    tmp = os.path.join(registry_dir, f".publish{os.getpid()}")
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    shutil.copyfile(model_path, os.path.join(tmp, VERSION_MODEL))
+    if os.path.exists(trees_path(model_path)):
+        shutil.copyfile(trees_path(model_path), trees_path(os.path.join(tmp, VERSION_MODEL)))
+    shutil.copyfile(encoder_path, os.path.join(tmp, VERSION_ENCODER))
+    metadata = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'model': model_path, 'encoder': encoder_path,
+        'model_sha256': file_sha256(model_path), 'encoder_sha256': file_sha256(encoder_path), 'note': note,
+    }
+    if metrics_path and os.path.exists(metrics_path):
+        with open(metrics_path) as f:
+            metadata['metrics'] = json.load(f)
+
+    # The rename claims the version number; another publisher that got there
+    # first just moves this one to the next number
+    while True:
+        existing = versions(registry_dir)
+        version = f"v{int(existing[-1][1:]) + 1 if existing else 1:04d}"
+        with open(os.path.join(tmp, VERSION_METADATA), 'w') as f:
+            json.dump({'version': version, **metadata}, f, indent=1)
+        try:
+            os.rename(tmp, os.path.join(registry_dir, version))
+            return version
+        except OSError:
+            if not os.path.exists(os.path.join(registry_dir, version)):
+                raise
+
+
+# One version loaded for serving: its model, the encoder it was trained with
+# and its metadata
+class Deployment:
+    def __init__(self, version, model, encoder, metadata=None):
+        self.version = version
+        self.model = model
+        self.encoder = encoder
+        self.metadata = metadata or {}
+
+
+# Load and warm up one registry version (the flat tree export under the numpy backend)
+def load_version(registry_dir, version):
+    directory = os.path.join(registry_dir, version)
+    model = read_model(backend_path(os.path.join(directory, VERSION_MODEL)))
+    encoder = FeatureEncoder.load(os.path.join(directory, VERSION_ENCODER))
+    return Deployment(version, model, encoder, read_metadata(registry_dir, version))
+
+
+# Running comparison of a shadow candidate with the active model on the same
+# rows: price deltas, their size relative to the active price, and how long
+# each model took per batch. Histograms are always on, unlike latency timers.
+class ShadowStats:
+    def __init__(self, active_version, shadow_version):
+        self.active_version = active_version
+        self.shadow_version = shadow_version
+        self.batches = 0
+        self.rows = 0
+        self.skipped_batches = 0
+        self.invalid_rows = 0
+        self.delta_sum = 0.0
+        self.abs_delta_sum = 0.0
+        self.max_abs_delta = 0.0
+        self.relative_delta = latency.Histogram()
+        self.active_seconds = latency.Histogram()
+        self.shadow_seconds = latency.Histogram()
+        self._lock = threading.Lock()
+
+    def record(self, active_prices, shadow_prices, active_seconds, shadow_seconds):
+        delta = np.asarray(shadow_prices, dtype=np.float64) - np.asarray(active_prices, dtype=np.float64)
+        valid = ~np.isnan(delta)
+        delta = delta[valid]
+        relative = np.abs(delta) / np.maximum(np.abs(np.asarray(active_prices, dtype=np.float64)[valid]), 1.0)
+        with self._lock:
+            self.batches += 1
+            self.rows += len(delta)
+            self.invalid_rows += int((~valid).sum())
+            self.delta_sum += float(delta.sum())
+            self.abs_delta_sum += float(np.abs(delta).sum())
+            if len(delta):
+                self.max_abs_delta = max(self.max_abs_delta, float(np.abs(delta).max()))
+        for value in relative:
+            self.relative_delta.observe(value)
+        self.active_seconds.observe(active_seconds)
+        self.shadow_seconds.observe(shadow_seconds)
+
+    def summary(self):
+        rows = max(self.rows, 1)
+        return {
+            'active_version': self.active_version, 'shadow_version': self.shadow_version,
+            'batches': self.batches, 'rows': self.rows, 'skipped_batches': self.skipped_batches,
+            'invalid_rows': self.invalid_rows, 'mean_delta': self.delta_sum / rows,
+            'mean_abs_delta': self.abs_delta_sum / rows, 'max_abs_delta': self.max_abs_delta,
+            **{f"p{round(q * 100)}_relative_delta": self.relative_delta.quantile(q) if self.rows else 0.0
+               for q in latency.QUANTILES},
+            **{f"{name}_p{round(q * 100)}_ms": histogram.quantile(q) * 1000 if histogram.count else 0.0
+               for name, histogram in (('active', self.active_seconds), ('shadow', self.shadow_seconds))
+               for q in (0.5, 0.95)},
+        }
+
+
+# Score rows the active version already priced with the shadow candidate and
+# record the comparison. Rows are re-encoded when the two encoders differ;
+# rows the candidate can't encode count as invalid. Runs on an executor thread.
+def shadow_score(candidate, active, features, active_prices, active_seconds, stats):
+    if candidate.encoder.categories != active.encoder.categories:
+        features = candidate.encoder.transform(active.encoder.decode(features))
+    valid = (features >= 0).all(axis=1)
+    shadow_prices = np.full(len(features), np.nan)
+    start = time.perf_counter()
+    if valid.any():
+        shadow_prices[valid] = candidate.model.predict(features[valid])
+    seconds = time.perf_counter() - start
+    latency.observe('shadow_predict', seconds)
+    stats.record(active_prices, shadow_prices, active_seconds, seconds)
+
+
+# Serves the registry's active version and (optionally) its shadow candidate.
+# The pointer files are stat-ed at most once per poll interval; when one
+# changes, the new version is loaded and warmed up on a background thread and
+# swapped in with a single reference assignment, so requests in flight finish
+# on the version they started with and none wait for the load.
+class ModelRegistry:
+    def __init__(self, registry_dir=REGISTRY_DIR, poll_interval=RELOAD_CHECK_INTERVAL):
+        self.registry_dir = registry_dir
+        self.poll_interval = poll_interval
+        self._poll_lock = threading.Lock()
+        self._checked = time.monotonic()
+        self._seen = {pointer: self._signature(pointer) for pointer in (ACTIVE, SHADOW)}
+        version = read_pointer(registry_dir, ACTIVE)
+        if version is None:
+            raise ValueError(f"No active version in {registry_dir}; publish one with --activate")
+        self.active = load_version(registry_dir, version)
+        self.candidate = None
+        self.shadow_stats = None
+        version = read_pointer(registry_dir, SHADOW)
+        if version is not None:
+            self._set_candidate(load_version(registry_dir, version))
+
+    def _signature(self, pointer):
+        try:
+            return file_signature(os.path.join(self.registry_dir, pointer))
+        except FileNotFoundError:
+            return None
+
+    def _set_candidate(self, deployment):
+        # Stats first, so a batch that sees the new candidate never records into the old stats
+        if deployment is not None:
+            self.shadow_stats = ShadowStats(self.active.version, deployment.version)
+        self.candidate = deployment
+
+    def current(self):
+        self.poll()
+        return self.active
+
+    def shadow(self):
+        self.poll()
+        return self.candidate
+
+    # Start loading any version a pointer now refers to. Cheap when nothing
+    # changed; concurrent callers skip the check while another thread does it.
+    def poll(self):
+        if time.monotonic() - self._checked < self.poll_interval or not self._poll_lock.acquire(blocking=False):
+            return
+        try:
+            self._checked = time.monotonic()
+            for pointer in (ACTIVE, SHADOW):
+                signature = self._signature(pointer)
+                if signature == self._seen[pointer]:
+                    continue
+                self._seen[pointer] = signature
+                version = read_pointer(self.registry_dir, pointer)
+                serving = self.active if pointer == ACTIVE else self.candidate
+                if version == (serving.version if serving else None):
+                    continue
+                if version is None:
+                    if pointer == SHADOW:
+                        self._set_candidate(None)
+                    continue
+                threading.Thread(target=self._swap, args=(pointer, version), daemon=True).start()
+        finally:
+            self._poll_lock.release()
+
+    def _swap(self, pointer, version):
+        try:
+            deployment = load_version(self.registry_dir, version)
+        except Exception:
+            logger.exception("Could not load %s version %s, keeping the current one", pointer, version)
+            return
+        # A later change of the pointer wins over a slower earlier load
+        if read_pointer(self.registry_dir, pointer) != version:
+            return
+        if pointer == ACTIVE:
+            self.active = deployment
+            if self.candidate is not None:
+                self._set_candidate(self.candidate)
+        else:
+            self._set_candidate(deployment)
+        logger.info("Swapped in %s version %s (load %.1f ms)", pointer, version, deployment.model.load_seconds * 1000)
+
+
+# laptop.ubj and its encoder behind the same current()/shadow() interface, for
+# serving without a registry (load_model still reloads the file when replaced)
+class LocalModels:
+    shadow_stats = None
+
+    def __init__(self, model_path=MODEL_PATH, encoder_path=ENCODER_PATH):
+        self.model_path = model_path
+        self.encoder_path = encoder_path
+
+    def current(self):
+        return Deployment(os.path.basename(self.model_path), load_model(self.model_path),
+                          load_encoder(self.encoder_path))
+
+    def shadow(self):
+        return None
+
+
+# Open a registry once per process and share it between callers
+def load_registry(registry_dir=REGISTRY_DIR):
+    registry = _registries.get(registry_dir)
+    if registry is not None:
+        return registry
+    with _lock:
+        if registry_dir not in _registries:
+            _registries[registry_dir] = ModelRegistry(registry_dir)
+        return _registries[registry_dir]
+
+
+# What the apps serve: the registry's active version when MODEL_REGISTRY is
+# set, otherwise laptop.ubj with laptop_encoder.json
+def load_deployment(registry_dir=None):
+    registry_dir = registry_dir or os.environ.get(REGISTRY_ENV)
+    if registry_dir:
+        return load_registry(registry_dir).current()
+    return LocalModels().current()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Publish, activate and shadow versions in the model registry.")
+    parser.add_argument('--registry', default=os.environ.get(REGISTRY_ENV) or REGISTRY_DIR)
+    commands = parser.add_subparsers(dest='command', required=True)
+    publish_parser = commands.add_parser('publish', help="copy a model and its encoder in as a new version")
+    publish_parser.add_argument('--model', default=MODEL_PATH)
+    publish_parser.add_argument('--encoder', default=ENCODER_PATH)
+    publish_parser.add_argument('--metrics', default="laptop_metrics.json", help="training report to attach")
+    publish_parser.add_argument('--note', help="free text stored in the metadata")
+    target = publish_parser.add_mutually_exclusive_group()
+    target.add_argument('--activate', action='store_true', help="serve it right away")
+    target.add_argument('--shadow', action='store_true', help="score it in shadow mode next to the active one")
+    activate_parser = commands.add_parser('activate', help="serve a version (rollback = activate an older one)")
+    activate_parser.add_argument('version')
+    shadow_parser = commands.add_parser('shadow', help="shadow-score a version, or stop with --off")
+    shadow_parser.add_argument('version', nargs='?')
+    shadow_parser.add_argument('--off', action='store_true')
+    commands.add_parser('list', help="show every version and the pointers")
+    args = parser.parse_args(argv)
+
+    if args.command == 'publish':
+        version = publish(args.model, args.encoder, args.registry, args.metrics, args.note)
+        print(f"Published {args.model} as {version}")
+        if args.activate or args.shadow:
+            set_pointer(args.registry, ACTIVE if args.activate else SHADOW, version)
+            print(f"{'Activated' if args.activate else 'Shadowing'} {version}")
+    elif args.command == 'activate':
+        set_pointer(args.registry, ACTIVE, args.version)
+        print(f"Activated {args.version}")
+    elif args.command == 'shadow':
+        if not args.off and not args.version:
+            parser.error("shadow needs a version or --off")
+        set_pointer(args.registry, SHADOW, None if args.off else args.version)
+        print("Shadow mode off" if args.off else f"Shadowing {args.version}")
+    else:
+        active, shadow = read_pointer(args.registry, ACTIVE), read_pointer(args.registry, SHADOW)
+        for version in versions(args.registry):
+            metadata = read_metadata(args.registry, version)
+            rmse = metadata.get('metrics', {}).get('test', {}).get('rmse')
+            marker = '*' if version == active else ('s' if version == shadow else ' ')
+            print(f"{marker} {version}  {metadata['created']}  {metadata['model_sha256'][:12]}"
+                  + (f"  rmse {rmse:,.0f}" if rmse else '') + (f"  {metadata['note']}" if metadata.get('note') else ''))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,147 @@
+import argparse
+import itertools
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.linear_model import LinearRegression
+from sklearn.metrics import mean_squared_error, r2_score
+from sklearn.model_selection import KFold
+from sklearn.neighbors import KNeighborsRegressor
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import StandardScaler
+from sklearn.svm import SVR
+from sklearn.tree import DecisionTreeRegressor
+from xgboost import XGBRegressor
+
+from encoder import DATA_PATH
+from feature_store import load_features
+from train import RANDOM_STATE
+
+LEADERBOARD_PATH = "leaderboard.csv"
+
+# Distance-based models get standardized inputs; every model runs single-threaded
+# because the folds themselves are spread over the process pool
+CANDIDATES = {
+    'LinearRegression': (lambda **p: LinearRegression(**p), {'fit_intercept': [True, False]}),
+    'KNeighborsRegressor': (
+        lambda **p: make_pipeline(StandardScaler(), KNeighborsRegressor(**p)),
+        {'n_neighbors': [3, 5, 10], 'weights': ['uniform', 'distance']},
+    ),
+    'DecisionTreeRegressor': (
+        lambda **p: DecisionTreeRegressor(random_state=RANDOM_STATE, **p),
+        {'max_depth': [None, 8, 12]},
+    ),
+    'RandomForestRegressor': (
+        lambda **p: RandomForestRegressor(random_state=RANDOM_STATE, n_jobs=1, **p),
+        {'n_estimators': [100, 300], 'max_depth': [None, 12]},
+    ),
+    'XGBRegressor': (
+        lambda **p: XGBRegressor(tree_method='hist', random_state=RANDOM_STATE, n_jobs=1, **p),
+        {'n_estimators': [100, 300], 'max_depth': [4, 6], 'learning_rate': [0.05, 0.3]},
+    ),
+    'SVR': (lambda **p: make_pipeline(StandardScaler(), SVR(**p)), {'C': [1e3, 1e4, 1e5]}),
+}
+
+# Single-row predictions timed per fold to estimate serving latency
+LATENCY_REPEATS = 50
+
+_X = _y = None
+
+
+def expand_grid(grid):
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*grid.values())]
+
+
+# Each worker maps the shared matrix once instead of receiving a pickled copy per task
+def _init_worker(X_path, y_path):
+    global _X, _y
+    _X = np.load(X_path, mmap_mode='r')
+    _y = np.load(y_path, mmap_mode='r')
+
+
+def _run_fold(task):
+    family, params, fold, train_rows, test_rows = task
+    X_train, y_train = _X[train_rows], _y[train_rows]
+    X_test, y_test = _X[test_rows], _y[test_rows]
+
+    model = CANDIDATES[family][0](**params)
+    start = time.perf_counter()
+    model.fit(X_train, y_train)
+    fit_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    predictions = model.predict(X_test)
+    batch_seconds = time.perf_counter() - start
+
+    row = X_test[:1]
+    timings = []
+    for _ in range(LATENCY_REPEATS):
+        start = time.perf_counter()
+        model.predict(row)
+        timings.append(time.perf_counter() - start)
+
+    return {
+        'family': family, 'params': params, 'fold': fold,
+        'rmse': float(np.sqrt(mean_squared_error(y_test, predictions))), 'r2': float(r2_score(y_test, predictions)),
+        'fit_seconds': fit_seconds, 'batch_us_per_row': batch_seconds / len(test_rows) * 1e6,
+        'single_row_us': float(np.median(timings)) * 1e6,
+    }
+
+
+# Cross-validate every candidate family and grid point in parallel and return
+# a leaderboard sorted by RMSE
+def run(X, y, families=None, folds=5, workers=None):
+    families = families or list(CANDIDATES)
+    splits = list(KFold(n_splits=folds, shuffle=True, random_state=RANDOM_STATE).split(X))
+    tasks = [
+        (family, params, fold, train_rows, test_rows)
+        for family in families
+        for params in expand_grid(CANDIDATES[family][1])
+        for fold, (train_rows, test_rows) in enumerate(splits)
+    ]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Matrices already mapped from the feature store are shared as they are
+        X_path, y_path = getattr(X, 'filename', None), getattr(y, 'filename', None)
+        if X_path is None or y_path is None:
+            X_path, y_path = os.path.join(tmp, 'X.npy'), os.path.join(tmp, 'y.npy')
+            np.save(X_path, np.ascontiguousarray(X, dtype=np.float32))
+            np.save(y_path, np.ascontiguousarray(y, dtype=np.float32))
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(X_path, y_path)) as pool:
+            results = list(pool.map(_run_fold, tasks, chunksize=1))
+
+    folds_df = pd.DataFrame(results)
+    folds_df['params'] = folds_df['params'].map(lambda params: ', '.join(f"{k}={v}" for k, v in params.items()))
+    leaderboard = folds_df.groupby(['family', 'params'], sort=False).agg(
+        rmse=('rmse', 'mean'), rmse_std=('rmse', 'std'), r2=('r2', 'mean'), fit_seconds=('fit_seconds', 'mean'),
+        batch_us_per_row=('batch_us_per_row', 'median'), single_row_us=('single_row_us', 'median'),
+    )
+    return leaderboard.sort_values('rmse').reset_index()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cross-validate candidate models in parallel.")
+    parser.add_argument('--data', default=DATA_PATH)
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--workers', type=int, help="processes to use (default: all cores)")
+    parser.add_argument('--family', action='append', choices=list(CANDIDATES), help="limit to these model families")
+    parser.add_argument('--output', default=LEADERBOARD_PATH)
+    args = parser.parse_args(argv)
+
+    X, y, _ = load_features(args.data)
+    leaderboard = run(X, y, args.family, args.folds, args.workers)
+    leaderboard.to_csv(args.output, index=False)
+    with pd.option_context('display.width', 200, 'display.max_colwidth', 60):
+        print(leaderboard.to_string(index=False, float_format=lambda v: f"{v:,.2f}"))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,183 @@
+import argparse
+import hashlib
+import importlib.util
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+import latency
+from tree_predictor import TreeEnsemble
+
+logger = logging.getLogger(__name__)
+
+# Native XGBoost model file served by the apps, and the legacy pickle it is exported from
+MODEL_PATH = "laptop.ubj"
+LEGACY_MODEL_PATH = "laptop.pkl"
+
+# 'xgboost' or 'numpy' (the flat tree export); defaults to xgboost when it is
+# installed. xgboost (and the scikit-learn it pulls in) takes over a second to
+# import, so it is only imported once a booster is actually loaded.
+BACKEND_ENV = "MODEL_BACKEND"
+BACKEND = os.environ.get(BACKEND_ENV) or ('xgboost' if importlib.util.find_spec('xgboost') else 'numpy')
+
+# Seconds between checks of the model file for changes
+RELOAD_CHECK_INTERVAL = 1.0
+
+_models = {}
+_checked = {}
+_lock = threading.Lock()
+
+
+# Flat NumPy export that sits next to a native model file (laptop.ubj -> laptop_trees.npz)
+def trees_path(model_path):
+    return f"{os.path.splitext(model_path)[0]}_trees.npz"
+
+
+# File actually served for a model path under the selected backend
+def backend_path(model_path):
+    if BACKEND == 'numpy' and not model_path.endswith('.npz'):
+        return trees_path(model_path)
+    return model_path
+
+
+# Identifies one version of a model file; changes whenever the file is replaced
+def file_signature(path):
+    stat = os.stat(path)
+    return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+
+# SHA-256 of a file's contents, or of only its first size bytes
+def file_sha256(path, size=None):
+    digest = hashlib.sha256()
+    remaining = os.path.getsize(path) if size is None else size
+    with open(path, 'rb') as f:
+        while remaining > 0:
+            block = f.read(min(1 << 20, remaining))
+            if not block:
+                break
+            digest.update(block)
+            remaining -= len(block)
+    return digest.hexdigest()
+
+
+# Write a metrics or report file; values JSON can't represent are written as strings
+def write_json(path, data, indent=2):
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=indent, default=str)
+
+
+# Thin wrapper around a Booster that keeps the model.predict(features) call
+# used by the apps, but predicts in place without building a DMatrix
+class Model:
+    def __init__(self, booster, path, signature=None):
+        self.booster = booster
+        self.path = path
+        self.signature = signature
+        self.num_features = booster.num_features()
+        self.load_seconds = 0.0
+        self.warmup_seconds = 0.0
+
+    def predict(self, features):
+        with latency.timer('convert'):
+            features = np.asarray(features, dtype=np.float32).reshape(-1, self.num_features)
+        with latency.timer('predict'):
+            return self.booster.inplace_predict(features)
+
+    # Per-feature contributions to each prediction from the booster's own tree
+    # path: exact TreeSHAP values, or the ~100x cheaper path attributions with
+    # approximate=True. Returns an n x (features + 1) array whose last column is
+    # the base value; each row sums to the predicted price.
+    def contributions(self, features, approximate=False):
+        import xgboost as xgb
+
+        with latency.timer('convert'):
+            features = np.asarray(features, dtype=np.float32).reshape(-1, self.num_features)
+        with latency.timer('explain'):
+            return self.booster.predict(xgb.DMatrix(features), pred_contribs=True, approx_contribs=approximate,
+                                        validate_features=False)
+
+    def warm_up(self):
+        self.predict(np.zeros((1, self.num_features), dtype=np.float32))
+
+
+# Convert the pickled XGBRegressor into XGBoost's native format, which is
+# portable across xgboost versions (the format is picked from the extension)
+def export_native(pickle_path=LEGACY_MODEL_PATH, model_path=MODEL_PATH):
+    import joblib
+
+    joblib.load(pickle_path).get_booster().save_model(model_path)
+    return model_path
+
+
+# Read a native model file (or its .npz tree export) into a warmed-up model,
+# timing the load. The warm-up prediction means the first real request
+# doesn't pay for lazy setup.
+def read_model(path=MODEL_PATH):
+    start = time.perf_counter()
+    signature = file_signature(path)
+    if path.endswith('.npz'):
+        model = TreeEnsemble.load(path)
+        model.signature = signature
+    else:
+        import xgboost as xgb
+
+        model = Model(xgb.Booster(model_file=path), path, signature)
+    model.load_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    model.warm_up()
+    model.warmup_seconds = time.perf_counter() - start
+    latency.observe('model_load', model.load_seconds)
+    latency.observe('model_warmup', model.warmup_seconds)
+    logger.info("Loaded %s in %.1f ms (warm-up %.1f ms)", path,
+                model.load_seconds * 1000, model.warmup_seconds * 1000)
+    return model
+
+
+# Load the model once per process and share it between every caller (Streamlit
+# sessions and reruns, the batch scorer). The file is re-checked at most once a
+# second and reloaded if it was replaced. Falls back to exporting the legacy
+# pickle the first time if the native file doesn't exist yet. With the numpy
+# backend the flat tree export next to the model file is served instead.
+def load_model(path=MODEL_PATH):
+    path = backend_path(path)
+    model = _models.get(path)
+    if model is not None and time.monotonic() - _checked[path] < RELOAD_CHECK_INTERVAL:
+        return model
+    with _lock:
+        if not path.endswith('.npz') and not os.path.exists(path) and os.path.exists(LEGACY_MODEL_PATH):
+            export_native(LEGACY_MODEL_PATH, path)
+        model = _models.get(path)
+        if model is None or model.signature != file_signature(path):
+            try:
+                model = _models[path] = read_model(path)
+            except Exception:
+                if model is None:
+                    raise
+                logger.exception("Could not reload %s, keeping the previous model", path)
+        _checked[path] = time.monotonic()
+        return model
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export the model to native format and time loading it.")
+    parser.add_argument('--pickle', default=LEGACY_MODEL_PATH, help="pickled XGBRegressor to export")
+    parser.add_argument('--model', default=MODEL_PATH, help="native model file (.ubj or .json)")
+    parser.add_argument('--export', action='store_true', help="re-export the pickle before loading")
+    args = parser.parse_args(argv)
+
+    if args.export:
+        export_native(args.pickle, args.model)
+        print(f"Exported {args.pickle} -> {args.model} ({os.path.getsize(args.model):,} bytes)")
+    model = read_model(args.model)
+    print(f"Load: {model.load_seconds * 1000:.1f} ms, warm-up: {model.warmup_seconds * 1000:.1f} ms")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,164 +1,75 @@
+import time
+
 import streamlit as st
-import joblib
-import numpy as np
 
-# Load the pre-trained model
+import latency
+import whatif
+from app_assets import HEADER_IMAGE_PATH, MEMORY_OPTIONS, NEW_APP_CARE_TIPS, load_image
+from features import FEATURE_COLUMNS
+from model_registry import load_deployment
+from prediction_cache import load_cache
+from prediction_log import load_log
+from pricing import contribution_table
+
+# Load the pre-trained model once per process; it is shared across sessions and reruns
 try:
-    model = joblib.load("laptop.pkl")  # Adjust path if necessary
+    # The model and the feature encoder fitted with it (the active registry
+    # version when MODEL_REGISTRY is set), shared with the batch scorer
+    deployment = load_deployment()
+    model, encoder = deployment.model, deployment.encoder
+    # Repeated configurations are answered from the cache without touching the booster
+    prediction_cache = load_cache()
+    # Audit trail of every prediction, written to logs/ by a background thread
+    prediction_log = load_log('new_app')
 except Exception as e:
     st.error(f"Error loading model: {e}")
+    st.stop()
 
-# Feature mappings for the categorical variables
-company_mapping = {
-    'Apple': 1, 'HP': 7, 'Acer': 0, 'Asus': 2, 'Dell': 4, 'Lenovo': 10, 'Chuwi': 3,
-    'MSI': 11, 'Microsoft': 13, 'Toshiba': 16, 'Huawei': 8, 'Xiaomi': 18, 'Vero': 17,
-    'Razer': 14, 'Mediacom': 12, 'Samsung': 15, 'Google': 6, 'Fujitsu': 5, 'LG': 9
-}
-
-type_mapping = {
-    'Ultrabook': 4, 'Notebook': 3, 'Gaming': 1, '2 in 1 Convertible': 0, 
-    'Workstation': 5, 'Netbook': 2
-}
-
-ram_mapping = {
-    '8GB': 9, '4GB': 1, '16GB': 6, '6GB': 4, '12GB': 0, '2GB': 7, '32GB': 8, 
-    '64GB': 5, '24GB': 3, '1GB': 2
-}
-
-memory_mapping = {
-    '128GB SSD': 1, '128GB Flash Storage': 7, '256GB SSD': 12, '512GB SSD': 10, 
-    '500GB HDD': 4, '256GB Flash Storage': 13, '1TB HDD': 9, '128GB SSD + 1TB HDD': 8,
-    '256GB Flash Storage': 0, '64GB Flash Storage': 2, '32GB Flash Storage': 3,
-    '256GB SSD + 256GB SSD': 5, '256GB SSD + 1TB HDD': 6, '256GB SSD + 2TB HDD': 11,
-    '1TB SSD': 18, '2TB HDD': 28, '512GB SSD + 1TB HDD': 17
-}
-
-cpu_brand_mapping = {
-    'Intel': 0, 'AMD': 1, 'Samsung': 2
-}
-
-cpu_type_mapping = {
-    'i3': 2, 'i5': 1, 'i7': 0
-}
-
-gpu_mapping = {
-    'Intel Iris Plus Graphics 640': 0, 'Intel HD Graphics 6000': 1, 'Intel HD Graphics 620': 2, 
-    'AMD Radeon Pro 455': 3, 'Intel Iris Plus Graphics 650': 4, 'AMD Radeon R5': 5, 
-    'Intel Iris Pro Graphics': 6, 'Nvidia GeForce MX150': 7, 'Intel UHD Graphics 620': 8, 
-    'Intel HD Graphics 520': 9, 'AMD Radeon Pro 555': 10, 'AMD Radeon R5 M430': 11, 
-    'Intel HD Graphics 615': 12, 'AMD Radeon Pro 560': 13, 'Nvidia GeForce 940MX': 14, 
-    'Nvidia GeForce GTX 1050': 15, 'AMD Radeon R2': 16, 'AMD Radeon 530': 17, 'Nvidia GeForce 930MX': 18,
-    'Intel HD Graphics': 19, 'Intel HD Graphics 500': 20, 'Nvidia GeForce 930MX ': 21, 
-    'Nvidia GeForce GTX 1060': 22
-}
-
-resolution_mapping = {
-    '1366x768': 0, '1920x1080': 1, '3840x2160': 2, '3200x1800': 3, '2560x1600': 4, 
-    '1920x1200': 5, '1600x900': 6, '2560x1440': 7
-}
-
-opsys_mapping = {
-    'macOS': 8, 'No OS': 4, 'Windows 10': 5, 'Mac OS X': 3, 'Linux': 6,
-    'Windows 10 S': 1, 'Chrome OS': 7, 'Windows 7': 0, 'Android': 2
-}
+# Queue a prediction for the audit log; the caller never waits for the disk
+def log_prediction(input_data, features, price, start, error=None):
+    if prediction_log is not None:
+        prediction_log.log(dict(input_data), features, price, deployment.version, model.signature,
+                           time.perf_counter() - start, error)
 
 # Function to predict price based on user input
-def predict_price(input_data):
+def predict_price(input_data, explain=False):
+    start = time.perf_counter()
     try:
-        # Extract individual feature values and apply mappings
-        company = company_mapping.get(input_data['Company'], -1)
-        typename = type_mapping.get(input_data['TypeName'], -1)
-        inches = input_data['Inches']
-        ram = ram_mapping.get(input_data['Ram'], -1)
-        memory = memory_mapping.get(input_data['Memory'], -1)
-        gpu = gpu_mapping.get(input_data['Gpu'], -1)
-        opsys = opsys_mapping.get(input_data['OpSys'], -1)
-        weight = input_data['Weight']
-        resolution = resolution_mapping.get(input_data['ResolutionCategory'], -1)
-        clockspeed = input_data['Clock_Speed']
-        cpubrand = cpu_brand_mapping.get(input_data['CPU_Brand'], -1)
-        cputype = cpu_type_mapping.get(input_data['CPU_Type'], -1)
-
-        # Check for missing values in critical fields
-        if company == -1 or typename == -1 or ram == -1 or memory == -1 or gpu == -1 or opsys == -1 or resolution == -1:
-            st.error("Please fill all the fields correctly.")
-            return None
-        
-        # Combine all features into a list and ensure all values are numeric
-        features = [
-            company, typename, inches, ram, memory, gpu, opsys, weight, resolution, clockspeed, cpubrand, cputype
-        ]
-        
-        # Convert the features to a numpy array
-        features = np.array(features).reshape(1, -1)
-
-        # Make the prediction
-        prediction = model.predict(features)
-        return prediction
+        # Timed as one stage; encoding, conversion, model and cache are timed inside
+        with latency.timer('predict_price'):
+            # Encode the inputs with the same vocabularies the model was trained on
+            features, error = encoder.encode_record(input_data)
+
+            # Check for missing or invalid values in the features
+            if error:
+                log_prediction(input_data, features, None, start, error)
+                st.error("Please fill all the fields correctly.")
+                return None
+
+            # With explain, return the prediction and the per-feature contributions
+            # it is the sum of (one booster call, memoized per encoded input)
+            if explain:
+                prediction, contributions = prediction_cache.explain(model, features)
+                log_prediction(input_data, features, prediction[0], start)
+                return prediction, contributions
+
+            # Make the prediction (cached per encoded feature vector)
+            prediction = prediction_cache.predict(model, features)
+            log_prediction(input_data, features, prediction[0], start)
+            return prediction
     except Exception as e:
         st.error(f"Error during prediction: {e}")
         return None
 
 # Laptop care and usage tips based on the selected brand
 def laptop_tips(company):
-    tips = {
-        "Apple": [
-            "📱 Always use a soft microfiber cloth to clean your MacBook screen and keyboard.",
-            "🔒 Regularly back up your data with Time Machine or iCloud.",
-            "🌡️ Avoid exposing your MacBook to extreme temperatures to preserve battery life."
-        ],
-        "HP": [
-            "🌀 Keep the laptop vents clear to prevent overheating.",
-            "🔄 Regularly update your HP software to ensure better performance.",
-            "❄️ Use an HP recommended laptop cooler for extended use to maintain optimal performance."
-        ],
-        "Acer": [
-            "💡 Use Acer’s built-in care tools for battery health management.",
-            "🧹 Clean the keyboard and screen with a soft cloth regularly.",
-            "⚖️ Avoid putting heavy pressure on your Acer laptop to prevent screen damage."
-        ],
-        "Asus": [
-            "🔧 Ensure your Asus laptop runs its regular diagnostics for better performance.",
-            "🧹 Regularly clean the fans to avoid dust buildup and overheating.",
-            "🔋 Adjust screen brightness to save battery when not plugged in."
-        ],
-        "Dell": [
-            "🔋 Use Dell's Power Manager to improve battery life.",
-            "🌬️ Keep your Dell laptop in a well-ventilated area to prevent heating.",
-            "🔄 Make use of Dell SupportAssist for updates and maintenance."
-        ],
-        "Lenovo": [
-            "🔧 Use Lenovo Vantage for driver and software updates.",
-            "🔋 Periodically check your Lenovo laptop's battery health.",
-            "🧹 Keep your laptop's cooling vents clean to avoid overheating."
-        ],
-        "Chuwi": [
-            "🧹 Clean the device gently with a soft cloth.",
-            "🛠️ Update Chuwi drivers for optimal performance.",
-            "🌬️ Ensure proper ventilation to prevent overheating during long usage."
-        ],
-        "MSI": [
-            "⚙️ Use MSI Dragon Center to adjust performance settings for gaming.",
-            "🧹 Regularly clean your laptop’s fans to prevent overheating.",
-            "❄️ Use a cooling pad for better thermal performance when gaming."
-        ],
-        "Microsoft": [
-            "🔄 Use Windows Update to keep your Surface running smoothly.",
-            "🔋 Always charge your Microsoft laptop when the battery goes below 20%.",
-            "🧼 Clean the Surface screen using a microfiber cloth to prevent scratches."
-        ],
-        "Toshiba": [
-            "🖥️ Use Toshiba PC Health Monitor to keep your laptop in good health.",
-            "🔒 Regularly back up data using Toshiba's backup software.",
-            "❄️ Keep the laptop cool using a cooling pad or by elevating the rear."
-        ]
-    }
-    return tips.get(company, ["No tips available for this brand."])
+    return NEW_APP_CARE_TIPS.get(company, ["No tips available for this brand."])
 
 # Streamlit UI elements
 st.set_page_config(page_title="Laptop Price Prediction", page_icon="💻")
 
-st.image("ai.webp", width=500)
+# Header image, resized and encoded once per process instead of on every rerun
+st.image(load_image(HEADER_IMAGE_PATH, 500), width=500)
 # Add custom styling using HTML and CSS
 st.markdown(""" 
     <style>
@@ -229,29 +140,41 @@ st.markdown('<div class="title">Laptop Price Prediction & Care Tips 💻</div>',
 
 
 
-# Input Form Section
-st.markdown('<div class="form-container">', unsafe_allow_html=True)
-
-col1, col2, col3 = st.columns(3)
-with col1:
-    company = st.selectbox('🏢 Company', ['Apple', 'HP', 'Acer', 'Asus', 'Dell', 'Lenovo', 'Chuwi', 'MSI', 'Microsoft', 'Toshiba'])
-    typename = st.selectbox('💼 Type', ['Ultrabook', 'Notebook', 'Gaming', '2 in 1 Convertible', 'Workstation', 'Netbook'])
-    ram = st.selectbox('💾 RAM', ['8GB', '4GB', '16GB', '6GB', '12GB', '2GB', '32GB', '64GB', '24GB', '1GB'])
-    memory = st.selectbox('💾 Storage', ['128GB SSD', '128GB Flash Storage', '256GB SSD', '512GB SSD', '500GB HDD', '256GB Flash Storage', '1TB HDD', '128GB SSD + 1TB HDD', '256GB Flash Storage'])
-with col2:
-    gpu = st.selectbox('🖥️ GPU', ['Intel Iris Plus Graphics 640', 'Intel HD Graphics 6000', 'Intel HD Graphics 620', 'AMD Radeon Pro 455'])
-    opsys = st.selectbox('🖥️ Operating System', ['macOS', 'No OS', 'Windows 10', 'Mac OS X', 'Linux', 'Windows 10 S', 'Chrome OS', 'Windows 7', 'Android'])
-    inches = st.number_input('📏 Screen Size (Inches)', min_value=10.0, max_value=17.0, step=0.1)
-    weight = st.number_input('⚖️ Weight (kg)', min_value=0.5, max_value=5.0, step=0.1)
-with col3:
-    resolution = st.selectbox('🖥️ Screen Resolution', ['1366x768', '1920x1080', '3840x2160', '3200x1800', '2560x1600', '1920x1200', '1600x900', '2560x1440'])
-    clockspeed = st.number_input('🖥️ Clock Speed (GHz)', min_value=1.0, max_value=5.0, step=0.1)
-    cpubrand = st.selectbox('🔧 CPU Brand', ['Intel', 'AMD', 'Samsung'])
-    cputype = st.selectbox('🔧 CPU Type', ['i3', 'i5', 'i7'])
-
-# Prediction Button
-st.markdown("</div>", unsafe_allow_html=True)
-if st.button('🔍 Predict Price', key="predict_button", help="Click to predict laptop price", use_container_width=True):
+# Input form, results and the what-if panel. The inputs are batched into a
+# form, so editing them doesn't rerun anything; pressing Predict or using the
+# what-if panel reruns only this fragment, not the header, image and CSS.
+@st.fragment
+def pricing_panel():
+    # Input Form Section
+    st.markdown('<div class="form-container">', unsafe_allow_html=True)
+
+    with st.form('specs', border=False):
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            company = st.selectbox('🏢 Company', encoder.options('Company'))
+            typename = st.selectbox('💼 Type', encoder.options('TypeName'))
+            ram = st.selectbox('💾 RAM', encoder.options('Ram'))
+            memory = st.selectbox('💾 Storage', MEMORY_OPTIONS[:8])
+        with col2:
+            gpu = st.selectbox('🖥️ GPU', encoder.options('Gpu'))
+            opsys = st.selectbox('🖥️ Operating System', encoder.options('OpSys'))
+            inches = st.number_input('📏 Screen Size (Inches)', min_value=10.0, max_value=17.0, step=0.1)
+            weight = st.number_input('⚖️ Weight (kg)', min_value=0.5, max_value=5.0, step=0.1)
+        with col3:
+            resolution = st.selectbox('🖥️ Screen Resolution', encoder.options('ResolutionCategory'))
+            clockspeed = st.number_input('🖥️ Clock Speed (GHz)', min_value=1.0, max_value=5.0, step=0.1)
+            cpubrand = st.selectbox('🔧 CPU Brand', encoder.options('CPU_Brand'))
+            cputype = st.selectbox('🔧 CPU Type', encoder.options('CPU_Type'))
+
+        # Per-feature breakdown of the price (needs the xgboost backend)
+        show_breakdown = st.checkbox('🧮 Show price breakdown', disabled=not hasattr(model, 'contributions'))
+
+        # Prediction Button
+        submitted = st.form_submit_button('🔍 Predict Price', key="predict_button",
+                                          help="Click to predict laptop price", use_container_width=True)
+
+    st.markdown("</div>", unsafe_allow_html=True)
+    # Prepare input data for prediction
     input_data = {
         'Company': company,
         'TypeName': typename,
@@ -267,13 +190,58 @@ if st.button('🔍 Predict Price', key="predict_button", help="Click to predict
         'CPU_Type': cputype
     }
 
-    price = predict_price(input_data)
-
-    if price:
-        st.markdown(f'<div class="output">Predicted Price: ₹ {price[0]:,.2f}</div>', unsafe_allow_html=True)
-
-    # Display care tips
-    st.markdown('<div class="tips"><h3>Laptop Care Tips 📑</h3>', unsafe_allow_html=True)
-    tips = laptop_tips(company)
-    for tip in tips:
-        st.markdown(f"<p>{tip}</p>", unsafe_allow_html=True)
+    # Keep showing the result while the what-if panel reruns the fragment; the
+    # form's values only change when it is submitted again
+    if submitted:
+        st.session_state['priced'] = True
+    if st.session_state.get('priced'):
+        if show_breakdown:
+            price, contributions = predict_price(input_data, explain=True) or (None, None)
+        else:
+            price, contributions = predict_price(input_data), None
+
+        if price:
+            st.markdown(f'<div class="output">Predicted Price: ₹ {price[0]:,.2f}</div>', unsafe_allow_html=True)
+
+            # How much each feature adds to or takes off the model's base price
+            if contributions is not None:
+                st.markdown("#### 🧮 Price breakdown")
+                st.caption(f"Base price ₹{contributions[-1]:,.0f}, plus the effect of each feature:")
+                st.bar_chart(contribution_table(contributions), x='Feature', y='Contribution', horizontal=True, sort=False)
+
+            # The closest real listings and what they actually sold for. The index
+            # (and SciPy) is loaded on the first prediction instead of at startup.
+            from comparables import load_comparables
+
+            st.markdown("#### 🔎 Comparable listings")
+            st.dataframe(load_comparables().query(encoder.encode_record(input_data)[0]), hide_index=True)
+
+        # Display care tips
+        st.markdown('<div class="tips"><h3>Laptop Care Tips 📑</h3>', unsafe_allow_html=True)
+        tips = laptop_tips(company)
+        for tip in tips:
+            st.markdown(f"<p>{tip}</p>", unsafe_allow_html=True)
+
+    # What-if: vary one or two parts of the current configuration and price every combination at once
+    with st.expander("🔀 What if I change..."):
+        varied = st.multiselect('Features to vary', FEATURE_COLUMNS, max_selections=whatif.MAX_VARIED,
+                                format_func=lambda column: column.replace('_', ' '))
+        if varied:
+            try:
+                grid = whatif.sweep(model, encoder, input_data, varied)
+            except ValueError:
+                st.error("Please fill all the fields correctly.")
+            else:
+                if len(varied) == 1:
+                    st.bar_chart(grid, x=varied[0], y='Predicted_Price', y_label='Predicted price (₹)', sort=False)
+                else:
+                    st.dataframe(whatif.as_table(grid).style.format("₹{:,.0f}", na_rep="—"))
+
+    # Debug panel with per-stage latencies (only when PRICE_LATENCY=1), kept in
+    # the fragment so it refreshes with it
+    if latency.enabled():
+        with st.expander("⏱️ Latency (debug)"):
+            st.dataframe(latency.summary(), hide_index=True)
+            st.caption(f"Cache: {prediction_cache.info()}")
+
+pricing_panel()
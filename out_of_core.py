@@ -0,0 +1,203 @@
+import os
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+
+from encoder import DATA_PATH, ENCODER_PATH, FeatureEncoder
+from features import CATEGORICAL_COLUMNS, FEATURE_COLUMNS, RAW_TEXT_COLUMNS, TARGET, clean_laptops
+from model_store import MODEL_PATH, file_sha256, trees_path, write_json
+from train import HOLDOUT_PATH, METRICS_PATH, RANDOM_STATE, TEST_SIZE, replace_atomically, save_holdout
+from tree_predictor import TreeEnsemble
+
+# Encoded shards and XGBoost's page cache go here during training
+WORK_DIR = "train_stream"
+
+# Raw rows read, cleaned and encoded at a time; with the stats sample and one
+# shard in the iterator this is what bounds memory, whatever the file size
+DEFAULT_CHUNK_SIZE = 200_000
+# The cleaning statistics (modes, medians, outlier bounds) are fitted on a
+# uniform sample of this many rows; on smaller files that is every row, so
+# they match train.py's exactly. Vocabularies always cover every row.
+STATS_SAMPLE_ROWS = 200_000
+# At most this many test rows are stored in the holdout file for update.py
+HOLDOUT_ROWS = 100_000
+# XGBRegressor's defaults, used by train.py
+DEFAULT_PARAMS = {'n_estimators': 100, 'max_depth': 6, 'learning_rate': 0.3}
+
+
+def _read_chunks(data_path, chunk_size):
+    # Text columns stay text in every chunk, whatever pandas would infer from its rows alone
+    return pd.read_csv(data_path, chunksize=chunk_size, dtype={column: str for column in RAW_TEXT_COLUMNS})
+
+
+# Cleaning statistics fitted on a uniform sample of the file (reservoir
+# sampling, kept in file order). Returns the stats and the row count.
+def fit_stats(data_path=DATA_PATH, chunk_size=DEFAULT_CHUNK_SIZE, sample_rows=STATS_SAMPLE_ROWS):
+    rng = np.random.default_rng(RANDOM_STATE)
+    sample, keys, rows = None, np.empty(0), 0
+    for chunk in _read_chunks(data_path, chunk_size):
+        rows += len(chunk)
+        sample = chunk if sample is None else pd.concat([sample, chunk])
+        keys = np.concatenate([keys, rng.random(len(chunk))])
+        if len(sample) > sample_rows:
+            keep = np.sort(np.argpartition(keys, sample_rows)[:sample_rows])
+            sample, keys = sample.iloc[keep], keys[keep]
+    _, stats = clean_laptops(sample)
+    return stats, rows
+
+
+# Labels of one categorical column in the order they were first seen. Rows are
+# encoded with these provisional codes as they stream past; remap() turns
+# them into the sorted-vocabulary codes FeatureEncoder uses once all are known.
+class _Vocabulary:
+    def __init__(self):
+        self.labels = []
+        self._index = pd.Index([], dtype=object)
+
+    def codes(self, values):
+        values = values.astype(str)
+        codes = self._index.get_indexer(values)
+        unseen = codes < 0
+        if unseen.any():
+            self.labels.extend(pd.unique(values[unseen]))
+            self._index = pd.Index(self.labels, dtype=object)
+            codes = self._index.get_indexer(values)
+        return codes
+
+    def remap(self):
+        return np.argsort(np.argsort(self.labels, kind='stable')).astype(np.float32)
+
+
+# Clean and encode the file chunk by chunk into .npy shards under work_dir,
+# split into train and test rows with a seeded draw per row (the same split
+# for any chunk size). Returns the shard paths by split and the fitted encoder.
+def encode_shards(data_path, stats, work_dir, chunk_size=DEFAULT_CHUNK_SIZE):
+    rng = np.random.default_rng(RANDOM_STATE)
+    vocabularies = {column: _Vocabulary() for column in CATEGORICAL_COLUMNS}
+    shards = {'train': [], 'test': []}
+    for i, chunk in enumerate(_read_chunks(data_path, chunk_size)):
+        cleaned, _ = clean_laptops(chunk, stats)
+        X = np.empty((len(cleaned), len(FEATURE_COLUMNS)), dtype=np.float32)
+        for j, column in enumerate(FEATURE_COLUMNS):
+            if column in vocabularies:
+                X[:, j] = vocabularies[column].codes(cleaned[column])
+            else:
+                X[:, j] = cleaned[column].to_numpy(dtype=np.float32)
+        y = cleaned[TARGET].to_numpy(dtype=np.float32)
+        test = rng.random(len(X)) < TEST_SIZE
+        for split, rows in (('train', ~test), ('test', test)):
+            if not rows.any():
+                continue
+            path = os.path.join(work_dir, f"{split}-{i:05d}")
+            np.save(f"{path}-X.npy", X[rows])
+            np.save(f"{path}-y.npy", y[rows])
+            shards[split].append(path)
+
+    encoder = FeatureEncoder({column: sorted(vocabulary.labels) for column, vocabulary in vocabularies.items()},
+                             stats)
+    remap = {FEATURE_COLUMNS.index(column): vocabulary.remap() for column, vocabulary in vocabularies.items()}
+    return shards, encoder, remap
+
+
+# One shard with its provisional category codes replaced by the encoder's
+def _load_shard(path, remap):
+    X = np.load(f"{path}-X.npy")
+    for j, codes in remap.items():
+        X[:, j] = codes[X[:, j].astype(np.intp)]
+    return X, np.load(f"{path}-y.npy")
+
+
+# Feeds the train shards to XGBoost one at a time
+class ShardIterator(xgb.DataIter):
+    def __init__(self, shards, remap, cache_prefix):
+        self.shards = shards
+        self.remap = remap
+        self._next = 0
+        super().__init__(cache_prefix=cache_prefix)
+
+    def next(self, input_data):
+        if self._next == len(self.shards):
+            return False
+        X, y = _load_shard(self.shards[self._next], self.remap)
+        input_data(data=X, label=y, feature_names=FEATURE_COLUMNS)
+        self._next += 1
+        return True
+
+    def reset(self):
+        self._next = 0
+
+
+# Same figures as train.evaluate, accumulated over the test shards
+def evaluate_shards(booster, shards, remap):
+    n = total = total_sq = sse = sae = 0.0
+    for path in shards:
+        X, y = _load_shard(path, remap)
+        errors = booster.inplace_predict(X).astype(float) - y
+        y = y.astype(float)
+        n += len(y)
+        total, total_sq = total + y.sum(), total_sq + (y ** 2).sum()
+        sse, sae = sse + (errors ** 2).sum(), sae + np.abs(errors).sum()
+    mse = sse / n
+    return {'mse': mse, 'rmse': float(np.sqrt(mse)), 'mae': sae / n, 'r2': 1 - sse / (total_sq - total ** 2 / n)}
+
+
+def _holdout(shards, remap, max_rows=HOLDOUT_ROWS):
+    parts, rows = [], 0
+    for path in shards:
+        if rows >= max_rows:
+            break
+        X, y = _load_shard(path, remap)
+        parts.append((X[:max_rows - rows], y[:max_rows - rows]))
+        rows += len(parts[-1][1])
+    return np.concatenate([X for X, _ in parts]), np.concatenate([y for _, y in parts])
+
+
+# Train from external memory. The matrix (and its page cache handles) only
+# lives in this scope, so it is freed before run() removes the cache files.
+def _train(shards, remap, work_dir, params, rounds):
+    train = xgb.ExtMemQuantileDMatrix(ShardIterator(shards, remap, os.path.join(work_dir, 'cache')))
+    booster = xgb.train({'tree_method': 'hist', 'seed': RANDOM_STATE, **params}, train, num_boost_round=rounds)
+    return booster, train.num_row()
+
+
+# train.run for files too large for memory: the CSV is cleaned and encoded in
+# chunks into shards on disk, and the booster trains from XGBoost's external
+# memory (quantized pages built from the shards, cached under work_dir), so
+# peak memory depends on chunk_size, not on the number of rows. Writes the
+# same artifacts as train.run.
+def run(data_path=DATA_PATH, model_path=MODEL_PATH, encoder_path=ENCODER_PATH, metrics_path=METRICS_PATH,
+        params=None, holdout_path=HOLDOUT_PATH, chunk_size=DEFAULT_CHUNK_SIZE, work_dir=WORK_DIR):
+    params = {**DEFAULT_PARAMS, **(params or {})}
+    rounds = params.pop('n_estimators')
+    shutil.rmtree(work_dir, ignore_errors=True)
+    os.makedirs(work_dir)
+    try:
+        start = time.perf_counter()
+        stats, rows = fit_stats(data_path, chunk_size)
+        shards, encoder, remap = encode_shards(data_path, stats, work_dir, chunk_size)
+        prepare_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        booster, train_rows = _train(shards['train'], remap, work_dir, params, rounds)
+        train_seconds = time.perf_counter() - start
+
+        metrics = {
+            'data': data_path, 'data_sha256': file_sha256(data_path), 'rows': rows,
+            'train_rows': train_rows, 'test_rows': rows - train_rows, 'xgboost': xgb.__version__,
+            'params': {**params, 'n_estimators': rounds}, 'test': evaluate_shards(booster, shards['test'], remap),
+            'prepare_seconds': prepare_seconds, 'train_seconds': train_seconds,
+            'out_of_core': {'chunk_size': chunk_size, 'stats_sample_rows': min(rows, STATS_SAMPLE_ROWS)},
+        }
+        X_test, y_test = _holdout(shards['test'], remap)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    replace_atomically(model_path, booster.save_model)
+    replace_atomically(trees_path(model_path), TreeEnsemble.from_booster(booster).save)
+    replace_atomically(encoder_path, encoder.save)
+    replace_atomically(holdout_path, lambda path: save_holdout(path, X_test, y_test))
+    replace_atomically(metrics_path, lambda path: write_json(path, metrics))
+    return metrics
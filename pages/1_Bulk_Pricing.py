@@ -0,0 +1,51 @@
+import io
+
+import streamlit as st
+import pandas as pd
+
+from features import FEATURE_COLUMNS
+from model_registry import load_deployment
+from pricing import iter_csv_predictions
+
+st.set_page_config(page_title="Bulk Laptop Pricing", page_icon="📦")
+
+# Load the pre-trained model once per process; it is shared across sessions and reruns
+try:
+    deployment = load_deployment()
+    model = deployment.model
+except Exception as e:
+    st.error(f"Error loading model: {e}")
+    st.stop()
+
+st.markdown("## 📦 Bulk Laptop Pricing")
+st.write("Upload a CSV with the columns: " + ", ".join(f"`{column}`" for column in FEATURE_COLUMNS))
+
+uploaded = st.file_uploader("Catalogue CSV", type="csv")
+# Approximate contributions keep large catalogues about as fast as plain pricing
+explain = st.checkbox("Add price breakdown columns", disabled=not hasattr(model, 'contributions'),
+                      help="One Contribution_<feature> column per feature plus Base_Price")
+if uploaded is not None:
+    output = io.StringIO()
+    failures = []
+    total = 0
+    progress = st.progress(0.0, text="Pricing...")
+    try:
+        # Each chunk is encoded in one pass and scored with a single predict call
+        for i, priced in enumerate(iter_csv_predictions(model, uploaded, explain=explain, approximate=True,
+                                                        encoder=deployment.encoder)):
+            priced.to_csv(output, header=(i == 0), index=False)
+            failures.append(priced[priced['Error'] != ''])
+            total += len(priced)
+            progress.progress(min(uploaded.tell() / max(uploaded.size, 1), 1.0), text=f"Priced {total:,} rows")
+    except ValueError as e:
+        st.error(f"Could not price this file: {e}")
+        st.stop()
+    progress.empty()
+
+    failed = pd.concat(failures) if failures else pd.DataFrame()
+    st.success(f"Priced {total - len(failed):,} of {total:,} rows")
+    if len(failed):
+        st.warning(f"{len(failed):,} rows could not be priced:")
+        st.dataframe(failed, use_container_width=True)
+
+    st.download_button("⬇️ Download priced CSV", output.getvalue(), file_name="priced_laptops.csv", mime="text/csv")
@@ -0,0 +1,58 @@
+import time
+
+import streamlit as st
+
+from market_cube import DIMENSIONS, load_cube
+
+st.set_page_config(page_title="Laptop Market", page_icon="📊")
+
+# Built from the feature store once per process and shared across sessions;
+# every filter below is answered from its cells, never from the listings
+try:
+    cube = load_cube()
+except Exception as e:
+    st.error(f"Error loading the market cube: {e}")
+    st.stop()
+
+st.markdown("## 📊 Laptop Market")
+
+with st.sidebar:
+    st.markdown("### Filters")
+    filters = {dimension: st.multiselect(dimension, cube.labels(dimension)) for dimension in DIMENSIONS}
+    if st.button("Refresh from the feature store"):
+        cube = load_cube(refresh=True)
+
+left, right = st.columns(2)
+by = left.selectbox("Break down by", DIMENSIONS)
+against = right.selectbox("Median price by", [dimension for dimension in DIMENSIONS if dimension != by])
+
+start = time.perf_counter()
+summary = cube.summary(filters)
+table = cube.group([by], filters)
+distribution = cube.price_distribution(filters)
+pivot = cube.group([by, against], filters).pivot(index=by, columns=against, values='Median')
+query_ms = (time.perf_counter() - start) * 1000
+if summary is None:
+    st.warning("No listings match these filters.")
+    st.stop()
+
+col1, col2, col3, col4 = st.columns(4)
+col1.metric("Listings", f"{summary['Listings']:,.0f}")
+col2.metric("Median price", f"₹{summary['Median']:,.0f}")
+col3.metric("Middle 50%", f"₹{summary['P25'] / 1000:,.0f}k – {summary['P75'] / 1000:,.0f}k")
+col4.metric("Model error (MAE)", f"₹{summary['MAE']:,.0f}",
+            help=f"Mean predicted ₹{summary['Mean_Predicted']:,.0f} against a mean price of ₹{summary['Mean_Price']:,.0f}")
+
+st.markdown(f"#### By {by}")
+st.bar_chart(table.head(25), x=by, y=['Mean_Price', 'Mean_Predicted'], y_label='Price (₹)', stack=False)
+st.dataframe(table.style.format({column: '{:,.0f}' for column in table.columns if column != by}),
+             use_container_width=True, hide_index=True)
+
+st.markdown("#### Price distribution")
+st.bar_chart(distribution, x='Price', y='Listings')
+
+st.markdown(f"#### Median price by {by} and {against}")
+st.dataframe(pivot.style.format('{:,.0f}', na_rep=''), use_container_width=True)
+
+st.caption(f"{cube.rows:,} listings pre-aggregated into {cube.cells:,} cells; "
+           f"these figures were computed from them in {query_ms:.1f} ms")
@@ -0,0 +1,156 @@
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+import latency
+
+# Set to a file path to share cached prices between worker processes
+CACHE_DB_ENV = "PRICE_CACHE_DB"
+
+DEFAULT_MAXSIZE = 10_000
+# Numeric features are rounded to this many decimals before keying the cache
+DEFAULT_DECIMALS = 2
+
+_caches = {}
+_lock = threading.Lock()
+
+
+# Bounded LRU cache of predicted prices keyed on the encoded feature vector.
+# Entries belong to one model signature and are dropped as soon as a model with
+# a different signature is passed in. With db_path set, misses fall through to
+# a SQLite file shared by every process on the machine before hitting the model.
+class PredictionCache:
+    def __init__(self, maxsize=DEFAULT_MAXSIZE, decimals=DEFAULT_DECIMALS, db_path=None):
+        self.maxsize = maxsize
+        self.decimals = decimals
+        self.db_path = db_path
+        self.hits = 0
+        self.misses = 0
+        self.signature = None
+        self._entries = OrderedDict()
+        self._contributions = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, timeout=5, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS prices (model TEXT, features BLOB, price REAL, PRIMARY KEY (model, features))"
+            )
+
+    # Round the numeric features so inputs that differ only by float noise share an entry
+    def quantize(self, features):
+        return np.round(np.asarray(features, dtype=np.float32), self.decimals)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._contributions.clear()
+            self.hits = self.misses = 0
+
+    def info(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits, 'misses': self.misses, 'size': len(self._entries), 'maxsize': self.maxsize,
+            'hit_rate': self.hits / total if total else 0.0,
+        }
+
+    def _check_model(self, model):
+        if model.signature == self.signature:
+            return
+        self.clear()
+        with self._lock:
+            self.signature = model.signature
+            if self._db is not None:
+                self._db.execute("DELETE FROM prices WHERE model != ?", (model.signature,))
+
+    def _get(self, key):
+        price = self._entries.get(key)
+        if price is not None:
+            self._entries.move_to_end(key)
+            return price
+        if self._db is not None:
+            row = self._db.execute(
+                "SELECT price FROM prices WHERE model = ? AND features = ?", (self.signature, key)
+            ).fetchone()
+            if row is not None:
+                self._put(key, row[0])
+                return row[0]
+        return None
+
+    def _put(self, key, price):
+        self._entries[key] = price
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    # Cached price for one encoded row, or None
+    def get(self, model, features):
+        with latency.timer('cache_get'):
+            self._check_model(model)
+            key = self.quantize(features).tobytes()
+            with self._lock:
+                price = self._get(key)
+                if price is None:
+                    self.misses += 1
+                else:
+                    self.hits += 1
+                return price
+
+    def put(self, model, features, price):
+        with latency.timer('cache_put'):
+            self._check_model(model)
+            key = self.quantize(features).tobytes()
+            with self._lock:
+                self._put(key, price)
+                if self._db is not None:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO prices (model, features, price) VALUES (?, ?, ?)",
+                        (self.signature, key, price),
+                    )
+
+    # Return model.predict(features) for a single encoded row, from the cache when possible
+    def predict(self, model, features):
+        price = self.get(model, features)
+        if price is not None:
+            return np.array([price], dtype=np.float32)
+        prediction = model.predict(self.quantize(features))
+        self.put(model, features, float(prediction[0]))
+        return prediction
+
+    # Price and per-feature contributions (model.contributions) for a single
+    # encoded row. Contributions are memoized in memory only; the price they
+    # sum to also goes into the price cache.
+    def explain(self, model, features):
+        self._check_model(model)
+        key = self.quantize(features).tobytes()
+        with self._lock:
+            contributions = self._contributions.get(key)
+            if contributions is not None:
+                self._contributions.move_to_end(key)
+                self.hits += 1
+        if contributions is None:
+            contributions = model.contributions(self.quantize(features))[0]
+            with self._lock:
+                self.misses += 1
+                self._contributions[key] = contributions
+                if len(self._contributions) > self.maxsize:
+                    self._contributions.popitem(last=False)
+            self.put(model, features, float(contributions.sum()))
+        return np.array([contributions.sum()], dtype=np.float32), contributions
+
+
+# Process-wide cache shared by every Streamlit session; the on-disk store is
+# enabled by setting PRICE_CACHE_DB
+def load_cache(db_path=None):
+    db_path = db_path or os.environ.get(CACHE_DB_ENV)
+    cache = _caches.get(db_path)
+    if cache is not None:
+        return cache
+    with _lock:
+        if db_path not in _caches:
+            _caches[db_path] = PredictionCache(db_path=db_path)
+        return _caches[db_path]
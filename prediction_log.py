@@ -0,0 +1,299 @@
+import argparse
+import atexit
+import glob
+import gzip
+import heapq
+import itertools
+import json
+import logging
+import os
+import queue
+import shutil
+import socket
+import sys
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from features import FEATURE_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+# Directory the prediction log is written to; set to 0 to turn logging off
+LOG_ENV = "PREDICTION_LOG"
+LOG_DIR = "logs"
+
+# A segment is closed and a new one started past either limit
+DEFAULT_MAX_BYTES = 64 * 1024 ** 2
+DEFAULT_MAX_SECONDS = 3600
+# The writer thread wakes up at least this often to write out queued records
+DEFAULT_FLUSH_INTERVAL = 0.5
+# Records beyond this many waiting to be written are dropped (and counted)
+# rather than letting a stalled disk grow memory without bound
+DEFAULT_MAX_PENDING = 100_000
+
+_STOP = object()
+_logs = {}
+_lock = threading.Lock()
+
+
+def _enabled_directory():
+    directory = os.environ.get(LOG_ENV, LOG_DIR)
+    return None if directory in ('', '0') else directory
+
+
+# Append-only JSON-lines log of predictions. log() only puts the record on a
+# queue (no lock, no I/O, no serialization), so it costs the caller a few
+# microseconds; a daemon thread serializes and writes whatever is queued in one
+# go at least every flush_interval. Every process writes its own segment files
+# (named after the host, pid and start time), so any number of app sessions,
+# service workers and processes can log into one directory without
+# coordinating. Segments are rotated by size and age (checked between writes)
+# and, with compress, gzipped once closed.
+class PredictionLog:
+    def __init__(self, directory=LOG_DIR, source='app', max_bytes=DEFAULT_MAX_BYTES, max_seconds=DEFAULT_MAX_SECONDS,
+                 compress=True, flush_interval=DEFAULT_FLUSH_INTERVAL, max_pending=DEFAULT_MAX_PENDING):
+        self.directory = directory
+        self.source = source
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.compress = compress
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.written = 0
+        self.dropped = 0
+        self._pid = None
+        self._queue = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    # Queue one prediction. features is the encoded row; price is None when the
+    # input was rejected (error says why).
+    def log(self, input_data, features, price, version, model, latency_seconds, error=None):
+        if self._pid != os.getpid():
+            self._start()
+        if self._queue.qsize() >= self.max_pending:
+            self.dropped += 1
+            return
+        self._queue.put((time.time(), self.source, input_data, features, price, version, model, latency_seconds,
+                         error))
+
+    # Queue a batch of predictions made together (input_data is a list of dicts,
+    # features a matrix, prices and errors one entry per row)
+    def log_many(self, records, features, prices, version, model, latency_seconds, errors=None):
+        for i, record in enumerate(records):
+            error = errors[i] if errors is not None else None
+            self.log(record, features[i], None if error else prices[i], version, model, latency_seconds, error or None)
+
+    # Block until everything queued so far is on disk (for tests, replays and shutdown)
+    def flush(self, timeout=10):
+        if self._pid != os.getpid():
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    def close(self, timeout=10):
+        if self._pid != os.getpid() or not self._thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    # (Re)start the writer for this process. A forked child inherits the
+    # parent's queue but not its thread, so it gets its own of both.
+    def _start(self):
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.SimpleQueue()
+            self._thread = threading.Thread(target=self._run, name='prediction-log', daemon=True)
+            self._pid = os.getpid()
+            self._thread.start()
+
+    def _segment_prefix(self, started):
+        return os.path.join(self.directory, f"predictions-{self.source}-{socket.gethostname()}-{os.getpid()}-"
+                                            f"{time.strftime('%Y%m%dT%H%M%S', time.localtime(started))}")
+
+    def _run(self):
+        os.makedirs(self.directory, exist_ok=True)
+        prefix = self._segment_prefix(time.time())
+        segment = itertools.count()
+        f = None
+        opened = 0.0
+        stopping = False
+        while not stopping:
+            try:
+                items = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                items = []
+            while not self._queue.empty() and len(items) < 10_000:
+                items.append(self._queue.get_nowait())
+
+            records = [item for item in items if isinstance(item, tuple)]
+            try:
+                if f is not None and (f.tell() >= self.max_bytes or time.time() - opened >= self.max_seconds):
+                    f, closing = None, f
+                    self._close_segment(closing)
+                if records:
+                    if f is None:
+                        f = open(f"{prefix}-{next(segment):04d}.jsonl", 'a', encoding='utf-8')
+                        opened = time.time()
+                    f.write(''.join(_to_line(*record) for record in records))
+                    f.flush()
+                    self.written += len(records)
+            except Exception:
+                logger.exception("Could not write %d prediction log records", len(records))
+                self.dropped += len(records)
+
+            for item in items:
+                if item is _STOP:
+                    stopping = True
+                elif isinstance(item, threading.Event):
+                    item.set()
+        if f is not None:
+            self._close_segment(f)
+
+    def _close_segment(self, f):
+        f.close()
+        if self.compress:
+            _compress(f.name)
+
+
+def _to_line(timestamp, source, input_data, features, price, version, model, latency_seconds, error):
+    return json.dumps({
+        'time': timestamp, 'source': source, 'version': version, 'model': model,
+        'input': input_data,
+        'features': None if features is None else np.round(np.asarray(features, dtype=float), 4).reshape(-1).tolist(),
+        'price': None if price is None else float(price), 'latency_ms': latency_seconds * 1000, 'error': error,
+    }, default=str) + '\n'
+
+
+# Gzip a closed segment next to itself; the rename means readers never see a partial .gz
+def _compress(path):
+    with open(path, 'rb') as src, gzip.open(f"{path}.gz.tmp", 'wb') as dst:
+        shutil.copyfileobj(src, dst)
+    os.replace(f"{path}.gz.tmp", f"{path}.gz")
+    os.remove(path)
+
+
+# Process-wide log shared by every Streamlit session, or the service. Logging
+# is on by default into logs/; PREDICTION_LOG picks another directory or, set
+# to 0, returns None.
+def load_log(source='app'):
+    directory = _enabled_directory()
+    if directory is None:
+        return None
+    key = (directory, source)
+    prediction_log = _logs.get(key)
+    if prediction_log is not None:
+        return prediction_log
+    with _lock:
+        if key not in _logs:
+            _logs[key] = PredictionLog(directory, source)
+            # Write out what is still queued when the process exits normally
+            atexit.register(_logs[key].close)
+        return _logs[key]
+
+
+# Log segments of one process, in the order they were written
+def _segments(directory):
+    paths = sorted(glob.glob(os.path.join(directory, 'predictions-*.jsonl'))
+                   + glob.glob(os.path.join(directory, 'predictions-*.jsonl.gz')))
+    series = {}
+    for path in paths:
+        name = os.path.basename(path).removesuffix('.gz').removesuffix('.jsonl')
+        prefix, number = name.rsplit('-', 1)
+        # Sorted after its .jsonl, so a segment caught mid-compression is read once, from the .gz
+        series.setdefault(prefix, {})[int(number)] = path
+    return [[files[number] for number in sorted(files)] for files in series.values()]
+
+
+def _read_segments(paths, since, until, source):
+    for path in paths:
+        opener = gzip.open if path.endswith('.gz') else open
+        try:
+            with opener(path, 'rt', encoding='utf-8') as f:
+                for line in f:
+                    # The segment being written may end in a partly written line
+                    if not line.endswith('\n'):
+                        break
+                    record = json.loads(line)
+                    if ((since is not None and record['time'] < since)
+                            or (until is not None and record['time'] >= until)
+                            or (source is not None and record['source'] != source)):
+                        continue
+                    yield record
+        except FileNotFoundError:
+            # Compressed and removed between listing and opening
+            gz_path = f"{path}.gz"
+            if os.path.exists(gz_path):
+                yield from _read_segments([gz_path], since, until, source)
+
+
+# Stream logged predictions back in time order, merging the files of every
+# process lazily, so logs much larger than memory can be read. since and until
+# are Unix timestamps; source filters on 'laptop_app', 'service', ...
+def read_log(directory=LOG_DIR, since=None, until=None, source=None):
+    streams = [_read_segments(paths, since, until, source) for paths in _segments(directory)]
+    return heapq.merge(*streams, key=lambda record: record['time'])
+
+
+# The logged inputs as DataFrames of chunk_size rows with the app's input
+# columns plus Logged_Price, Version and Time. Valid rows only, so they can go
+# straight into pricing.predict_frame for a replay or be labeled for training.
+def iter_frames(directory=LOG_DIR, chunk_size=10_000, since=None, until=None, source=None):
+    records = (record for record in read_log(directory, since, until, source) if record['error'] is None)
+    while True:
+        chunk = list(itertools.islice(records, chunk_size))
+        if not chunk:
+            return
+        frame = pd.DataFrame([record['input'] for record in chunk], columns=FEATURE_COLUMNS)
+        frame['Logged_Price'] = [record['price'] for record in chunk]
+        frame['Version'] = [record['version'] for record in chunk]
+        frame['Time'] = pd.to_datetime([record['time'] for record in chunk], unit='s')
+        yield frame
+
+
+def _timestamp(value):
+    return pd.Timestamp(value).timestamp() if value else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export or replay the logged predictions.")
+    parser.add_argument('--dir', default=_enabled_directory() or LOG_DIR, help="prediction log directory")
+    parser.add_argument('--since', help="first time to include (e.g. 2024-05-01 or 2024-05-01T12:00)")
+    parser.add_argument('--until', help="time to stop before")
+    parser.add_argument('--source', help="only predictions made by this app or the service")
+    parser.add_argument('--export', help="write the logged inputs and prices to this CSV")
+    parser.add_argument('--replay', action='store_true',
+                        help="re-price the logged inputs with the current model and compare")
+    args = parser.parse_args(argv)
+
+    since, until = _timestamp(args.since), _timestamp(args.until)
+    if args.replay:
+        from model_registry import load_deployment
+        from pricing import predict_frame
+
+        deployment = load_deployment()
+    rows = 0
+    abs_deltas = []
+    for i, frame in enumerate(iter_frames(args.dir, since=since, until=until, source=args.source)):
+        rows += len(frame)
+        if args.export:
+            frame.to_csv(args.export, mode='w' if i == 0 else 'a', header=(i == 0), index=False)
+        if args.replay:
+            priced = predict_frame(deployment.model, frame[FEATURE_COLUMNS], encoder=deployment.encoder)
+            abs_deltas.append(np.abs(priced['Predicted_Price'].to_numpy() - frame['Logged_Price'].to_numpy()))
+    print(f"{rows:,} logged predictions")
+    if args.replay and rows:
+        deltas = np.concatenate(abs_deltas)
+        deltas = deltas[~np.isnan(deltas)]
+        print(f"Replayed with {deployment.version}: mean |change| {deltas.mean():,.2f}, "
+              f"p95 {np.percentile(deltas, 95):,.2f}, max {deltas.max():,.2f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,105 @@
+import argparse
+import sys
+
+import numpy as np
+import pandas as pd
+
+from encoder import ENCODER_PATH, load_encoder
+from features import FEATURE_COLUMNS
+from model_store import MODEL_PATH, load_model
+
+# Rows scored per model.predict call in batch mode
+DEFAULT_CHUNK_SIZE = 50_000
+
+
+# Columns added by predict_frame(..., explain=True)
+CONTRIBUTION_COLUMNS = [f"Contribution_{column}" for column in FEATURE_COLUMNS] + ['Base_Price']
+
+
+# One row of model.contributions as a table of what each feature adds to the
+# base price, largest effect first
+def contribution_table(contributions):
+    contributions = np.asarray(contributions, dtype=float).ravel()
+    table = pd.DataFrame({'Feature': FEATURE_COLUMNS, 'Contribution': contributions[:-1]})
+    return table.iloc[np.argsort(-np.abs(table['Contribution'].to_numpy()), kind='stable')].reset_index(drop=True)
+
+
+# Price every row of a DataFrame. Valid rows are scored with one model.predict
+# call per chunk; invalid rows get a NaN price and an explanation in 'Error'.
+# With explain=True each chunk is scored with one model.contributions call
+# instead, adding a Contribution_<feature> column per feature and Base_Price
+# (approximate=True trades exact attributions for ~100x the speed).
+def predict_frame(model, df, chunk_size=DEFAULT_CHUNK_SIZE, explain=False, approximate=False, encoder=None):
+    if explain and not hasattr(model, 'contributions'):
+        raise ValueError("Price contributions need the xgboost model backend")
+    features, errors = (encoder or load_encoder()).encode_frame(df)
+    prices = np.full(len(df), np.nan)
+    contributions = np.full((len(df), len(CONTRIBUTION_COLUMNS)), np.nan) if explain else None
+    valid_rows = np.flatnonzero(errors == '')
+    for start in range(0, len(valid_rows), chunk_size):
+        rows = valid_rows[start:start + chunk_size]
+        if explain:
+            contributions[rows] = model.contributions(features[rows], approximate)
+            prices[rows] = contributions[rows].sum(axis=1)
+        else:
+            prices[rows] = model.predict(features[rows])
+
+    result = df.copy()
+    result['Predicted_Price'] = prices
+    if explain:
+        result[CONTRIBUTION_COLUMNS] = contributions
+    result['Error'] = errors
+    return result
+
+
+# Stream priced chunks from a CSV path or file-like object without loading the
+# whole catalogue into memory
+def iter_csv_predictions(model, source, chunk_size=DEFAULT_CHUNK_SIZE, explain=False, approximate=False,
+                         encoder=None):
+    for chunk in pd.read_csv(source, chunksize=chunk_size):
+        yield predict_frame(model, chunk, chunk_size, explain, approximate, encoder)
+
+
+# Price a CSV and write the results to destination chunk by chunk.
+# Returns the number of rows read and the number of rows that failed.
+def score_csv(model, source, destination, chunk_size=DEFAULT_CHUNK_SIZE, explain=False, approximate=False,
+              encoder=None):
+    total = failed = 0
+    for i, priced in enumerate(iter_csv_predictions(model, source, chunk_size, explain, approximate, encoder)):
+        priced.to_csv(destination, header=(i == 0), index=False)
+        total += len(priced)
+        failed += int((priced['Error'] != '').sum())
+    return total, failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Price a CSV of laptops in bulk.")
+    parser.add_argument('input', help="CSV with the same columns as the app's input_data")
+    parser.add_argument('output', nargs='?', default='-', help="output CSV (default: stdout)")
+    parser.add_argument('--model', default=MODEL_PATH, help="native XGBoost model file")
+    parser.add_argument('--encoder', default=ENCODER_PATH, help="encoder the model was trained with")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--explain', action='store_true', help="add per-feature price contribution columns")
+    parser.add_argument('--approximate', action='store_true',
+                        help="with --explain, use the much faster approximate contributions")
+    args = parser.parse_args(argv)
+
+    # Missing columns, unreadable files and --explain without xgboost are
+    # reported as one line instead of a traceback
+    try:
+        model = load_model(args.model)
+        options = (args.chunk_size, args.explain, args.approximate, load_encoder(args.encoder))
+        if args.output == '-':
+            total, failed = score_csv(model, args.input, sys.stdout, *options)
+        else:
+            with open(args.output, 'w', newline='') as destination:
+                total, failed = score_csv(model, args.input, destination, *options)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    print(f"Priced {total - failed} of {total} rows ({failed} invalid)", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
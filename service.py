@@ -0,0 +1,383 @@
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from aiohttp import web
+
+import latency
+import whatif
+from comparables import COMPARABLES_PATH, MAX_K, load_comparables
+from drift import REFERENCE_PATH, load_monitor
+from encoder import ENCODER_PATH
+from features import FEATURE_COLUMNS
+from model_registry import REGISTRY_ENV, LocalModels, load_registry, shadow_score
+from model_store import MODEL_PATH
+from prediction_cache import load_cache
+from prediction_log import load_log
+
+# Requests arriving within this window share one model.predict call
+DEFAULT_WINDOW_MS = 2.0
+DEFAULT_MAX_BATCH = 1024
+
+
+# model.predict plus how long it took, measured on the executor thread
+def _timed_predict(model, features):
+    start = time.perf_counter()
+    prices = model.predict(features)
+    return prices, time.perf_counter() - start
+
+
+# Merges concurrent prediction requests into micro-batches. Callers submit
+# encoded rows (with the deployment that encoded them) and await their prices;
+# one background task collects everything queued within the window and scores
+# it with a single model.predict call per model. Right after a hot-swap a batch
+# can hold rows for the old and the new version; each is priced by its own.
+# When the models have a shadow candidate, each batch is also scored by it in
+# the background; a batch is skipped rather than queued if the candidate is
+# still busy with the previous one, so shadowing never delays responses.
+class MicroBatcher:
+    def __init__(self, models, window_ms=DEFAULT_WINDOW_MS, max_batch=DEFAULT_MAX_BATCH):
+        self.models = models
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.batches = 0
+        self.rows = 0
+        self._queue = asyncio.Queue()
+        self._task = None
+        self._shadow_job = None
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+    async def predict(self, features, deployment=None):
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((features, deployment or self.models.current(), future))
+        return await future
+
+    async def _collect(self):
+        batch = [await self._queue.get()]
+        rows = len(batch[0][0])
+        # Wait for more callers unless the queue can already fill a batch
+        if self.window > 0 and rows + self._queue.qsize() < self.max_batch:
+            await asyncio.sleep(self.window)
+        while rows < self.max_batch and not self._queue.empty():
+            item = self._queue.get_nowait()
+            batch.append(item)
+            rows += len(item[0])
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            groups = {}
+            for item in batch:
+                groups.setdefault(id(item[1].model), []).append(item)
+            for items in groups.values():
+                await self._score(items)
+
+    async def _score(self, batch):
+        loop = asyncio.get_running_loop()
+        deployment = batch[0][1]
+        try:
+            features = np.concatenate([features for features, _, _ in batch])
+            # Scoring runs off the event loop, so the next batch keeps filling meanwhile
+            prices, seconds = await loop.run_in_executor(None, _timed_predict, deployment.model, features)
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.rows += len(features)
+        offset = 0
+        for rows, _, future in batch:
+            if not future.done():
+                future.set_result(prices[offset:offset + len(rows)])
+            offset += len(rows)
+        self._shadow(deployment, features, prices, seconds)
+
+    def _shadow(self, deployment, features, prices, seconds):
+        candidate = self.models.shadow()
+        stats = self.models.shadow_stats
+        if (candidate is None or stats is None or stats.shadow_version != candidate.version
+                or stats.active_version != deployment.version):
+            return
+        if self._shadow_job is not None and not self._shadow_job.done():
+            stats.skipped_batches += 1
+            return
+        self._shadow_job = asyncio.get_running_loop().run_in_executor(
+            None, shadow_score, candidate, deployment, features, prices, seconds, stats)
+        self._shadow_job.add_done_callback(_log_shadow_error)
+
+
+def _log_shadow_error(job):
+    if not job.cancelled() and job.exception() is not None:
+        logging.getLogger(__name__).error("Shadow scoring failed", exc_info=job.exception())
+
+
+# Feature values must be JSON scalars; a list or object would otherwise reach
+# the encoder's lookups and fail there with a server error
+def _non_scalar_error(record):
+    fields = [column for column in FEATURE_COLUMNS if isinstance(record.get(column), (dict, list))]
+    return f"{', '.join(fields)} must be a string or number" if fields else None
+
+
+async def predict_one(request):
+    start = time.perf_counter()
+    app = request.app
+    try:
+        record = await request.json()
+    except ValueError:
+        return web.json_response({'error': "Body must be a JSON object"}, status=400)
+    if not isinstance(record, dict):
+        return web.json_response({'error': "Body must be a JSON object"}, status=400)
+    error = _non_scalar_error(record)
+    if error:
+        return web.json_response({'error': error}, status=400)
+    # ?comparables=k adds the k closest real listings
+    k = request.query.get('comparables')
+    if k is not None and not (k.isdigit() and 1 <= int(k) <= MAX_K):
+        return web.json_response({'error': f"comparables must be a whole number from 1 to {MAX_K}"}, status=400)
+
+    deployment = app['models'].current()
+    features, error = deployment.encoder.encode_record(record)
+    prediction_log = app['prediction_log']
+    if error:
+        app['drift'].observe(record, features, None, deployment.encoder)
+        if prediction_log is not None:
+            prediction_log.log(record, features, None, deployment.version, deployment.model.signature,
+                               time.perf_counter() - start, error)
+        return web.json_response({'price': None, 'error': error}, status=422)
+
+    cache = app['cache']
+    price = cache.get(deployment.model, features)
+    if price is None:
+        price = float((await app['batcher'].predict(cache.quantize(features), deployment))[0])
+        cache.put(deployment.model, features, price)
+    app['drift'].observe(record, features, price, deployment.encoder)
+    if prediction_log is not None:
+        prediction_log.log(record, features, price, deployment.version, deployment.model.signature,
+                           time.perf_counter() - start)
+    response = {'price': price, 'error': None}
+    if k is not None:
+        response['comparables'] = load_comparables(app['comparables_path']).query(features, int(k))
+    return web.json_response(response)
+
+
+async def predict_batch(request):
+    start = time.perf_counter()
+    app = request.app
+    try:
+        records = await request.json()
+    except ValueError:
+        return web.json_response({'error': "Body must be a JSON list of objects"}, status=400)
+    if not isinstance(records, list) or not all(isinstance(record, dict) for record in records):
+        return web.json_response({'error': "Body must be a JSON list of objects"}, status=400)
+    if not records:
+        return web.json_response({'results': []})
+    for i, record in enumerate(records):
+        error = _non_scalar_error(record)
+        if error:
+            return web.json_response({'error': f"Row {i}: {error}"}, status=400)
+
+    deployment = app['models'].current()
+    try:
+        features, errors = deployment.encoder.encode_frame(pd.DataFrame.from_records(records))
+    except ValueError as e:
+        return web.json_response({'error': str(e)}, status=422)
+
+    prices = np.full(len(records), np.nan)
+    valid_rows = np.flatnonzero(errors == '')
+    if len(valid_rows):
+        prices[valid_rows] = await app['batcher'].predict(features[valid_rows], deployment)
+    app['drift'].observe_many(records, features, prices, deployment.encoder)
+    if app['prediction_log'] is not None:
+        app['prediction_log'].log_many(records, features, prices, deployment.version, deployment.model.signature,
+                                       time.perf_counter() - start, errors)
+    results = [
+        {'price': None if error else float(price), 'error': error or None}
+        for price, error in zip(prices, errors)
+    ]
+    return web.json_response({'results': results})
+
+
+# Why a /whatif body is malformed, or None: vary must list feature names and
+# values map feature names to lists of scalars
+def _whatif_error(body):
+    if (not isinstance(body, dict) or not isinstance(body.get('record'), dict)
+            or not isinstance(body.get('vary'), list)):
+        return "Body must be a JSON object with 'record' and 'vary'"
+    if not all(isinstance(column, str) and column in FEATURE_COLUMNS for column in body['vary']):
+        return f"'vary' must be a list of feature names ({', '.join(FEATURE_COLUMNS)})"
+    values = body.get('values') or {}
+    if not isinstance(values, dict) or not all(
+            column in FEATURE_COLUMNS and isinstance(axis, list)
+            and not any(isinstance(value, (dict, list)) for value in axis) for column, axis in values.items()):
+        return "'values' must map feature names to lists of strings or numbers"
+    return _non_scalar_error(body['record'])
+
+
+# Price one configuration with one or two features varied:
+# {"record": {...}, "vary": ["Ram", "Memory"], "values": {"Ram": ["8GB", "16GB"]}}
+# ("values" is optional; by default every option or a numeric range is tried)
+async def predict_whatif(request):
+    app = request.app
+    try:
+        body = await request.json()
+    except ValueError:
+        body = None
+    error = _whatif_error(body)
+    if error:
+        return web.json_response({'error': error}, status=400)
+
+    deployment = app['models'].current()
+    try:
+        grid = whatif.sweep(deployment.model, deployment.encoder, body['record'], body['vary'], body.get('values'))
+    except ValueError as e:
+        return web.json_response({'error': str(e)}, status=422)
+    grid = grid.astype(object).where(grid.notna(), None)
+    return web.json_response({'columns': list(grid.columns), 'rows': grid.to_numpy().tolist()})
+
+
+def _log_counts(prediction_log):
+    if prediction_log is None:
+        return None
+    return {'written': prediction_log.written, 'dropped': prediction_log.dropped}
+
+
+# Served version, batching and cache counters, and the shadow comparison when
+# a candidate is being shadow-scored
+async def health(request):
+    models = request.app['models']
+    deployment = models.current()
+    batcher = request.app['batcher']
+    return web.json_response({
+        'status': 'ok', 'version': deployment.version, 'model': deployment.model.signature,
+        'batches': batcher.batches, 'rows': batcher.rows, 'cache': request.app['cache'].info(),
+        'shadow': models.shadow_stats.summary() if models.shadow() is not None else None,
+        'log': _log_counts(request.app['prediction_log']),
+    })
+
+
+# How far recent inputs and prices have moved from laptop.csv: PSI per
+# feature, share of unknown labels and out-of-range numbers, top unknown labels
+async def drift_scores(request):
+    return web.json_response(request.app['drift'].scores())
+
+
+# Prometheus text: per-stage latency summaries plus batching and cache counters
+async def metrics(request):
+    cache = request.app['cache'].info()
+    batcher = request.app['batcher']
+    counters = {
+        'price_batches_total': batcher.batches, 'price_batch_rows_total': batcher.rows,
+        'price_cache_hits_total': cache['hits'], 'price_cache_misses_total': cache['misses'],
+    }
+    gauges = {'price_cache_size': cache['size']}
+    drift = request.app['drift'].scores()
+    gauges['drift_max_psi'] = drift['max_psi'] or 0.0
+    gauges['drift_drifted_features'] = len(drift['drifted'])
+    if request.app['prediction_log'] is not None:
+        counters['prediction_log_written_total'] = request.app['prediction_log'].written
+        counters['prediction_log_dropped_total'] = request.app['prediction_log'].dropped
+    if request.app['models'].shadow() is not None:
+        shadow = request.app['models'].shadow_stats.summary()
+        counters.update({'shadow_rows_total': shadow['rows'], 'shadow_skipped_batches_total': shadow['skipped_batches']})
+        gauges.update({
+            'shadow_mean_abs_delta': shadow['mean_abs_delta'],
+            'shadow_relative_delta_p95': shadow['p95_relative_delta'],
+        })
+    return web.Response(text=latency.prometheus_text(gauges, counters), content_type='text/plain', charset='utf-8')
+
+
+# With registry_dir the registry's active version is served (and hot-swapped
+# when the pointer moves); otherwise model_path and encoder_path
+def create_app(model_path=MODEL_PATH, encoder_path=ENCODER_PATH, window_ms=DEFAULT_WINDOW_MS,
+               max_batch=DEFAULT_MAX_BATCH, comparables_path=COMPARABLES_PATH, registry_dir=None,
+               drift_reference_path=REFERENCE_PATH):
+    app = web.Application(client_max_size=64 * 1024 ** 2)
+    app['models'] = load_registry(registry_dir) if registry_dir else LocalModels(model_path, encoder_path)
+    app['cache'] = load_cache()
+    app['prediction_log'] = load_log('service')
+    app['drift'] = load_monitor(drift_reference_path)
+    app['comparables_path'] = comparables_path
+    load_comparables(comparables_path)
+    app['models'].current()
+
+    async def start_batcher(app):
+        app['batcher'] = MicroBatcher(app['models'], window_ms, max_batch)
+        app['batcher'].start()
+
+    async def stop_batcher(app):
+        await app['batcher'].stop()
+
+    app.on_startup.append(start_batcher)
+    app.on_cleanup.append(stop_batcher)
+    app.router.add_post('/predict', predict_one)
+    app.router.add_post('/predict/batch', predict_batch)
+    app.router.add_post('/whatif', predict_whatif)
+    app.router.add_get('/health', health)
+    app.router.add_get('/metrics', metrics)
+    app.router.add_get('/drift', drift_scores)
+    return app
+
+
+def serve(args):
+    logging.basicConfig(level=logging.INFO, format="%(process)d %(levelname)s %(message)s")
+    if args.latency:
+        latency.enable()
+    app = create_app(args.model, args.encoder, args.window_ms, args.max_batch, registry_dir=args.registry)
+    # reuse_port lets every worker process accept on the same port (Linux)
+    web.run_app(app, host=args.host, port=args.port, reuse_port=args.workers > 1, access_log=None,
+                print=None if args.workers > 1 else print)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve laptop price predictions over HTTP.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--workers', type=int, default=1, help="number of worker processes")
+    parser.add_argument('--window-ms', type=float, default=DEFAULT_WINDOW_MS,
+                        help="how long to wait for more requests before scoring a micro-batch")
+    parser.add_argument('--max-batch', type=int, default=DEFAULT_MAX_BATCH, help="rows per micro-batch")
+    parser.add_argument('--model', default=MODEL_PATH)
+    parser.add_argument('--encoder', default=ENCODER_PATH)
+    parser.add_argument('--registry', default=os.environ.get(REGISTRY_ENV),
+                        help=f"serve the active version of this model registry instead of --model/--encoder "
+                             f"(default ${REGISTRY_ENV})")
+    parser.add_argument('--latency', action='store_true',
+                        help=f"record per-stage latencies for /metrics (same as {latency.LATENCY_ENV}=1)")
+    args = parser.parse_args(argv)
+
+    if args.workers == 1:
+        serve(args)
+        return 0
+    workers = [multiprocessing.Process(target=serve, args=(args,)) for _ in range(args.workers)]
+    for worker in workers:
+        worker.start()
+    print(f"Serving on http://{args.host}:{args.port} with {args.workers} workers")
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        for worker in workers:
+            worker.terminate()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,98 @@
+import argparse
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from encoder import DATA_PATH
+from features import TARGET
+
+SYNTHETIC_PATH = "laptop_synthetic.csv"
+
+# Columns written, the raw laptop.csv columns without the two index columns
+RAW_COLUMNS = ['Company', 'TypeName', 'Inches', 'ScreenResolution', 'Cpu', 'Ram', 'Memory', 'Gpu', 'OpSys', 'Weight',
+               TARGET]
+
+# Rows generated and written per step; memory is bounded by this, not by the total
+DEFAULT_CHUNK_SIZE = 500_000
+# Share of rows whose RAM and storage are taken from another laptop of the same
+# type, with the price scaled by how RAM moves the median price
+MIX_FRACTION = 0.3
+# Log-normal noise on weight and price, so rows are not exact copies
+WEIGHT_NOISE = 0.03
+PRICE_NOISE = 0.08
+
+
+# Generates laptop rows in laptop.csv's raw format from the real listings.
+# Each row starts from a random real listing, so the joint distribution of
+# brand, type, screen, CPU, GPU and OS is kept, including the blank rows and
+# odd values the cleaning has to deal with. Some rows get the RAM and storage
+# of another laptop of the same type, and weights and prices are jittered.
+class LaptopSynthesizer:
+    def __init__(self, templates, seed=0):
+        templates = templates[RAW_COLUMNS].sort_values('TypeName', kind='stable').reset_index(drop=True)
+        self.columns = {column: templates[column].to_numpy(dtype=object) for column in RAW_COLUMNS}
+        self.weight = pd.to_numeric(templates['Weight'].str.replace('kg', '', regex=False), errors='coerce').to_numpy()
+        self.price = templates[TARGET].to_numpy(dtype=float)
+        # Templates of the same type are contiguous: donors are drawn from [start, start + size)
+        types = templates['TypeName'].fillna('').to_numpy()
+        _, starts, sizes = np.unique(types, return_index=True, return_counts=True)
+        group = np.searchsorted(starts, np.arange(len(types)), side='right') - 1
+        self.group_start, self.group_size = starts[group], sizes[group]
+        # Median price of each RAM size relative to the overall median
+        ram_factor = templates.groupby('Ram')[TARGET].median() / templates[TARGET].median()
+        self.ram_factor = templates['Ram'].map(ram_factor).fillna(1.0).to_numpy()
+        self.rng = np.random.default_rng(seed)
+
+    @classmethod
+    def from_csv(cls, path=DATA_PATH, seed=0):
+        return cls(pd.read_csv(path), seed)
+
+    # n synthetic rows as a DataFrame with the raw columns
+    def sample(self, n):
+        rng = self.rng
+        rows = rng.integers(len(self.price), size=n)
+        donors = self.group_start[rows] + (rng.random(n) * self.group_size[rows]).astype(np.intp)
+        donors = np.where(rng.random(n) < MIX_FRACTION, donors, rows)
+
+        frame = pd.DataFrame({column: values[rows] for column, values in self.columns.items()})
+        frame['Ram'] = self.columns['Ram'][donors]
+        frame['Memory'] = self.columns['Memory'][donors]
+
+        # Weights are written with two decimals, looked up rather than formatted row by row.
+        # Unparseable weights ('?') and blank rows are kept as they were.
+        weight = self.weight[rows] * rng.lognormal(0, WEIGHT_NOISE, n)
+        known = ~np.isnan(weight)
+        centigrams = np.round(weight[known] * 100).astype(np.intp)
+        labels = np.array([f"{c / 100:g}kg" for c in range(centigrams.max(initial=0) + 1)], dtype=object)
+        frame.loc[known, 'Weight'] = labels[centigrams]
+        price = self.price[rows] * self.ram_factor[donors] / self.ram_factor[rows] * rng.lognormal(0, PRICE_NOISE, n)
+        frame[TARGET] = price.round(2)
+        return frame
+
+    # Write n rows to path, chunk_size rows at a time
+    def write_csv(self, path, n, chunk_size=DEFAULT_CHUNK_SIZE):
+        for offset in range(0, n, chunk_size):
+            chunk = self.sample(min(chunk_size, n - offset))
+            chunk.to_csv(path, mode='w' if offset == 0 else 'a', header=(offset == 0), index=False)
+        return n
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate synthetic laptop listings in laptop.csv's format.")
+    parser.add_argument('--rows', type=float, default=1e6, help="rows to generate (e.g. 1e6, 1e8)")
+    parser.add_argument('--data', default=DATA_PATH, help="real listings the rows are drawn from")
+    parser.add_argument('--output', default=SYNTHETIC_PATH)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    rows = LaptopSynthesizer.from_csv(args.data, args.seed).write_csv(args.output, int(args.rows), args.chunk_size)
+    print(f"Wrote {rows:,} rows to {args.output} in {time.perf_counter() - start:.1f}s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,50 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+xgb = pytest.importorskip('xgboost')
+
+from compact import pareto_front, pick_variant, prune
+from encoder import FeatureEncoder
+from features import TARGET, clean_laptops
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _report(batch_us_per_row):
+    report = pd.DataFrame({
+        'variant': ['full', 'rounds=10', 'rounds=20', 'depth=3'],
+        'rmse': [11_710.0, 11_797.0, 10_929.0, 14_390.0],
+        'batch_us_per_row': batch_us_per_row,
+        'size_bytes': [318_006, 42_059, 76_519, 113_981],
+        'nodes': [7382, 1008, 1828, 1382],
+    })
+    report['pareto'] = pareto_front(report)
+    return report
+
+
+# The timings of close variants swap places from run to run; the pick must not
+def test_pick_does_not_depend_on_timings():
+    picks = {pick_variant(_report(timings), 0.01)
+             for timings in ([1.7, 0.45, 0.90, 0.95], [1.7, 0.90, 0.45, 0.95], [0.1, 2.0, 3.0, 0.2])}
+    assert picks == {'rounds=10'}
+
+
+def test_pick_stays_within_tolerance():
+    assert pick_variant(_report([1.7, 0.45, 0.90, 0.95]), 0.001) == 'rounds=20'
+
+
+def test_prune_limits_depth_and_keeps_predictions_close():
+    booster = xgb.Booster(model_file=os.path.join(ROOT, 'laptop.ubj'))
+    encoder = FeatureEncoder.load(os.path.join(ROOT, 'laptop_encoder.json'))
+    cleaned, _ = clean_laptops(pd.read_csv(os.path.join(ROOT, 'laptop.csv')), encoder.stats)
+    X, y = encoder.transform(cleaned), cleaned[TARGET].to_numpy()
+    pruned = prune(booster, X, y, 3)
+    assert pruned.num_boosted_rounds() == booster.num_boosted_rounds()
+    # A node's depth is its indentation in the text dump
+    assert max(line.count('\t') for tree in pruned.get_dump() for line in tree.splitlines()) <= 3
+    # Pruning only turns deep splits into leaves, so the prices move but follow the full model's
+    full, cut = booster.inplace_predict(X), pruned.inplace_predict(X)
+    assert np.corrcoef(full, cut)[0, 1] > 0.8
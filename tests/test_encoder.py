@@ -0,0 +1,63 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from encoder import FeatureEncoder
+from features import FEATURE_COLUMNS, clean_laptops
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope='module')
+def encoder():
+    return FeatureEncoder.load(os.path.join(ROOT, 'laptop_encoder.json'))
+
+
+@pytest.fixture(scope='module')
+def records(encoder):
+    cleaned, _ = clean_laptops(pd.read_csv(os.path.join(ROOT, 'laptop.csv')).head(50), encoder.stats)
+    return encoder.decode(encoder.transform(cleaned))
+
+
+def test_decode_inverts_transform(encoder, records):
+    features = encoder.transform(records)
+    pd.testing.assert_frame_equal(encoder.decode(features), records)
+
+
+# The single-record fast path and the batch path agree, including on invalid rows
+def test_record_and_frame_paths_agree(encoder, records):
+    records = records.astype(object)
+    records.loc[1, 'Company'] = 'Unheard-of brand'
+    records.loc[2, 'Inches'] = 'wide'
+    records.loc[3, 'Ram'] = None
+    features, errors = encoder.encode_frame(records)
+    for i, record in enumerate(records.to_dict('records')):
+        row, error = encoder.encode_record(record)
+        assert error == errors[i]
+        valid = ~np.isnan(row[0]) & (row[0] >= 0)
+        np.testing.assert_array_equal(row[0][valid], features[i][valid])
+    assert list(errors[:4]) == ['', 'Invalid Company', 'Invalid Inches', 'Invalid Ram']
+
+
+def test_unknown_categories_are_invalid_not_guessed(encoder, records):
+    record = {**records.iloc[0].to_dict(), 'Gpu': 'Unheard-of GPU', 'OpSys': ''}
+    features, error = encoder.encode_record(record)
+    assert error == 'Invalid Gpu, OpSys'
+    assert features[0, FEATURE_COLUMNS.index('Gpu')] == -1
+    # Unknown values are memoized as invalid too, so asking again gives the same answer
+    assert encoder.encode_record(record)[1] == error
+
+
+def test_missing_columns_raise(encoder, records):
+    with pytest.raises(ValueError, match="Missing columns: Weight"):
+        encoder.encode_frame(records.drop(columns=['Weight']))
+
+
+def test_save_and_load_round_trip(encoder, records, tmp_path):
+    path = str(tmp_path / 'encoder.json')
+    encoder.save(path)
+    loaded = FeatureEncoder.load(path)
+    np.testing.assert_array_equal(loaded.transform(records), encoder.transform(records))
+    assert loaded.options('Company') == encoder.options('Company')
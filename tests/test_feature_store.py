@@ -0,0 +1,77 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from feature_store import load_features, refresh
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope='module')
+def laptop_csv():
+    with open(os.path.join(ROOT, 'laptop.csv'), 'rb') as f:
+        return f.read()
+
+
+def _write(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    return str(path)
+
+
+def _entries(store):
+    return sorted(os.listdir(store))
+
+
+# Data lines start to stop of a CSV, without its header
+def _lines(data, start, stop=None):
+    lines = data.splitlines(keepends=True)
+    return b''.join(lines[1 + start:None if stop is None else 1 + stop])
+
+
+def test_similar_names_keep_their_own_entries(tmp_path, laptop_csv):
+    store = str(tmp_path / 'store')
+    first = _write(tmp_path / 'laptop.csv', laptop_csv)
+    second = _write(tmp_path / 'laptop-2024.csv', laptop_csv)
+    third = _write(tmp_path / 'other' / 'laptop.csv', laptop_csv)
+    entries = [refresh(path, store)[0] for path in (first, second, third)]
+    assert len(set(entries)) == 3
+    assert _entries(store) == sorted(os.path.basename(entry) for entry in entries)
+    assert [refresh(path, store)[1] for path in (first, second, third)] == ['cached'] * 3
+
+
+def test_appended_rows_replace_the_previous_entry(tmp_path, laptop_csv):
+    store = str(tmp_path / 'store')
+    header = laptop_csv.splitlines(keepends=True)[0]
+    path = _write(tmp_path / 'laptop.csv', header + _lines(laptop_csv, 0, 1200))
+    refresh(path, store)
+    _write(tmp_path / 'laptop.csv', laptop_csv)
+    entry, mode = refresh(path, store)
+    assert mode == 'appended'
+    assert _entries(store) == [os.path.basename(entry)]
+    X, y, _ = load_features(path, store)
+    assert len(X) == len(y) == len(pd.read_csv(path))
+    assert np.isnan(np.load(os.path.join(entry, 'prices.npy'))).sum() == pd.read_csv(path)['Price'].isna().sum()
+
+
+def test_edited_rows_rebuild(tmp_path, laptop_csv):
+    store = str(tmp_path / 'store')
+    path = _write(tmp_path / 'laptop.csv', laptop_csv)
+    refresh(path, store)
+    lines = laptop_csv.splitlines(keepends=True)
+    lines[1] = lines[1].replace(b'Apple', b'Asus', 1)
+    _write(tmp_path / 'laptop.csv', b''.join(lines))
+    entry, mode = refresh(path, store)
+    assert mode == 'built'
+    assert _entries(store) == [os.path.basename(entry)]
+
+
+def test_too_many_appended_rows_rebuild(tmp_path, laptop_csv):
+    store = str(tmp_path / 'store')
+    header = laptop_csv.splitlines(keepends=True)[0]
+    path = _write(tmp_path / 'laptop.csv', header + _lines(laptop_csv, 0, 600))
+    refresh(path, store)
+    _write(tmp_path / 'laptop.csv', laptop_csv)
+    assert refresh(path, store)[1] == 'built'
@@ -0,0 +1,52 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('xgboost')
+
+from market_cube import PRICE_EDGES, refresh_cube
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_PATH = os.path.join(ROOT, 'laptop.csv')
+
+# Quantiles come from log-spaced histogram bins, so they are exact to a bin's width
+BIN_WIDTH = PRICE_EDGES[1] / PRICE_EDGES[0] - 1
+
+
+@pytest.fixture(scope='module')
+def cube(tmp_path_factory):
+    work = tmp_path_factory.mktemp('cube')
+    cube, _ = refresh_cube(DATA_PATH, str(work / 'market_cube.npz'), str(work / 'feature_store'))
+    return cube
+
+
+@pytest.fixture(scope='module')
+def listings():
+    raw = pd.read_csv(DATA_PATH)
+    return raw.groupby('Company')['Price'].agg(['count', 'mean', 'median'])
+
+
+# Razer's listings are mostly above the outlier bound clean_laptops replaces
+# with the median, so its figures show whether the cleaned target leaked in
+def test_slice_matches_listed_prices(cube, listings):
+    summary = cube.summary({'Company': ['Razer']})
+    expected = listings.loc['Razer']
+    assert summary['Listings'] == expected['count']
+    assert summary['Mean_Price'] == pytest.approx(expected['mean'])
+    assert summary['Median'] == pytest.approx(expected['median'], rel=BIN_WIDTH)
+
+
+def test_group_matches_pandas(cube, listings):
+    table = cube.group(['Company']).set_index('Company').loc[listings.index]
+    np.testing.assert_array_equal(table['Listings'], listings['count'])
+    np.testing.assert_allclose(table['Mean_Price'], listings['mean'])
+    # With a handful of listings pandas averages two prices that can be far apart
+    large = listings['count'] >= 50
+    np.testing.assert_allclose(table['Median'][large], listings['median'][large], rtol=BIN_WIDTH)
+
+
+def test_rows_without_price_are_left_out(cube, listings):
+    assert cube.rows == len(pd.read_csv(DATA_PATH))
+    assert cube.summary()['Listings'] == listings['count'].sum()
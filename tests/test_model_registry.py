@@ -0,0 +1,57 @@
+import os
+import time
+
+import pytest
+
+pytest.importorskip('xgboost')
+
+from model_registry import ACTIVE, SHADOW, ModelRegistry, publish, set_pointer, versions
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODEL_PATH = os.path.join(ROOT, 'laptop.ubj')
+ENCODER_PATH = os.path.join(ROOT, 'laptop_encoder.json')
+
+
+def _wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_versions_sort_by_number(tmp_path):
+    for name in ('v0002', 'v9999', 'v10000', 'v0010', 'notes', 'v12a'):
+        (tmp_path / name).mkdir()
+    assert versions(str(tmp_path)) == ['v0002', 'v0010', 'v9999', 'v10000']
+
+
+def test_publish_numbers_past_9999(tmp_path):
+    (tmp_path / 'v9999').mkdir()
+    (tmp_path / 'v10000').mkdir()
+    assert publish(MODEL_PATH, ENCODER_PATH, str(tmp_path)) == 'v10001'
+
+
+# A pointer change is picked up on the next poll and swapped in once the
+# version has loaded; until then the old version keeps serving
+def test_pointer_changes_are_swapped_in(tmp_path):
+    registry_dir = str(tmp_path)
+    first, second = (publish(MODEL_PATH, ENCODER_PATH, registry_dir) for _ in range(2))
+    set_pointer(registry_dir, ACTIVE, first)
+    registry = ModelRegistry(registry_dir, poll_interval=0)
+    assert registry.current().version == first
+    assert registry.shadow() is None
+
+    set_pointer(registry_dir, SHADOW, second)
+    _wait_for(lambda: registry.shadow() is not None)
+    assert registry.shadow().version == second
+    assert registry.shadow_stats.shadow_version == second
+
+    set_pointer(registry_dir, ACTIVE, second)
+    set_pointer(registry_dir, SHADOW, None)
+    _wait_for(lambda: registry.current().version == second and registry.shadow() is None)
+
+
+def test_unknown_version_is_rejected(tmp_path):
+    publish(MODEL_PATH, ENCODER_PATH, str(tmp_path))
+    with pytest.raises(ValueError):
+        set_pointer(str(tmp_path), ACTIVE, 'v0002')
@@ -0,0 +1,59 @@
+import numpy as np
+
+from prediction_cache import PredictionCache
+
+# One encoded row in FEATURE_COLUMNS order
+ROW = np.array([[3, 4, 15.0, 6, 2, 40, 5, 2.2, 1, 2.5, 1, 3]], dtype=np.float32)
+
+
+# Prices every row at a fixed price and counts the rows it was asked for
+class CountingModel:
+    def __init__(self, signature, price):
+        self.signature = signature
+        self.price = price
+        self.rows = 0
+
+    def predict(self, features):
+        self.rows += len(features)
+        return np.full(len(features), self.price, dtype=np.float32)
+
+
+def test_repeated_rows_are_served_from_the_cache():
+    cache, model = PredictionCache(), CountingModel('a', 50_000)
+    assert cache.predict(model, ROW)[0] == 50_000
+    assert cache.predict(model, ROW + 1e-4)[0] == 50_000
+    assert model.rows == 1
+    assert cache.info()['hits'] == 1 and cache.info()['misses'] == 1
+
+
+def test_a_new_model_signature_drops_every_entry():
+    cache, old, new = PredictionCache(), CountingModel('a', 50_000), CountingModel('b', 60_000)
+    cache.predict(old, ROW)
+    assert cache.predict(new, ROW)[0] == 60_000
+    assert new.rows == 1
+    assert cache.info()['size'] == 1
+    # Going back to the old model prices it again instead of serving the new model's price
+    assert cache.predict(old, ROW)[0] == 50_000
+    assert old.rows == 2
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache, model = PredictionCache(maxsize=2), CountingModel('a', 50_000)
+    rows = [ROW + i for i in range(3)]
+    cache.predict(model, rows[0])
+    cache.predict(model, rows[1])
+    cache.predict(model, rows[0])
+    cache.predict(model, rows[2])
+    assert cache.get(model, rows[1]) is None
+    assert cache.get(model, rows[0]) == 50_000
+
+
+def test_shared_database_only_serves_the_current_model(tmp_path):
+    db_path = str(tmp_path / 'prices.db')
+    model = CountingModel('a', 50_000)
+    PredictionCache(db_path=db_path).predict(model, ROW)
+    assert PredictionCache(db_path=db_path).predict(model, ROW)[0] == 50_000
+    assert model.rows == 1
+    other = PredictionCache(db_path=db_path)
+    assert other.predict(CountingModel('b', 60_000), ROW)[0] == 60_000
+    assert PredictionCache(db_path=db_path).get(model, ROW) is None
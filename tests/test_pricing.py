@@ -0,0 +1,43 @@
+import os
+
+import pandas as pd
+import pytest
+
+from features import FEATURE_COLUMNS, clean_laptops
+from pricing import main
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PATHS = ['--model', os.path.join(ROOT, 'laptop.ubj'), '--encoder', os.path.join(ROOT, 'laptop_encoder.json')]
+
+
+@pytest.fixture
+def catalogue(tmp_path):
+    cleaned, _ = clean_laptops(pd.read_csv(os.path.join(ROOT, 'laptop.csv')))
+    frame = cleaned[FEATURE_COLUMNS].head(20).copy()
+    frame.loc[3, 'Company'] = 'Unheard-of brand'
+    path = tmp_path / 'catalogue.csv'
+    frame.to_csv(path, index=False)
+    return path
+
+
+# Run from another directory, so the default relative paths don't resolve
+def test_prices_a_csv_from_any_directory(tmp_path, catalogue, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    assert main([str(catalogue), 'priced.csv', *PATHS]) == 0
+    priced = pd.read_csv(tmp_path / 'priced.csv', keep_default_na=False)
+    assert len(priced) == 20
+    assert priced.loc[3, 'Error'] == 'Invalid Company'
+    assert (priced.drop(index=3)['Error'] == '').all()
+
+
+def test_missing_columns_are_reported_without_a_traceback(tmp_path, catalogue, capsys):
+    pd.read_csv(catalogue).drop(columns=['Ram']).to_csv(catalogue, index=False)
+    assert main([str(catalogue), str(tmp_path / 'priced.csv'), *PATHS]) == 1
+    assert capsys.readouterr().err.strip() == "Error: Missing columns: Ram"
+
+
+# Away from the repository there is no laptop.pkl to export the model from either
+def test_missing_model_is_reported(tmp_path, catalogue, capsys, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    assert main([str(catalogue), '--model', 'missing.ubj']) == 1
+    assert capsys.readouterr().err.startswith("Error: ")
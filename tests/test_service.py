@@ -0,0 +1,90 @@
+import asyncio
+import json
+import os
+
+import pandas as pd
+import pytest
+
+pytest.importorskip('aiohttp')
+pytest.importorskip('xgboost')
+
+from aiohttp.test_utils import TestClient, TestServer
+
+from comparables import MAX_K
+from encoder import FeatureEncoder
+from features import clean_laptops
+from service import create_app
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope='module')
+def record():
+    encoder = FeatureEncoder.load(os.path.join(ROOT, 'laptop_encoder.json'))
+    cleaned, _ = clean_laptops(pd.read_csv(os.path.join(ROOT, 'laptop.csv')).head(1), encoder.stats)
+    return json.loads(encoder.decode(encoder.transform(cleaned)).to_json(orient='records'))[0]
+
+
+# Send requests (method, path, keyword arguments) to a fresh app and return
+# each response's status and JSON body
+def _send(*requests):
+    async def send():
+        app = create_app(os.path.join(ROOT, 'laptop.ubj'), os.path.join(ROOT, 'laptop_encoder.json'), window_ms=1,
+                         comparables_path=os.path.join(ROOT, 'laptop_comparables.joblib'),
+                         drift_reference_path=os.path.join(ROOT, 'laptop_drift_reference.json'))
+        async with TestClient(TestServer(app)) as client:
+            responses = []
+            for method, path, kwargs in requests:
+                response = await client.request(method, path, **kwargs)
+                responses.append((response.status, await response.json()))
+            return responses
+    return asyncio.run(send())
+
+
+def test_predict(record):
+    [(status, body)] = _send(('POST', '/predict', {'json': record}))
+    assert status == 200
+    assert body['error'] is None and body['price'] > 0
+
+
+# Well-formed values the encoder doesn't know are 422; malformed bodies are 400
+def test_predict_rejects_bad_input(record):
+    responses = _send(
+        ('POST', '/predict', {'json': {**record, 'Company': 'Unheard-of brand'}}),
+        ('POST', '/predict', {'json': {**record, 'Ram': ['8GB']}}),
+        ('POST', '/predict', {'json': [record]}),
+        ('POST', '/predict', {'data': 'not json'}),
+    )
+    assert [status for status, _ in responses] == [422, 400, 400, 400]
+    assert responses[0][1] == {'price': None, 'error': 'Invalid Company'}
+
+
+def test_comparables_are_validated(record):
+    responses = _send(*[('POST', f'/predict?comparables={k}', {'json': record})
+                        for k in ('3', '0', str(MAX_K + 1), 'x')])
+    assert [status for status, _ in responses] == [200, 400, 400, 400]
+    assert len(responses[0][1]['comparables']) == 3
+
+
+def test_batch(record):
+    responses = _send(
+        ('POST', '/predict/batch', {'json': [record, {**record, 'Gpu': 'Unheard-of GPU'}]}),
+        ('POST', '/predict/batch', {'json': [record, {**record, 'Gpu': {'name': 'x'}}]}),
+        ('POST', '/predict/batch', {'json': [{'Company': 'Dell'}]}),
+        ('POST', '/predict/batch', {'json': record}),
+    )
+    assert [status for status, _ in responses] == [200, 400, 422, 400]
+    first, second = responses[0][1]['results']
+    assert first['error'] is None and first['price'] > 0
+    assert second == {'price': None, 'error': 'Invalid Gpu'}
+    assert responses[1][1]['error'].startswith('Row 1: ')
+
+
+def test_whatif(record):
+    responses = _send(
+        ('POST', '/whatif', {'json': {'record': record, 'vary': ['Ram'], 'values': {'Ram': ['8GB', '16GB']}}}),
+        ('POST', '/whatif', {'json': {'record': record, 'vary': ['Nope']}}),
+        ('POST', '/whatif', {'json': {'record': record, 'vary': ['Ram'], 'values': {'Ram': '8GB'}}}),
+    )
+    assert [status for status, _ in responses] == [200, 400, 400]
+    assert [row[0] for row in responses[0][1]['rows']] == ['8GB', '16GB']
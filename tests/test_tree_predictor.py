@@ -0,0 +1,79 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+xgb = pytest.importorskip('xgboost')
+
+from encoder import FeatureEncoder
+from features import FEATURE_COLUMNS, clean_laptops
+from tree_predictor import TreeEnsemble
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope='module')
+def booster():
+    return xgb.Booster(model_file=os.path.join(ROOT, 'laptop.ubj'))
+
+
+@pytest.fixture(scope='module')
+def ensemble(booster):
+    return TreeEnsemble.from_booster(booster)
+
+
+@pytest.fixture(scope='module')
+def laptop_rows():
+    encoder = FeatureEncoder.load(os.path.join(ROOT, 'laptop_encoder.json'))
+    cleaned, _ = clean_laptops(pd.read_csv(os.path.join(ROOT, 'laptop.csv')), encoder.stats)
+    return encoder.transform(cleaned)
+
+
+# Rows the apps never send on purpose: unknown categories (-1), missing
+# values, numbers far outside the training range and all zeros
+@pytest.fixture(scope='module')
+def edge_rows(laptop_rows):
+    base = laptop_rows[0]
+    rows = [np.zeros(len(FEATURE_COLUMNS), dtype=np.float32), np.full(len(FEATURE_COLUMNS), -1, dtype=np.float32),
+            np.full(len(FEATURE_COLUMNS), np.nan, dtype=np.float32)]
+    for j in range(len(FEATURE_COLUMNS)):
+        for value in (-1, np.nan, 1e6, -1e6):
+            row = base.copy()
+            row[j] = value
+            rows.append(row)
+    return np.array(rows, dtype=np.float32)
+
+
+def _tolerance(expected):
+    return 1e-5 * np.abs(expected).max()
+
+
+def test_batch_matches_booster(booster, ensemble, laptop_rows):
+    expected = booster.inplace_predict(laptop_rows)
+    np.testing.assert_allclose(ensemble.predict_batch(laptop_rows), expected, rtol=0, atol=_tolerance(expected))
+
+
+def test_single_rows_match_booster(booster, ensemble, laptop_rows):
+    expected = booster.inplace_predict(laptop_rows)
+    actual = np.array([ensemble.predict_row(row) for row in laptop_rows])
+    np.testing.assert_allclose(actual, expected, rtol=0, atol=_tolerance(expected))
+
+
+def test_edge_rows_match_booster(booster, ensemble, edge_rows):
+    expected = booster.inplace_predict(edge_rows)
+    np.testing.assert_allclose(ensemble.predict_batch(edge_rows), expected, rtol=0, atol=_tolerance(expected))
+    actual = np.array([ensemble.predict_row(row) for row in edge_rows])
+    np.testing.assert_allclose(actual, expected, rtol=0, atol=_tolerance(expected))
+
+
+def test_saved_export_matches(tmp_path, ensemble, laptop_rows):
+    path = tmp_path / 'trees.npz'
+    ensemble.save(str(path))
+    np.testing.assert_array_equal(TreeEnsemble.load(str(path)).predict(laptop_rows), ensemble.predict(laptop_rows))
+
+
+def test_shipped_export_matches_booster(booster, laptop_rows):
+    shipped = TreeEnsemble.load(os.path.join(ROOT, 'laptop_trees.npz'))
+    expected = booster.inplace_predict(laptop_rows)
+    np.testing.assert_allclose(shipped.predict_batch(laptop_rows), expected, rtol=0, atol=_tolerance(expected))
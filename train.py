@@ -0,0 +1,128 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
+from sklearn.model_selection import train_test_split
+
+from encoder import DATA_PATH, ENCODER_PATH, FeatureEncoder
+from feature_store import load_features
+from features import FEATURE_COLUMNS, TARGET, clean_laptops
+from model_store import MODEL_PATH, file_sha256, trees_path, write_json
+from tree_predictor import TreeEnsemble
+
+METRICS_PATH = "laptop_metrics.json"
+# Encoded test split, used by update.py to check incremental updates
+HOLDOUT_PATH = "laptop_holdout.npz"
+
+# Same split as EDA.ipynb
+TEST_SIZE = 0.2
+RANDOM_STATE = 42
+
+# Histogram trees on every core; with a fixed seed the fit is deterministic
+MODEL_PARAMS = {'tree_method': 'hist', 'n_jobs': -1, 'random_state': RANDOM_STATE}
+
+
+# Write to a temporary file next to path and rename it into place, so a serving
+# process polling the file never sees it half written
+def replace_atomically(path, write):
+    root, ext = os.path.splitext(path)
+    tmp_path = f"{root}.tmp{ext}"
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
+# Clean laptop.csv and encode it. Returns the feature matrix (as a DataFrame so
+# the booster keeps the column names), the target and the fitted encoder.
+def prepare_training_data(raw):
+    cleaned, stats = clean_laptops(raw)
+    encoder = FeatureEncoder.fit(cleaned, stats)
+    X = pd.DataFrame(encoder.transform(cleaned), columns=FEATURE_COLUMNS)
+    y = cleaned[TARGET].to_numpy(dtype=np.float32)
+    return X, y, encoder
+
+
+def train_model(X, y, params=None):
+    model = xgb.XGBRegressor(**{**MODEL_PARAMS, **(params or {})})
+    model.fit(X, y)
+    return model
+
+
+def evaluate(model, X, y):
+    predictions = model.predict(X)
+    mse = mean_squared_error(y, predictions)
+    return {
+        'mse': float(mse), 'rmse': float(np.sqrt(mse)),
+        'mae': float(mean_absolute_error(y, predictions)), 'r2': float(r2_score(y, predictions)),
+    }
+
+
+# Rebuild the model (native and flat NumPy export), encoder artifact, holdout
+# rows and metrics report from the raw data
+def run(data_path=DATA_PATH, model_path=MODEL_PATH, encoder_path=ENCODER_PATH, metrics_path=METRICS_PATH,
+        params=None, holdout_path=HOLDOUT_PATH):
+    start = time.perf_counter()
+    X, y, encoder = load_features(data_path)
+    # Keep the column names for the booster without copying the mapped matrix
+    X = pd.DataFrame(X, columns=FEATURE_COLUMNS, copy=False)
+    prepare_seconds = time.perf_counter() - start
+
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=TEST_SIZE, random_state=RANDOM_STATE)
+    start = time.perf_counter()
+    model = train_model(X_train, y_train, params)
+    train_seconds = time.perf_counter() - start
+
+    metrics = {
+        'data': data_path, 'data_sha256': file_sha256(data_path), 'rows': len(X),
+        'train_rows': len(X_train), 'test_rows': len(X_test), 'xgboost': xgb.__version__,
+        'params': model.get_xgb_params(), 'test': evaluate(model, X_test, y_test),
+        'prepare_seconds': prepare_seconds, 'train_seconds': train_seconds,
+    }
+    replace_atomically(model_path, model.get_booster().save_model)
+    replace_atomically(trees_path(model_path), TreeEnsemble.from_booster(model.get_booster()).save)
+    replace_atomically(encoder_path, encoder.save)
+    replace_atomically(holdout_path, lambda path: save_holdout(path, X_test, y_test))
+    replace_atomically(metrics_path, lambda path: write_json(path, metrics))
+    return metrics
+
+
+def save_holdout(path, X, y):
+    np.savez(path, X=np.asarray(X, dtype=np.float32), y=np.asarray(y, dtype=np.float32))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train the price model from laptop.csv.")
+    parser.add_argument('--data', default=DATA_PATH)
+    parser.add_argument('--model', default=MODEL_PATH, help="where to write the native model (.ubj/.json)")
+    parser.add_argument('--encoder', default=ENCODER_PATH)
+    parser.add_argument('--metrics', default=METRICS_PATH)
+    parser.add_argument('--holdout', default=HOLDOUT_PATH, help="where to write the encoded test split")
+    parser.add_argument('--n-estimators', type=int, help="override the number of boosting rounds")
+    parser.add_argument('--max-depth', type=int, help="override the tree depth")
+    parser.add_argument('--out-of-core', action='store_true',
+                        help="stream the CSV in chunks and train from external memory, for data larger than RAM")
+    parser.add_argument('--chunk-size', type=int, help="rows per chunk with --out-of-core")
+    args = parser.parse_args(argv)
+
+    params = {name: value for name, value in
+              {'n_estimators': args.n_estimators, 'max_depth': args.max_depth}.items() if value is not None}
+    if args.out_of_core:
+        import out_of_core
+
+        metrics = out_of_core.run(args.data, args.model, args.encoder, args.metrics, params, args.holdout,
+                                  args.chunk_size or out_of_core.DEFAULT_CHUNK_SIZE)
+    else:
+        metrics = run(args.data, args.model, args.encoder, args.metrics, params, args.holdout)
+    test = metrics['test']
+    print(f"Trained on {metrics['train_rows']:,} rows in {metrics['train_seconds']:.2f}s "
+          f"(prepared in {metrics['prepare_seconds']:.2f}s)")
+    print(f"Test RMSE {test['rmse']:,.0f}, MAE {test['mae']:,.0f}, R2 {test['r2']:.4f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
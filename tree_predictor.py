@@ -0,0 +1,169 @@
+import argparse
+import json
+import sys
+
+import numpy as np
+
+import latency
+
+# Flat NumPy export of laptop.ubj, served when xgboost isn't installed
+TREES_PATH = "laptop_trees.npz"
+
+# Rows traversed together in the batch path (bounds the rows x trees index arrays)
+BATCH_ROWS = 8192
+
+
+# A boosted tree ensemble flattened into one set of node arrays. Every node of
+# every tree has a feature index, threshold, left/right child (as global node
+# indices), default direction for missing values and leaf value. Leaves point
+# to themselves, so walking a fixed max_depth steps lands every row on a leaf.
+class TreeEnsemble:
+    def __init__(self, feature, threshold, left, right, default_left, value, roots, base_score, max_depth,
+                 num_features):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.default_left = default_left
+        self.value = value
+        self.roots = roots
+        self.base_score = np.float32(base_score)
+        self.max_depth = int(max_depth)
+        self.num_features = int(num_features)
+        # children[2 * node] is the left child and children[2 * node + 1] the right one
+        self.children = np.stack([left, right], axis=1).ravel()
+        self.path = None
+        self.signature = None
+        self.load_seconds = 0.0
+        self.warmup_seconds = 0.0
+
+    # Flatten an XGBoost regression booster (gbtree, identity link, no
+    # categorical splits) from its JSON model dump
+    @classmethod
+    def from_booster(cls, booster):
+        learner = json.loads(booster.save_raw(raw_format='json'))['learner']
+        objective = learner['objective']['name']
+        if objective not in ('reg:squarederror', 'reg:absoluteerror', 'reg:pseudohubererror'):
+            raise ValueError(f"Unsupported objective for flat export: {objective}")
+        model = learner['gradient_booster']['model']
+        base_score = float(learner['learner_model_param']['base_score'].strip('[]'))
+
+        arrays = {name: [] for name in ('feature', 'threshold', 'left', 'right', 'default_left', 'value')}
+        roots, offset, max_depth = [], 0, 0
+        for tree in model['trees']:
+            if any(tree['split_type']):
+                raise ValueError("Categorical splits are not supported by the flat export")
+            left = np.asarray(tree['left_children'], dtype=np.int32)
+            right = np.asarray(tree['right_children'], dtype=np.int32)
+            is_leaf = left == -1
+            nodes = np.arange(len(left), dtype=np.int32)
+            arrays['feature'].append(np.where(is_leaf, 0, tree['split_indices']).astype(np.int32))
+            # Leaf values are stored in split_conditions for leaf nodes
+            conditions = np.asarray(tree['split_conditions'], dtype=np.float32)
+            arrays['threshold'].append(np.where(is_leaf, np.inf, conditions).astype(np.float32))
+            arrays['value'].append(np.where(is_leaf, conditions, 0).astype(np.float32))
+            arrays['left'].append(np.where(is_leaf, nodes, left) + offset)
+            arrays['right'].append(np.where(is_leaf, nodes, right) + offset)
+            arrays['default_left'].append(np.asarray(tree['default_left'], dtype=bool))
+            roots.append(offset)
+            offset += len(left)
+            max_depth = max(max_depth, _depth(left, right))
+
+        flat = {name: np.concatenate(parts) for name, parts in arrays.items()}
+        return cls(**flat, roots=np.asarray(roots, dtype=np.int32), base_score=base_score, max_depth=max_depth,
+                   num_features=int(learner['learner_model_param']['num_feature']))
+
+    @classmethod
+    def load(cls, path=TREES_PATH):
+        with np.load(path) as data:
+            ensemble = cls(**{name: data[name] for name in data.files})
+        ensemble.path = path
+        return ensemble
+
+    def save(self, path=TREES_PATH):
+        np.savez(path, feature=self.feature, threshold=self.threshold, left=self.left, right=self.right,
+                 default_left=self.default_left, value=self.value, roots=self.roots, base_score=self.base_score,
+                 max_depth=self.max_depth, num_features=self.num_features)
+
+    # Child reached from each node for its feature values x. NaN goes to the
+    # node's default side; the extra check only runs when NaNs are present.
+    def _step(self, nodes, x, has_nan):
+        go_right = ~(x < self.threshold[nodes])
+        if has_nan:
+            go_right &= ~(np.isnan(x) & self.default_left[nodes])
+        return self.children[2 * nodes + go_right]
+
+    # Single row: all trees advance one level per step
+    def predict_row(self, row):
+        has_nan = bool(np.isnan(row).any())
+        nodes = self.roots
+        for _ in range(self.max_depth):
+            nodes = self._step(nodes, row[self.feature[nodes]], has_nan)
+        return self.base_score + self.value[nodes].sum(dtype=np.float32)
+
+    # Many rows: a rows x trees matrix of node indices advances one level per step
+    def predict_batch(self, features):
+        predictions = np.empty(len(features), dtype=np.float32)
+        for start in range(0, len(features), BATCH_ROWS):
+            X = np.ascontiguousarray(features[start:start + BATCH_ROWS])
+            has_nan = bool(np.isnan(X).any())
+            flat = X.ravel()
+            row_offsets = (np.arange(len(X), dtype=np.int32) * self.num_features)[:, None]
+            nodes = np.broadcast_to(self.roots, (len(X), len(self.roots)))
+            for _ in range(self.max_depth):
+                nodes = self._step(nodes, flat[row_offsets + self.feature[nodes]], has_nan)
+            predictions[start:start + len(X)] = self.base_score + self.value[nodes].sum(axis=1, dtype=np.float32)
+        return predictions
+
+    # Same call as Booster-backed models: one prediction per row
+    def predict(self, features):
+        with latency.timer('convert'):
+            features = np.asarray(features, dtype=np.float32).reshape(-1, self.num_features)
+        with latency.timer('predict'):
+            if len(features) == 1:
+                return np.array([self.predict_row(features[0])], dtype=np.float32)
+            return self.predict_batch(features)
+
+    def warm_up(self):
+        self.predict(np.zeros((1, self.num_features), dtype=np.float32))
+
+
+def _depth(left, right):
+    depth = np.zeros(len(left), dtype=np.int32)
+    for node in range(len(left)):
+        if left[node] != -1:
+            depth[left[node]] = depth[right[node]] = depth[node] + 1
+    return int(depth.max())
+
+
+def main(argv=None):
+    import pandas as pd
+    import xgboost as xgb
+
+    from encoder import DATA_PATH, load_encoder
+    from features import clean_laptops
+    from model_store import MODEL_PATH
+
+    parser = argparse.ArgumentParser(description="Export the booster as flat NumPy arrays and check it.")
+    parser.add_argument('--model', default=MODEL_PATH)
+    parser.add_argument('--output', default=TREES_PATH)
+    parser.add_argument('--data', default=DATA_PATH, help="rows used to check the export against the booster")
+    args = parser.parse_args(argv)
+
+    booster = xgb.Booster(model_file=args.model)
+    ensemble = TreeEnsemble.from_booster(booster)
+    ensemble.save(args.output)
+
+    encoder = load_encoder()
+    X = encoder.transform(clean_laptops(pd.read_csv(args.data), encoder.stats)[0])
+    expected = booster.inplace_predict(X)
+    batch_error = np.abs(ensemble.predict_batch(X) - expected).max()
+    row_error = max(abs(ensemble.predict_row(row) - price) for row, price in zip(X, expected))
+    print(f"Wrote {args.output}: {len(ensemble.roots)} trees, {len(ensemble.value)} nodes, depth {ensemble.max_depth}")
+    print(f"Max abs difference vs booster: batch {batch_error:.4g}, single row {row_error:.4g}")
+    tolerance = 1e-5 * np.abs(expected).max()
+    return 0 if max(batch_error, row_error) <= tolerance else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,151 @@
+import argparse
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+from sklearn.model_selection import train_test_split
+
+from encoder import DATA_PATH, ENCODER_PATH, FeatureEncoder
+from features import FEATURE_COLUMNS, TARGET, clean_laptops
+from model_store import MODEL_PATH, Model, trees_path, write_json
+from train import (
+    HOLDOUT_PATH, MODEL_PARAMS, RANDOM_STATE, TEST_SIZE, evaluate, prepare_training_data, replace_atomically,
+    save_holdout,
+)
+from tree_predictor import TreeEnsemble
+
+UPDATE_REPORT_PATH = "laptop_update.json"
+
+# Trees added per update, with more shrinkage than the original fit so a small
+# batch of new rows nudges the model instead of overfitting it
+DEFAULT_ROUNDS = 20
+DEFAULT_LEARNING_RATE = 0.1
+# The updated model may be at most this much worse (relative RMSE) than the
+# deployed one on the holdout rows
+DEFAULT_TOLERANCE = 0.01
+# Share of the new rows kept out of training and added to the holdout check
+NEW_HOLDOUT_SIZE = 0.2
+# Below this many new rows they are all used for training
+MIN_NEW_HOLDOUT_ROWS = 5
+
+
+# Clean and encode only the new rows, with the statistics and vocabularies the
+# deployed model was trained with. Rows with a label outside a vocabulary are
+# dropped (their code would mean nothing to the existing trees); a full
+# retrain with train.py picks them up. Returns X, y and the dropped count.
+def prepare_new_rows(raw, encoder):
+    raw = raw.dropna(subset=[TARGET])
+    cleaned, _ = clean_laptops(raw, encoder.stats)
+    features = encoder.transform(cleaned)
+    known = (features >= 0).all(axis=1)
+    X = pd.DataFrame(features[known], columns=FEATURE_COLUMNS)
+    y = cleaned[TARGET].to_numpy(dtype=np.float32)[known]
+    return X, y, int((~known).sum())
+
+
+# Holdout rows (the notebook's test split) encoded once and stored next to the
+# model, so checking an update doesn't re-clean the whole history
+def load_holdout(path=HOLDOUT_PATH, data_path=DATA_PATH):
+    try:
+        with np.load(path) as data:
+            return pd.DataFrame(data['X'], columns=FEATURE_COLUMNS), data['y']
+    except FileNotFoundError:
+        X, y, _ = prepare_training_data(pd.read_csv(data_path))
+        _, X_test, _, y_test = train_test_split(X, y, test_size=TEST_SIZE, random_state=RANDOM_STATE)
+        save_holdout(path, X_test, y_test)
+        return X_test, y_test
+
+
+# Add `rounds` trees to a copy of the booster, fitted on the new rows only
+def continue_training(booster, X, y, rounds=DEFAULT_ROUNDS, params=None):
+    params = {**MODEL_PARAMS, 'learning_rate': DEFAULT_LEARNING_RATE, **(params or {}), 'n_estimators': rounds}
+    model = xgb.XGBRegressor(**params)
+    model.fit(X, y, xgb_model=booster.copy())
+    return model
+
+
+# Append the raw new rows to the history CSV, in its column order
+def append_rows(raw, data_path=DATA_PATH):
+    columns = pd.read_csv(data_path, nrows=0).columns
+    raw.reindex(columns=columns).to_csv(data_path, mode='a', header=False, index=False)
+
+
+# Continue boosting the deployed model on new labeled rows and publish it only
+# if it holds up on the holdout rows (the stored test split plus a slice of the
+# new rows). Returns the report that is also written to report_path.
+def run(new_path, model_path=MODEL_PATH, encoder_path=ENCODER_PATH, holdout_path=HOLDOUT_PATH,
+        rounds=DEFAULT_ROUNDS, tolerance=DEFAULT_TOLERANCE, report_path=UPDATE_REPORT_PATH, append_to=None,
+        params=None):
+    start = time.perf_counter()
+    raw = pd.read_csv(new_path)
+    encoder = FeatureEncoder.load(encoder_path)
+    X_new, y_new, dropped = prepare_new_rows(raw, encoder)
+    if not len(X_new):
+        raise ValueError(f"No usable labeled rows in {new_path}")
+    X_holdout, y_holdout = load_holdout(holdout_path)
+    if len(X_new) >= MIN_NEW_HOLDOUT_ROWS / NEW_HOLDOUT_SIZE:
+        X_new, X_check, y_new, y_check = train_test_split(
+            X_new, y_new, test_size=NEW_HOLDOUT_SIZE, random_state=RANDOM_STATE)
+        X_holdout = pd.concat([X_holdout, X_check], ignore_index=True)
+        y_holdout = np.concatenate([y_holdout, y_check])
+    prepare_seconds = time.perf_counter() - start
+
+    booster = xgb.Booster(model_file=model_path)
+    current = Model(booster, model_path)
+    start = time.perf_counter()
+    updated = continue_training(booster, X_new, y_new, rounds, params)
+    train_seconds = time.perf_counter() - start
+
+    before, after = evaluate(current, X_holdout, y_holdout), evaluate(updated, X_holdout, y_holdout)
+    published = after['rmse'] <= before['rmse'] * (1 + tolerance)
+    report = {
+        'new_data': new_path, 'new_rows': len(raw), 'dropped_rows': dropped, 'train_rows': len(X_new),
+        'holdout_rows': len(X_holdout), 'rounds_before': booster.num_boosted_rounds(),
+        'rounds_after': updated.get_booster().num_boosted_rounds(), 'holdout_before': before,
+        'holdout_after': after, 'tolerance': tolerance, 'published': published,
+        'prepare_seconds': prepare_seconds, 'train_seconds': train_seconds,
+    }
+    if published:
+        replace_atomically(model_path, updated.get_booster().save_model)
+        replace_atomically(trees_path(model_path), TreeEnsemble.from_booster(updated.get_booster()).save)
+        if append_to:
+            append_rows(raw, append_to)
+    replace_atomically(report_path, lambda path: write_json(path, report))
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Add trees to the deployed model from newly labeled rows.")
+    parser.add_argument('new_data', help="CSV of new listings in laptop.csv's format, with Price")
+    parser.add_argument('--model', default=MODEL_PATH)
+    parser.add_argument('--encoder', default=ENCODER_PATH)
+    parser.add_argument('--holdout', default=HOLDOUT_PATH)
+    parser.add_argument('--rounds', type=int, default=DEFAULT_ROUNDS, help="trees to add")
+    parser.add_argument('--learning-rate', type=float, default=DEFAULT_LEARNING_RATE,
+                        help="shrinkage for the added trees")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help="allowed relative increase in holdout RMSE (0.01 = 1%%)")
+    parser.add_argument('--report', default=UPDATE_REPORT_PATH)
+    parser.add_argument('--append-to', metavar='CSV',
+                        help="append the new rows to this history CSV (e.g. laptop.csv) once published")
+    args = parser.parse_args(argv)
+
+    params = {'learning_rate': args.learning_rate}
+    report = run(args.new_data, args.model, args.encoder, args.holdout, args.rounds, args.tolerance, args.report,
+                 args.append_to, params)
+    before, after = report['holdout_before'], report['holdout_after']
+    print(f"Trained {report['rounds_after'] - report['rounds_before']} trees on {report['train_rows']:,} new rows "
+          f"in {report['train_seconds']:.2f}s ({report['dropped_rows']} dropped with unknown labels)")
+    print(f"Holdout RMSE {before['rmse']:,.0f} -> {after['rmse']:,.0f}, R2 {before['r2']:.4f} -> {after['r2']:.4f} "
+          f"on {report['holdout_rows']:,} rows")
+    if not report['published']:
+        print(f"Not published: holdout RMSE got worse by more than {report['tolerance']:.0%}")
+        return 1
+    print(f"Published {args.model}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
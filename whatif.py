@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+
+import latency
+from features import CATEGORICAL_COLUMNS, FEATURE_COLUMNS
+
+# Numeric features are swept over the range seen in laptop.csv
+NUMERIC_RANGES = {'Inches': (11.0, 18.0), 'Weight': (0.7, 3.4), 'Clock_Speed': (0.9, 3.6)}
+NUMERIC_STEPS = 10
+
+# At most this many features vary at once (one chart axis each)
+MAX_VARIED = 2
+
+
+# Values tried for one feature: every option in its vocabulary, or evenly
+# spaced points of its numeric range (whole inches, since Inches is rounded)
+def sweep_values(encoder, column, steps=NUMERIC_STEPS):
+    if column in CATEGORICAL_COLUMNS:
+        return encoder.options(column)
+    low, high = NUMERIC_RANGES[column]
+    if column == 'Inches':
+        return list(np.arange(low, high + 1))
+    return list(np.round(np.linspace(low, high, steps), 2))
+
+
+# Price a configuration with one or two features varied over a grid. The other
+# features stay as in record; each axis is encoded once and the whole grid is scored
+# with a single model.predict call. values maps a varied column to the values
+# to try (default: sweep_values). Returns one row per grid point with the
+# varied columns and 'Predicted_Price'.
+def sweep(model, encoder, record, columns, values=None):
+    if not 1 <= len(columns) <= MAX_VARIED or len(set(columns)) != len(columns):
+        raise ValueError(f"Vary between 1 and {MAX_VARIED} different features")
+    unknown = [column for column in columns if column not in FEATURE_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown features: {', '.join(unknown)}")
+    values = values or {}
+
+    with latency.timer('whatif'):
+        axes = [list(values.get(column) or sweep_values(encoder, column)) for column in columns]
+        # Only the fixed features have to be valid; the varied ones get a known-valid
+        # placeholder, so an invalid value in an axis only leaves its own cells NaN
+        placeholders = {column: sweep_values(encoder, column)[0] for column in columns}
+        base, error = encoder.encode_record({**record, **placeholders})
+        if error:
+            raise ValueError(error)
+
+        # Encode each axis once (not each grid row); positions[i] is the index into
+        # axis i for every grid point, in itertools.product order
+        positions = [index.ravel() for index in np.indices([len(axis) for axis in axes])]
+        features = np.repeat(base, len(positions[0]), axis=0)
+        valid = np.ones(len(features), dtype=bool)
+        grid = {}
+        for column, axis, position in zip(columns, axes, positions):
+            codes, invalid = encoder.encode_values(column, axis)
+            features[:, FEATURE_COLUMNS.index(column)] = codes[position]
+            valid &= ~invalid[position]
+            grid[column] = np.asarray(axis, dtype=object)[position]
+
+        prices = np.full(len(features), np.nan)
+        if valid.any():
+            prices[valid] = model.predict(features[valid])
+        return pd.DataFrame({**grid, 'Predicted_Price': prices})
+
+
+# Two-feature sweep as a table (first feature down, second across), in the
+# order the values were tried
+def as_table(grid):
+    rows, columns = grid.columns[:2]
+    table = grid.pivot(index=rows, columns=columns, values='Predicted_Price')
+    return table.reindex(index=grid[rows].unique(), columns=grid[columns].unique())